@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rollup_cube import AD_KEYS, base_proxy, base_spend
+from schemas import read_typed
+from skill_io import FrameSource
+
+
+SPEND_RULES = ("sum", "max", "priority", "error")
+PROXY_RULES = ("mean", "priority", "error")
+
+
+def _default_ad_sources_cfg() -> Dict[str, Any]:
+    return {
+        "workers": 4,
+        "spend_conflict": "sum",
+        "proxy_conflict": "mean",
+        "sources": [],
+    }
+
+
+def ad_sources_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_ad_sources_cfg()
+    out.update(cfg_run.get("ad_sources", {}) or {})
+    out["sources"] = list(out.get("sources") or [])
+    if out["spend_conflict"] not in SPEND_RULES:
+        raise ValueError(f"ad_sources.spend_conflict must be one of {SPEND_RULES}, got {out['spend_conflict']!r}")
+    if out["proxy_conflict"] not in PROXY_RULES:
+        raise ValueError(f"ad_sources.proxy_conflict must be one of {PROXY_RULES}, got {out['proxy_conflict']!r}")
+    return out
+
+
+def _load(src: Optional[FrameSource], root: Optional[Path], schema: str, renames: Dict[str, str]) -> Optional[pd.DataFrame]:
+    if src is None:
+        return None
+    if isinstance(src, pd.DataFrame):
+        return read_typed(src, schema, renames)
+    path = Path(src)
+    if not path.is_absolute() and root is not None:
+        path = Path(root) / path
+    return read_typed(path, schema, renames) if path.exists() else None
+
+
+def _aggregate_source(source: Dict[str, Any], base_hours: int, root: Optional[Path]) -> Dict[str, Any]:
+    """Reads one source's exports and sums them to base buckets, sorted by (time, entity)."""
+    renames = dict(source.get("columns") or {})
+    prefix = str(source.get("prefix") or "")
+    out: Dict[str, Any] = {"name": str(source.get("name", "source")), "spend": None, "proxy": None, "spend_rows": 0, "proxy_rows": 0}
+
+    spend = _load(source.get("spend"), root, "ad_spend", renames)
+    if spend is not None and not spend.empty:
+        out["spend_rows"] = int(len(spend))
+        out["spend"] = base_spend(spend, base_hours).sort_values(AD_KEYS, ignore_index=True)
+
+    proxy = _load(source.get("proxy"), root, "ad_proxy", renames)
+    if proxy is not None and not proxy.empty:
+        # proxy_clicks -> proxy_<prefix>clicks keeps columns from different platforms apart.
+        proxy = proxy.rename(columns={c: f"proxy_{prefix}{c[len('proxy_'):]}" for c in proxy.columns if c.startswith("proxy_")})
+        out["proxy_rows"] = int(len(proxy))
+        if any(c.startswith("proxy_") for c in proxy.columns):
+            out["proxy"] = base_proxy(proxy, base_hours).sort_values(AD_KEYS, ignore_index=True)
+    return out
+
+
+def merge_join(tables: List[Tuple[str, pd.DataFrame]], rule: str) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Joins per-source tables, each sorted and unique on (time_bucket_start, entity_id), on
+    the union of their keys. Keys are encoded as one sorted int64 code, each source is
+    located in the union by binary search, and its columns are written into preallocated
+    output arrays one source at a time; no wide intermediate frames are built.
+
+    Keys present in more than one source are resolved by `rule` (sources are applied in
+    priority order): sum / mean (both add; proxies are stored as sum and count, so adding
+    gives the pooled mean), max, priority (first source wins), or error.
+    Returns the joined table and the number of conflicting keys per source.
+    """
+    tables = [(name, t) for name, t in tables if t is not None and not t.empty]
+    if not tables:
+        return pd.DataFrame(columns=AD_KEYS), {}
+
+    ns = [t["time_bucket_start"].dt.as_unit("ns").astype("int64").to_numpy() for _, t in tables]
+    times = np.unique(np.concatenate(ns))
+    ents = pd.Index(np.unique(np.concatenate([t["entity_id"].astype(str).to_numpy(dtype=object) for _, t in tables])))
+    n_e = len(ents)
+    codes = [np.searchsorted(times, x).astype(np.int64) * n_e + ents.get_indexer(t["entity_id"].astype(str)) for x, (_, t) in zip(ns, tables)]
+    union = np.unique(np.concatenate(codes))
+
+    columns: List[str] = []
+    for _, t in tables:
+        columns += [c for c in t.columns if c not in AD_KEYS and c not in columns]
+    out = {c: np.zeros(len(union)) for c in columns}
+    filled = {c: np.zeros(len(union), dtype=bool) for c in columns}
+    conflicts: Dict[str, int] = {}
+
+    for (name, t), code in zip(tables, codes):
+        idx = np.searchsorted(union, code)
+        hits = 0
+        for c in t.columns:
+            if c in AD_KEYS:
+                continue
+            v = t[c].to_numpy(dtype=float)
+            seen = filled[c][idx]
+            hits = max(hits, int(seen.sum()))
+            if seen.any() and rule == "error":
+                raise ValueError(f"ad source {name!r} overlaps earlier sources on {int(seen.sum())} keys for {c}")
+            if rule in ("sum", "mean"):
+                out[c][idx] += v
+            elif rule == "max":
+                out[c][idx] = np.where(seen, np.maximum(out[c][idx], v), v)
+            else:
+                out[c][idx[~seen]] = v[~seen]
+            filled[c][idx] = True
+        conflicts[name] = hits
+
+    joined = pd.DataFrame(
+        {"time_bucket_start": pd.to_datetime(times[union // n_e], utc=True), "entity_id": np.asarray(ents)[union % n_e]}
+    )
+    for c in columns:
+        joined[c] = out[c]
+    return joined, conflicts
+
+
+def merge_ad_sources(
+    sources: List[Dict[str, Any]],
+    base_hours: int,
+    spend_conflict: str = "sum",
+    proxy_conflict: str = "mean",
+    workers: int = 4,
+    root: Optional[Path] = None,
+) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame], Dict[str, Any]]:
+    """
+    Aggregates each ad source (spend and/or proxy export, CSV path relative to root or a
+    DataFrame) to base buckets in parallel, then merge-joins them into one spend table and
+    one proxy table in the rollup cube's layout. Sources are ordered by `priority`
+    (lower first; list order by default).
+    Source keys: name, spend, proxy, prefix (inserted after "proxy_"), columns (renames),
+    priority.
+    """
+    ordered = sorted(enumerate(sources), key=lambda x: (float(x[1].get("priority", x[0])), x[0]))
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(ordered) or 1))) as pool:
+        parts = list(pool.map(lambda s: _aggregate_source(s[1], base_hours, root), ordered))
+
+    spend, spend_hits = merge_join([(p["name"], p["spend"]) for p in parts], spend_conflict)
+    proxy, proxy_hits = merge_join([(p["name"], p["proxy"]) for p in parts], proxy_conflict)
+    stats = {
+        "sources": [p["name"] for p in parts],
+        "spend_rows": int(sum(p["spend_rows"] for p in parts)),
+        "proxy_rows": int(sum(p["proxy_rows"] for p in parts)),
+        "spend_conflicts": spend_hits,
+        "proxy_conflicts": proxy_hits,
+    }
+    return (spend if len(spend) else None), (proxy if len(proxy) else None), stats
@@ -1,16 +1,29 @@
 from __future__ import annotations
 
+import heapq
 from typing import Dict, Any, Tuple, List
 
+import numpy as np
+
 from channel_policy import parse_channel_from_entity
+from hierarchy import disaggregate_budget, prev_budget_for
+from response_curve import build_curve_table, marginal, saturation
+
 
+def _default_solver_cfg() -> Dict[str, Any]:
+    return {
+        "curve_tables": False,
+        "table_max_cells": 4_000_000,
+    }
 
-def _sat(b: float, a: float, theta: float) -> float:
-    b = max(0.0, float(b))
-    return (b**a) / (b**a + theta**a + 1e-12)
 
+def solver_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_solver_cfg()
+    out.update(cfg_run.get("solver", {}) or {})
+    return out
 
-def _to_float(v: Any, default: float) -> float:
+
+def to_float(v: Any, default: float) -> float:
     try:
         if v is None:
             return default
@@ -19,18 +32,18 @@ def _to_float(v: Any, default: float) -> float:
         return default
 
 
-def _bounds_for_entity(entity_id: str, constraints_cfg: Dict[str, Any]) -> Tuple[float, float]:
+def bounds_for_entity(entity_id: str, constraints_cfg: Dict[str, Any]) -> Tuple[float, float]:
     default_bounds = constraints_cfg.get("bounds_default", {})
-    min_b = _to_float(default_bounds.get("min", 0.0), 0.0)
+    min_b = to_float(default_bounds.get("min", 0.0), 0.0)
     max_raw = default_bounds.get("max", None)
-    max_b = float("inf") if max_raw is None else _to_float(max_raw, float("inf"))
+    max_b = float("inf") if max_raw is None else to_float(max_raw, float("inf"))
 
     campaign_bounds = constraints_cfg.get("campaign_bounds", {})
     c = campaign_bounds.get(entity_id, {}) if isinstance(campaign_bounds, dict) else {}
     if c:
-        min_b = max(min_b, _to_float(c.get("min", min_b), min_b))
+        min_b = max(min_b, to_float(c.get("min", min_b), min_b))
         cmax_raw = c.get("max", max_b)
-        cmax = float("inf") if cmax_raw is None else _to_float(cmax_raw, max_b)
+        cmax = float("inf") if cmax_raw is None else to_float(cmax_raw, max_b)
         max_b = min(max_b, cmax)
 
     if max_b < min_b:
@@ -38,6 +51,128 @@ def _bounds_for_entity(entity_id: str, constraints_cfg: Dict[str, Any]) -> Tuple
     return min_b, max_b
 
 
+def _step_window(entity_id: str, b_prev: float, step_pct: float, constraints_cfg: Dict[str, Any]) -> Tuple[float, float]:
+    step = step_pct * max(1.0, b_prev)
+    lo_step = max(0.0, b_prev - step)
+    hi_step = b_prev + step
+
+    min_b, max_b = bounds_for_entity(entity_id, constraints_cfg)
+    lo = max(lo_step, min_b)
+    hi = min(hi_step, max_b)
+    if hi < lo:
+        hi = lo
+    return lo, hi
+
+
+def shadow_prices(items: List[Dict[str, Any]], solved: Dict[str, Any], constraints_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Marginal values of the constraints at the final allocation, read off the score
+    gradient m_i = w_i g'(b_i) - 2 lam (b_i - b_prev_i) (score per unit of budget).
+    `solved` holds the solver's arrays per item (b, lo, hi, hi_free, prev, w, a, theta,
+    gated, ch_ids) plus ch_total, caps, lam and tiny.
+
+    - budget.next_unit: gain of one more unit (best item that can still rise);
+      budget.last_unit: loss of one unit less (cheapest item that can still fall).
+    - channel_caps: gain of one more unit of cap for each full channel, funded by the
+      cheapest item outside it.
+    - campaign_limits: gain of relaxing a campaign's upper (or lower) limit by one unit,
+      with the limit that binds: campaign_bounds, step_limit or uncertainty_gate.
+    Only strictly positive shadow prices are listed.
+    """
+    b, lo, hi, hi_free, gated = solved["b"], solved["lo"], solved["hi"], solved["hi_free"], solved["gated"]
+    caps, ch_total, tiny = solved["caps"], solved["ch_total"], float(solved["tiny"])
+    m = solved["w"] * marginal(b, solved["a"], solved["theta"]) - 2.0 * float(solved["lam"]) * (b - solved["prev"])
+    ch = np.array(solved["ch_ids"], dtype=object)
+    full = {c for c, cap in caps.items() if c in ch_total and ch_total[c] >= cap - tiny}
+    room_up = (hi - b > tiny) & ~np.isin(ch, list(full))
+    room_down = b - lo > tiny
+
+    def best(mask: np.ndarray, fn) -> Tuple[float | None, int]:
+        if not mask.any():
+            return None, -1
+        idx = np.flatnonzero(mask)
+        k = idx[fn(m[idx])]
+        return float(m[k]), int(k)
+
+    next_unit, i_next = best(room_up, np.argmax)
+    last_unit, _ = best(room_down, np.argmin)
+
+    cap_prices: Dict[str, float] = {}
+    for c in sorted(full):
+        up_c, _ = best((ch == c) & (hi - b > tiny), np.argmax)
+        down_o, _ = best(room_down & (ch != c), np.argmin)
+        if up_c is not None and down_o is not None and up_c - down_o > 0:
+            cap_prices[c] = up_c - down_o
+
+    limits: List[Dict[str, Any]] = []
+    for idx, it in enumerate(items):
+        if it["members"]:
+            bounds = [bounds_for_entity(mem, constraints_cfg) for mem in it["members"]]
+            min_b, max_b = sum(x[0] for x in bounds), sum(x[1] for x in bounds)
+        else:
+            min_b, max_b = bounds_for_entity(it["entity_id"], constraints_cfg)
+        if hi[idx] - b[idx] <= tiny and last_unit is not None and m[idx] - last_unit > 0:
+            if gated[idx] and hi[idx] < hi_free[idx] - tiny:
+                kind = "uncertainty_gate"
+            else:
+                kind = "campaign_bounds" if abs(hi[idx] - max_b) <= tiny else "step_limit"
+            limits.append({"entity_id": it["entity_id"], "limit": "upper", "constraint": kind, "shadow_price": float(m[idx] - last_unit)})
+        elif b[idx] - lo[idx] <= tiny and next_unit is not None and next_unit - m[idx] > 0:
+            kind = "campaign_bounds" if abs(lo[idx] - min_b) <= tiny else "step_limit"
+            limits.append({"entity_id": it["entity_id"], "limit": "lower", "constraint": kind, "shadow_price": float(next_unit - m[idx])})
+    limits.sort(key=lambda r: -r["shadow_price"])
+
+    return {
+        "units": "score per unit of budget",
+        "budget": {
+            "next_unit": next_unit,
+            "last_unit": last_unit,
+            "next_unit_entity": items[i_next]["entity_id"] if i_next >= 0 else None,
+        },
+        "channel_caps": cap_prices,
+        "campaign_limits": limits,
+    }
+
+
+def _shadow_line(shadow: Dict[str, Any]) -> str:
+    nxt = shadow["budget"]["next_unit"]
+    line = "- Next unit of budget: " + ("no room left" if nxt is None else f"{nxt:.4g} score")
+    if shadow["channel_caps"]:
+        c, v = max(shadow["channel_caps"].items(), key=lambda kv: kv[1])
+        line += f"; costliest channel cap: {c} ({v:.4g} per unit)"
+    if shadow["campaign_limits"]:
+        top = shadow["campaign_limits"][0]
+        line += f"; costliest campaign limit: {top['entity_id']} {top['constraint']} ({top['shadow_price']:.4g} per unit)"
+    return line
+
+
+def explain_plan(plan: Dict[str, Any]) -> str:
+    """The allocation explanation for a solved plan, from its totals, solver block and shadow prices."""
+    totals, solver = plan["totals"], plan["solver"]
+    B = float(totals["budget_total"])
+    churn_budget = solver.get("churn_budget")
+    lines = [
+        "# Allocation explanation",
+        f"- Total budget target: {B:.2f}",
+        f"- Allocated: {float(totals['budget_allocated']):.2f}",
+        f"- Budget gap: {float(totals['budget_gap']):.2f}",
+        f"- Churn: {float(totals['churn']):.4f}",
+        "- Objective: GA-outcome incremental uplift (proxies secondary; gated)",
+        f"- Churn budget: {float(solver['churn_used']):.2f} of {float(churn_budget):.2f} moved" + (" (binding)" if solver["churn_bound"] else "")
+        if churn_budget is not None
+        else "- Churn budget: unlimited",
+        "- Controls: uncertainty gate + step limit + churn budget + inertia + bounds/caps (enforced in the solver)",
+        _shadow_line(plan["shadow_prices"]),
+    ]
+    traj = plan.get("trajectory")
+    if traj:
+        lines.append(
+            f"- Glide path: {traj['periods']} periods (see trajectory in allocation_plan.json);"
+            f" period 1 planned jointly with them (moved {float(traj.get('period1_shift', 0.0)):.2f} from the one-period solve)"
+        )
+    return "\n".join(lines)
+
+
 def solve_allocation(
     model_state: Dict[str, Any],
     prev_allocation: Dict[str, Any],
@@ -52,6 +187,8 @@ def solve_allocation(
     alpha = float(cfg_run["alpha_gate"])
     gamma = float(cfg_run["gamma_risk"])
     lam_inertia = float(cfg_run["lambda_inertia"])
+    # Without a churn limit the swaps are bounded only by the step windows.
+    churn_limit = to_float(cfg_run.get("daily_churn_limit"), float("inf"))
 
     V_rev = float(cfg_value["default_value_per_revenue_eur"])
     V_pur = float(cfg_value["default_value_per_purchase"])
@@ -69,33 +206,38 @@ def solve_allocation(
         return plan, explain
 
     # Cold-start stabilization: if no previous allocation, bootstrap baseline prior budgets.
-    known_prev = sum(float(prev_map.get(e, 0.0)) for e in ent_ids)
+    known_prev = sum(prev_budget_for(e, ents[e], prev_map) for e in ent_ids)
     if known_prev <= 1e-9:
         w = {e: max(1e-6, float(ents[e].get("u_mean", 0.0))) + 1.0 for e in ent_ids}
         w_sum = sum(w.values())
         for e in ent_ids:
-            prev_map[e] = B * w[e] / max(1e-9, w_sum)
+            b0 = B * w[e] / max(1e-9, w_sum)
+            members = ents[e].get("members")
+            if members:
+                for m, share in members.items():
+                    prev_map[m] = b0 * float(share)
+            else:
+                prev_map[e] = b0
 
     channel_caps = constraints_cfg.get("channel_caps", {})
-    channel_cap_map = {str(k): _to_float(v, float("inf")) for k, v in channel_caps.items()} if isinstance(channel_caps, dict) else {}
+    channel_cap_map = {str(k): to_float(v, float("inf")) for k, v in channel_caps.items()} if isinstance(channel_caps, dict) else {}
 
     items: List[Dict[str, Any]] = []
     for ent_id, s in ents.items():
-        b_prev = float(prev_map.get(ent_id, 0.0))
+        b_prev = prev_budget_for(ent_id, s, prev_map)
         curve = s["curve"]
         a = float(curve["a"])
         theta = float(curve["theta"])
         V = V_rev if s["outcome_col"] == "revenue" else V_pur
 
-        step = step_pct * max(1.0, b_prev)
-        lo_step = max(0.0, b_prev - step)
-        hi_step = b_prev + step
-
-        min_b, max_b = _bounds_for_entity(ent_id, constraints_cfg)
-        lo = max(lo_step, min_b)
-        hi = min(hi_step, max_b)
-        if hi < lo:
-            hi = lo
+        members = s.get("members") or {}
+        member_windows = {m: _step_window(m, float(prev_map.get(m, 0.0)), step_pct, constraints_cfg) for m in members}
+        if members:
+            # A parent can move exactly as far as its members' windows allow in aggregate.
+            lo = float(sum(w[0] for w in member_windows.values()))
+            hi = float(sum(w[1] for w in member_windows.values()))
+        else:
+            lo, hi = _step_window(ent_id, b_prev, step_pct, constraints_cfg)
 
         items.append(
             {
@@ -111,91 +253,251 @@ def solve_allocation(
                 "a": a,
                 "theta": theta,
                 "V": V,
+                "members": members,
+                "member_windows": member_windows,
             }
         )
 
-    remaining = B - sum(i["b"] for i in items)
-    remaining = max(0.0, remaining)
+    n_items = len(items)
+    lo_arr = np.array([i["lo"] for i in items])
+    hi_arr = np.array([i["hi"] for i in items])
+    prev_arr = np.array([i["b_prev"] for i in items])
+    a_arr = np.array([i["a"] for i in items])
+    theta_arr = np.array([i["theta"] for i in items])
+    # Score(b) = w * g(b) - lam * (b - b_prev)^2 with w = V * (u_mean - gamma * u_sd).
+    w_arr = np.array([i["V"] * (i["u_mean"] - gamma * i["u_sd"]) for i in items])
+
+    # Gated entities may hold or shrink but never rise above b_prev.
+    gated = np.array([i["p_ok"] < (1.0 - alpha) for i in items], dtype=bool)
+    hi_free = hi_arr.copy()
+    hi_arr = np.where(gated, np.maximum(lo_arr, np.minimum(hi_arr, prev_arr)), hi_arr)
+
+    # Start from "hold": every move away from b_prev then costs churn.
+    b = np.clip(prev_arr, lo_arr, hi_arr)
     quantum = max(1.0, B / 2000.0)
-
-    def score(i: Dict[str, Any], b: float) -> float:
-        inc = i["V"] * i["u_mean"] * _sat(b, i["a"], i["theta"])
-        unc = i["V"] * i["u_sd"] * _sat(b, i["a"], i["theta"])
-        inertia = lam_inertia * (b - i["b_prev"]) ** 2
-        return inc - gamma * unc - inertia
-
-    def channel_budget_map() -> Dict[str, float]:
-        m: Dict[str, float] = {}
-        for it in items:
-            ch = it["channel_id"]
-            m[ch] = m.get(ch, 0.0) + float(it["b"])
-        return m
-
-    def can_add(it: Dict[str, Any], add: float) -> bool:
-        if it["b"] + add > it["hi"] + 1e-9:
-            return False
-        cap = channel_cap_map.get(it["channel_id"], float("inf"))
-        if cap != float("inf"):
-            cur = channel_budget_map().get(it["channel_id"], 0.0)
-            if cur + add > cap + 1e-9:
-                return False
-        return True
-
-    while remaining > 1e-9:
-        best_idx = None
-        best_gain = -1e18
-        for idx, it in enumerate(items):
-            if not can_add(it, quantum):
+    tiny = 1e-9 * max(1.0, B)
+
+    s_cfg = solver_cfg(cfg_run)
+    table = None
+    grid_start = b - quantum * np.ceil((b - lo_arr) / quantum)
+    if bool(s_cfg["curve_tables"]):
+        table = build_curve_table(a_arr, theta_arr, grid_start, hi_arr - grid_start, quantum, int(s_cfg["table_max_cells"]))
+
+    def g_at(idx: int, x: float) -> float:
+        if table is not None:
+            k = (x - grid_start[idx]) / quantum
+            kr = int(round(k))
+            if abs(k - kr) < 1e-9:
+                return table.at(idx, kr)
+        return saturation(x, a_arr[idx], theta_arr[idx])
+
+    def score_delta(idx: int, x_to: float) -> float:
+        x = b[idx]
+        inertia = lam_inertia * ((x_to - prev_arr[idx]) ** 2 - (x - prev_arr[idx]) ** 2)
+        return float(w_arr[idx] * (g_at(idx, x_to) - g_at(idx, x)) - inertia)
+
+    def churn_delta(idx: int, x_to: float) -> float:
+        return abs(x_to - prev_arr[idx]) - abs(b[idx] - prev_arr[idx])
+
+    ch_ids = [i["channel_id"] for i in items]
+    ch_total: Dict[str, float] = {}
+    for idx, ch in enumerate(ch_ids):
+        ch_total[ch] = ch_total.get(ch, 0.0) + float(b[idx])
+
+    def up_room(idx: int) -> float:
+        cap = channel_cap_map.get(ch_ids[idx], float("inf"))
+        return max(0.0, min(hi_arr[idx] - b[idx], cap - ch_total[ch_ids[idx]]))
+
+    def up_step(idx: int) -> float:
+        return min(quantum, up_room(idx))
+
+    def down_step(idx: int) -> float:
+        return min(quantum, max(0.0, b[idx] - lo_arr[idx]))
+
+    def up_key(idx: int) -> float:
+        s = up_step(idx)
+        return score_delta(idx, b[idx] + s) / s if s > tiny else -np.inf
+
+    def down_key(idx: int) -> float:
+        s = down_step(idx)
+        return -score_delta(idx, b[idx] - s) / s if s > tiny else np.inf
+
+    # Lazy heaps keyed per unit of budget moved. Entries are re-scored when popped; an entry
+    # whose key moved (the item changed, or its channel cap tightened) is pushed back.
+    up_heap: List[Tuple[float, int]] = []
+    down_heap: List[Tuple[float, int]] = []
+    slack_heap: List[Tuple[float, int]] = []
+
+    def push(idx: int) -> None:
+        heapq.heappush(up_heap, (-up_key(idx), idx))
+        heapq.heappush(down_heap, (down_key(idx), idx))
+        heapq.heappush(slack_heap, (-up_room(idx), idx))
+
+    def top(heap: List[Tuple[float, int]], key, skip: int = -1) -> Tuple[float, int] | None:
+        held = []
+        found = None
+        while heap:
+            k, idx = heap[0]
+            cur = key(idx)
+            if not np.isfinite(cur):
+                heapq.heappop(heap)
                 continue
-            g = score(it, it["b"] + quantum) - score(it, it["b"])
-            if g > best_gain:
-                best_gain, best_idx = g, idx
-
-        if best_idx is None:
+            if abs(cur - k) > 1e-12 * max(1.0, abs(k)):
+                heapq.heapreplace(heap, (cur, idx))
+                continue
+            if idx == skip:
+                held.append(heapq.heappop(heap))
+                continue
+            found = (k, idx)
             break
+        for e in held:
+            heapq.heappush(heap, e)
+        return found
 
-        # If no positive gain remains, we still force-fill to meet total budget within constraints.
-        if best_gain <= 0:
-            best_idx = None
-            best_slack = -1.0
-            for idx, it in enumerate(items):
-                if not can_add(it, quantum):
-                    continue
-                slack = it["hi"] - it["b"]
-                if slack > best_slack:
-                    best_slack, best_idx = slack, idx
-            if best_idx is None:
-                break
+    for idx in range(n_items):
+        push(idx)
+
+    def move(idx: int, x_to: float) -> None:
+        ch_total[ch_ids[idx]] += x_to - b[idx]
+        b[idx] = x_to
+        push(idx)
 
-        items[best_idx]["b"] += quantum
-        remaining -= quantum
+    churn_den = 0.0
+    for it in items:
+        if it["members"]:
+            churn_den += sum(max(1e-9, float(prev_map.get(m, 0.0))) for m in it["members"])
+        else:
+            churn_den += max(1e-9, float(it["b_prev"]))
+    # A hair under the limit so rounding in the reported churn never trips verification.
+    churn_budget = churn_limit * churn_den * (1.0 - 1e-6)
+    churn_used = float(np.abs(b - prev_arr).sum())
+
+    iterations = 0
+    max_iterations = 50 * n_items + 20000
+    # Phase 1: meet the budget total. It takes precedence over the churn budget, so the
+    # cheapest moves are taken even when they are negative-value.
+    while iterations < max_iterations:
+        gap = B - float(b.sum())
+        if abs(gap) <= tiny:
+            break
+        iterations += 1
+        if gap > 0:
+            best = top(up_heap, lambda i: -up_key(i))
+            if best is not None and -best[0] <= 0:
+                # No positive gain remains: force-fill the item with the most room.
+                fill = top(slack_heap, lambda i: -up_room(i) if up_room(i) > tiny else np.inf)
+                best = fill if fill is not None else best
+            if best is None:
+                break
+            idx = best[1]
+            x_to = b[idx] + min(up_step(idx), gap)
+        else:
+            best = top(down_heap, down_key)
+            if best is None:
+                break
+            idx = best[1]
+            x_to = b[idx] - min(down_step(idx), -gap)
+        churn_used += churn_delta(idx, x_to)
+        move(idx, x_to)
+
+    # Phase 2: budget-neutral swaps (one unit from the least valuable to the most valuable
+    # item) while they gain value and the churn they add fits the remaining churn budget.
+    churn_bound = False
+    while iterations < max_iterations:
+        up = top(up_heap, lambda i: -up_key(i))
+        if up is None or -up[0] <= 0:
+            break
+        i = up[1]
+        down = top(down_heap, down_key, skip=i)
+        if down is None:
+            break
+        j = down[1]
+        s = min(up_step(i), down_step(j))
+        dc = churn_delta(i, b[i] + s) + churn_delta(j, b[j] - s)
+        if dc > churn_budget - churn_used:
+            # Shrink the swap to the churn that is left (both legs add churn linearly here).
+            s *= max(0.0, churn_budget - churn_used) / dc
+            churn_bound = True
+            if s <= tiny:
+                break
+            dc = churn_delta(i, b[i] + s) + churn_delta(j, b[j] - s)
+        if score_delta(i, b[i] + s) + score_delta(j, b[j] - s) <= 1e-12:
+            break
+        iterations += 1
+        churn_used += dc
+        move(i, b[i] + s)
+        move(j, b[j] - s)
+
+    solved = {
+        "b": b,
+        "lo": lo_arr,
+        "hi": hi_arr,
+        "hi_free": hi_free,
+        "prev": prev_arr,
+        "w": w_arr,
+        "a": a_arr,
+        "theta": theta_arr,
+        "gated": gated,
+        "ch_ids": ch_ids,
+        "ch_total": ch_total,
+        "caps": channel_cap_map,
+        "lam": lam_inertia,
+        "tiny": tiny,
+    }
+    shadow = shadow_prices(items, solved, constraints_cfg)
+    roi = np.array([i["V"] * i["u_mean"] for i in items]) * marginal(b, a_arr, theta_arr)
+
+    for idx, it in enumerate(items):
+        it["b"] = float(b[idx])
+        it["marginal_roi"] = float(roi[idx])
+        # Label the gate only where it held back an increase the solver would have made.
+        up = min(quantum, hi_free[idx] - b[idx])
+        it["gate_binding"] = bool(
+            gated[idx] and b[idx] >= hi_arr[idx] - tiny and up > tiny and score_delta(idx, b[idx] + up) > 0
+        )
 
     campaigns = []
     churn_num = 0.0
     churn_den = 0.0
+    # Churn the solver left unused; pools spend it moving their split toward smoothed shares.
+    churn_left = max(0.0, churn_budget - churn_used)
     for it in items:
         b = float(it["b"])
         b_prev = float(it["b_prev"])
-        bindings: List[str] = []
-        if b > b_prev and it["p_ok"] < (1.0 - alpha):
-            b = b_prev
-            bindings.append("uncertainty_gate")
-
-        churn_num += abs(b - b_prev)
-        churn_den += max(1e-9, b_prev)
-
-        campaigns.append(
-            {
-                "entity_id": it["entity_id"],
-                "recommended_budget": b,
-                "previous_budget": b_prev,
-                "delta_abs": b - b_prev,
-                "delta_pct": (b - b_prev) / max(1e-9, b_prev),
-                "gate_status": "hold" if abs(b - b_prev) < 1e-9 else ("increase" if b > b_prev else "decrease"),
-                "binding_constraints": bindings,
+        bindings: List[str] = ["uncertainty_gate"] if it["gate_binding"] else []
+
+        rows = [(it["entity_id"], b, b_prev, bindings)]
+        if it["members"]:
+            split = disaggregate_budget(
+                b,
+                it["members"],
+                prev_map,
+                {m: w[0] for m, w in it["member_windows"].items()},
+                {m: w[1] for m, w in it["member_windows"].items()},
+                max_shift=churn_left,
+            )
+            extra = sum(abs(split[m] - float(prev_map.get(m, 0.0))) for m in it["members"]) - abs(b - b_prev)
+            churn_left = max(0.0, churn_left - max(0.0, extra))
+            rows = [(m, split[m], float(prev_map.get(m, 0.0)), bindings + ["parent_pool"]) for m in it["members"]]
+
+        for ent_id, b_row, prev_row, row_bindings in rows:
+            churn_num += abs(b_row - prev_row)
+            churn_den += max(1e-9, prev_row)
+
+            row = {
+                "entity_id": ent_id,
+                "recommended_budget": b_row,
+                "previous_budget": prev_row,
+                "delta_abs": b_row - prev_row,
+                "delta_pct": (b_row - prev_row) / max(1e-9, prev_row),
+                "gate_status": "hold" if abs(b_row - prev_row) < 1e-9 else ("increase" if b_row > prev_row else "decrease"),
+                "binding_constraints": row_bindings,
                 "posterior": {"u_mean": it["u_mean"], "u_sd": it["u_sd"], "p_u_gt_u_min": it["p_ok"]},
+                "marginal_roi": it["marginal_roi"],
             }
-        )
+            if it["members"]:
+                row["parent_id"] = it["entity_id"]
+            campaigns.append(row)
 
     total_alloc = sum(float(c["recommended_budget"]) for c in campaigns)
     churn = float(churn_num / max(1e-9, churn_den))
@@ -208,17 +510,15 @@ def solve_allocation(
             "churn": churn,
         },
         "campaigns": campaigns,
+        "shadow_prices": shadow,
+        "solver": {
+            "iterations": iterations,
+            "quantum": quantum,
+            "curve_table": table is not None,
+            "churn_budget": churn_budget if np.isfinite(churn_budget) else None,
+            "churn_used": float(churn_used),
+            "churn_bound": churn_bound,
+        },
     }
 
-    explain = "\n".join(
-        [
-            "# Allocation explanation",
-            f"- Total budget target: {B:.2f}",
-            f"- Allocated: {total_alloc:.2f}",
-            f"- Budget gap: {B - total_alloc:.2f}",
-            f"- Churn: {churn:.4f}",
-            "- Objective: GA-outcome incremental uplift (proxies secondary; gated)",
-            "- Controls: uncertainty gate + step limit + inertia + bounds/caps",
-        ]
-    )
-    return plan, explain
+    return plan, explain_plan(plan)
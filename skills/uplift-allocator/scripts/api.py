@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import copy
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from skill_io import FrameSource, read_yaml, read_json, read_frame, write_json, write_text
+from build_unified_view import build_rollup_cube
+from screening import screen_unified, screening_cfg
+from proxy_eval import evaluate_proxies
+from model_update import update_model_state
+from allocate import explain_plan, solve_allocation
+from planner import plan_trajectory, planner_cfg
+from verify import verify_and_challenge
+from suggest_ga_only_plan import suggest_ga_only_plan
+from optimize_budget import optimize_budget_for_target
+from channel_policy import filter_model_state_paid
+from history_store import HistoryStore, history_cfg
+from state_tiers import ColdStateStore, active_entities, expire, revive_priors, split_dormant, state_tiers_cfg
+from ga_fetch import fetch_ga_frame
+from ad_sources import ad_sources_cfg
+from plan_output import read_plan, write_plan_outputs
+from rollup_cube import RollupCube, horizon_hours
+from run_metrics import RunMetrics, no_stage
+
+
+DEFAULT_ROOT = Path(__file__).resolve().parents[1]
+
+
+class UpliftAllocator:
+    """
+    In-process entry point for the allocator pipeline.
+
+    All intermediate results (unified view, proxy catalog, model state, plan, alerts)
+    are kept on the instance and reused across calls. Nothing is read from or written
+    to disk unless a path is needed to satisfy a missing input, `load_artifacts()` is
+    called, or a stage is invoked with `write=True`.
+
+    Usage (with the skill's scripts directory on sys.path):
+        from api import UpliftAllocator
+        ua = UpliftAllocator(root="/path/to/skills/uplift-allocator")
+        ua.build(ga=ga_df, spend=spend_df, proxy=proxy_df)
+        ua.update_model()
+        plan, explain, alerts = ua.allocate(budget=25000.0)
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        cfg_dir: Optional[Path] = None,
+        data_dir: Optional[Path] = None,
+        art_dir: Optional[Path] = None,
+        cfg_run: Optional[Dict[str, Any]] = None,
+        cfg_constraints: Optional[Dict[str, Any]] = None,
+        cfg_value: Optional[Dict[str, Any]] = None,
+        cfg_entities: Optional[Dict[str, Any]] = None,
+        metrics: Optional[RunMetrics] = None,
+    ) -> None:
+        self.root = Path(root) if root is not None else DEFAULT_ROOT
+        self.cfg_dir = Path(cfg_dir) if cfg_dir is not None else self.root / "config"
+        self.data_dir = Path(data_dir) if data_dir is not None else self.root / "data"
+        self.art_dir = Path(art_dir) if art_dir is not None else self.root / "artifacts"
+
+        self._cfg: Dict[str, Optional[Dict[str, Any]]] = {
+            "run": cfg_run,
+            "constraints": cfg_constraints,
+            "value": cfg_value,
+            "entities": cfg_entities,
+        }
+
+        self.cube: Optional[RollupCube] = None
+        self.unified: Optional[pd.DataFrame] = None
+        # The view the later stages read after screen(); the unified view stays as built.
+        self.screened: Optional[pd.DataFrame] = None
+        self.screening: Optional[Dict[str, Any]] = None
+        self.proxy_catalog: Optional[Dict[str, Any]] = None
+        self.model_state: Optional[Dict[str, Any]] = None
+        # Dormant entities moved out of model_state (state_tiers); the persisted cold store
+        # is consulted too once load_artifacts() has been called.
+        self.cold_state: Dict[str, Dict[str, Any]] = {}
+        self._cold_on_disk = False
+        self.fit_diagnostics: Optional[Dict[str, Any]] = None
+        self.allocation_plan: Optional[Dict[str, Any]] = None
+        self.alerts: Optional[Dict[str, Any]] = None
+        self.metrics = metrics
+
+    def _stage(self, name: str):
+        return self.metrics.stage(name) if self.metrics is not None else no_stage(name)
+
+    # ---- configuration -------------------------------------------------
+
+    def _config(self, name: str) -> Dict[str, Any]:
+        if self._cfg[name] is None:
+            self._cfg[name] = read_yaml(self.cfg_dir / f"{name}.yaml") or {}
+        return self._cfg[name]  # type: ignore[return-value]
+
+    @property
+    def cfg_run(self) -> Dict[str, Any]:
+        return self._config("run")
+
+    @property
+    def cfg_constraints(self) -> Dict[str, Any]:
+        return self._config("constraints")
+
+    @property
+    def cfg_value(self) -> Dict[str, Any]:
+        return self._config("value")
+
+    @property
+    def cfg_entities(self) -> Dict[str, Any]:
+        return self._config("entities")
+
+    # ---- artifact paths ------------------------------------------------
+
+    @property
+    def paths(self) -> Dict[str, Path]:
+        return {
+            "unified": self.art_dir / "unified_view.csv",
+            "screened": self.art_dir / "screened_view.csv",
+            "cube": self.art_dir / "rollup_cube.pkl",
+            "screening": self.art_dir / "screening_report.json",
+            "history": self.art_dir / str(history_cfg(self.cfg_run)["path"]),
+            "cold_state": self.art_dir / str(state_tiers_cfg(self.cfg_run)["path"]),
+            "proxies": self.art_dir / "proxies_catalog.json",
+            "proxy_report": self.art_dir / "proxy_report.md",
+            "state": self.art_dir / "model_state.json",
+            "fit_diagnostics": self.art_dir / "fit_diagnostics.json",
+            "allocation": self.art_dir / "allocation_plan.json",
+            "allocation_ndjson": self.art_dir / "allocation_plan.ndjson",
+            "allocation_delta": self.art_dir / "allocation_delta.json",
+            "explanation": self.art_dir / "allocation_explanations.md",
+            "alerts": self.art_dir / "alerts.json",
+            "optimal_budget": self.art_dir / "optimal_budget_range.json",
+            "optimal_budget_explanation": self.art_dir / "optimal_budget_explanations.md",
+            "run_metrics": self.art_dir / "run_metrics.json",
+            "run_metrics_history": self.art_dir / "run_metrics_history.jsonl",
+            "profiles": self.art_dir / "profiles",
+        }
+
+    def load_artifacts(self) -> "UpliftAllocator":
+        """
+        Loads previously persisted screening report, proxy catalog, model state and allocation plan.
+        The unified (or screened) view is loaded lazily from art_dir only if a stage needs it
+        before build().
+        """
+        p = self.paths
+        self.screening = read_json(p["screening"], default=None)
+        self._cold_on_disk = True
+        self.proxy_catalog = read_json(p["proxies"], default={})
+        self.model_state = read_json(p["state"], default={})
+        self.allocation_plan = read_plan(p["allocation"], p["allocation_ndjson"])
+        return self
+
+    def _unified_input(self) -> pd.DataFrame:
+        if self.unified is None:
+            self.unified = read_frame(self.paths["unified"], "unified")
+        return self.unified
+
+    def _view_input(self) -> pd.DataFrame:
+        """The screened view when screen() produced one (in memory or persisted), else the unified view."""
+        if self.screened is None and self.unified is None and self.paths["screened"].exists():
+            self.screened = read_frame(self.paths["screened"], "unified")
+        return self.screened if self.screened is not None else self._unified_input()
+
+    def _cube_input(self) -> Optional[RollupCube]:
+        if self.cube is None and self.paths["cube"].exists():
+            self.cube = RollupCube.load(self.paths["cube"])
+        return self.cube
+
+    def view(self, horizon: str = "12h", start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """
+        Unified view at any horizon ("12h", "24h", "1w", ...) from the rollup cube kept by
+        build() (or persisted by build(write=True)); raw exports are not read again.
+        """
+        cube = self._cube_input()
+        if cube is None:
+            raise ValueError("No rollup cube available; run build() first.")
+        return cube.view(horizon_hours(horizon), start, end, self.cfg_run)
+
+    # ---- stages ----------------------------------------------------------
+
+    def fetch_ga(self, start: Optional[str] = None, end: Optional[str] = None, base_url: Optional[str] = None) -> pd.DataFrame:
+        """
+        Pulls the GA report for [start, end) from the connector (run.yaml `ga_fetch`), pages
+        fetched concurrently and summed into base buckets as they arrive. The result is a
+        GA export frame to pass to build(ga=...).
+        """
+        with self._stage("fetch") as rec:
+            ga, stats = fetch_ga_frame(self.cfg_run, start, end, base_url)
+            rec.update({k: stats[k] for k in ("pages", "requests", "retries", "throttled", "max_in_flight")})
+            rec["rows_in"] = int(stats["rows"])
+            rec["rows_out"] = int(stats["rows_out"])
+        return ga
+
+    def build(
+        self,
+        ga: Optional[FrameSource] = None,
+        spend: Optional[FrameSource] = None,
+        proxy: Optional[FrameSource] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        write: bool = False,
+        incremental: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Builds the unified view at cadence_hours via the rollup cube. Inputs default to the
+        example exports under data_dir only when no GA input is given. With incremental=True
+        the exports are ingested into the existing cube (in memory or persisted), replacing
+        the buckets they cover, instead of starting a new one.
+        Ad sources listed in run.yaml `ad_sources` (paths relative to root) are merged in
+        alongside any spend/proxy given here.
+        """
+        sources = ad_sources_cfg(self.cfg_run)["sources"]
+        if ga is None:
+            ga = self.data_dir / "ga" / "ga_export_example.csv"
+            if not sources:
+                spend = spend if spend is not None else self.data_dir / "ad" / "spend_example.csv"
+                proxy = proxy if proxy is not None else self.data_dir / "ad" / "proxy_example.csv"
+        with self._stage("build") as rec:
+            cube = self._cube_input() if incremental else None
+            rows_before = sum(cube.input_rows.values()) if cube is not None else 0
+            self.cube = build_rollup_cube(ga, spend, proxy, self.cfg_run, cube, sources=sources, root=self.root)
+            self.unified = self.cube.view(int(self.cfg_run.get("cadence_hours", 12)), start, end, self.cfg_run)
+            self.screened = None
+            self.screening = None
+            if write:
+                out = self.paths["unified"]
+                out.parent.mkdir(parents=True, exist_ok=True)
+                self.unified.to_csv(out, index=False)
+                self.cube.save(self.paths["cube"])
+                # The screened view and its report described the previous view.
+                self.paths["screened"].unlink(missing_ok=True)
+                self.paths["screening"].unlink(missing_ok=True)
+            # The cube's input_rows count every ingest; the stage reports this one.
+            rec["rows_in"] = int(sum(self.cube.input_rows.values()) - rows_before)
+            rec["rows_out"] = int(len(self.unified))
+            rec["entities_out"] = int(self.unified["entity_id"].nunique())
+            if sources:
+                rec["ad_sources"] = self.cube.source_stats
+        return self.unified
+
+    def screen(self, write: bool = False) -> Dict[str, Any]:
+        """
+        Screens the unified view for spend/outcome spikes, tracking outages and duplicated
+        exports (run.yaml `screening`). The later stages read the screened view (written to
+        screened_view.csv); with action "mask" the flagged rows are dropped from it. The
+        unified view and the rollup cube keep the raw buckets.
+        """
+        unified = self._unified_input()
+        with self._stage("screen") as rec:
+            screened, report = screen_unified(unified, self.cfg_run)
+            self.screened = screened
+            self.screening = report
+            if write:
+                write_json(self.paths["screening"], report)
+                screened.to_csv(self.paths["screened"], index=False)
+            rec["rows_in"] = int(len(unified))
+            rec["rows_out"] = int(len(screened))
+            rec["rows_flagged"] = int(report["rows_flagged"])
+        return report
+
+    def evaluate_proxies(self, write: bool = False) -> Tuple[Dict[str, Any], str]:
+        prior = self.proxy_catalog if self.proxy_catalog is not None else {}
+        unified = self._view_input()
+        with self._stage("proxies") as rec:
+            catalog, report = evaluate_proxies(unified, prior, self.cfg_run)
+            self.proxy_catalog = catalog
+            if write:
+                write_json(self.paths["proxies"], catalog)
+                write_text(self.paths["proxy_report"], report)
+            rec["rows_in"] = int(len(unified))
+            rec["proxies_out"] = int(len(catalog))
+        return catalog, report
+
+    def _cold_lookup(self, entity_ids) -> Dict[str, Dict[str, Any]]:
+        found = {e: self.cold_state[e] for e in entity_ids if e in self.cold_state}
+        rest = [e for e in entity_ids if e not in found]
+        if rest and self._cold_on_disk and self.paths["cold_state"].exists():
+            with ColdStateStore.from_cfg(self.art_dir, self.cfg_run) as store:
+                found.update(store.get(rest))
+        return found
+
+    def update_model(self, write: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Updates posteriors from the unified view. With run.yaml `state_tiers`, model_state
+        keeps only recently active entities; dormant ones go to cold storage (in memory,
+        and artifacts/cold_state.sqlite with write=True) and come back as priors when they
+        are active in the view again. An entity still dormant keeps the record it went cold
+        with.
+        """
+        catalog = self.proxy_catalog if self.proxy_catalog is not None else {}
+        prev = self.model_state if self.model_state is not None else {}
+        unified = self._view_input()
+        tiers = bool(state_tiers_cfg(self.cfg_run)["enabled"])
+        with self._stage("model") as rec:
+            prev_in, revived = prev, {}
+            if tiers and not unified.empty:
+                hot = prev.get("entities", {})
+                revived = self._cold_lookup([e for e in active_entities(unified, self.cfg_run) if e not in hot])
+                if revived:
+                    prev_in = dict(prev, entities={**revive_priors(revived, self.cfg_run), **hot})
+            state, diag = update_model_state(unified, prev_in, catalog, self.cfg_run)
+            if tiers:
+                n_modeled = len(state.get("entities", {}))
+                state, dormant = split_dormant(state, prev, self.cfg_run)
+                # An entity that stayed dormant was refit without its prior; it keeps the
+                # record it went cold with.
+                hot_before = prev.get("entities", {})
+                kept = self._cold_lookup([e for e in dormant if e not in hot_before and e not in revived])
+                now = state.get("updated_at") or prev.get("updated_at")
+                cold = {e: r for e, r in self.cold_state.items() if e not in state["entities"]}
+                cold.update(dormant)
+                cold.update(kept)
+                self.cold_state = expire(cold, now, self.cfg_run) if now is not None else cold
+                diag["state_tiers"] = {
+                    "n_modeled": n_modeled,
+                    "n_hot": len(state.get("entities", {})),
+                    "n_dormant": len(dormant),
+                    "n_revived": len(revived),
+                    "n_cold_in_memory": len(self.cold_state),
+                }
+            self.model_state = state
+            self.fit_diagnostics = diag
+            if write:
+                if tiers:
+                    with ColdStateStore.from_cfg(self.art_dir, self.cfg_run) as store:
+                        store.remove([e for e in revived if e in state["entities"]])
+                        store.put({e: r for e, r in dormant.items() if e not in kept})
+                        store.put(kept, replace=False)
+                        diag["state_tiers"]["n_evicted"] = store.evict(now, self.cfg_run) if now is not None else 0
+                        diag["state_tiers"]["n_cold"] = store.count()
+                write_json(self.paths["state"], state)
+                write_json(self.paths["fit_diagnostics"], diag)
+            rec["rows_in"] = int(len(unified))
+            rec["entities_in"] = int(len(prev.get("entities", {})))
+            rec["entities_out"] = int(len(state.get("entities", {})))
+            if tiers:
+                rec["entities_dormant"] = int(len(dormant))
+                rec["entities_revived"] = int(len(revived))
+        return state, diag
+
+    def paid_state(self) -> Dict[str, Any]:
+        return filter_model_state_paid(self.model_state or {}, self.cfg_run)
+
+    def _constraints_with_budget(self, budget: Optional[float]) -> Dict[str, Any]:
+        c_cfg = copy.deepcopy(self.cfg_constraints)
+        if budget is not None:
+            c_cfg["budget_total"] = float(budget)
+        return c_cfg
+
+    def allocate(
+        self,
+        budget: Optional[float] = None,
+        horizon: str = "12h",
+        verify: bool = True,
+        write: bool = False,
+    ) -> Tuple[Dict[str, Any], str, Optional[Dict[str, Any]]]:
+        """
+        Solves the next allocation against the previous plan held on the instance and
+        (optionally) verifies it. Returns (plan, explanation, alerts).
+        """
+        with self._stage("allocate") as rec:
+            c_cfg = self._constraints_with_budget(budget)
+            state = self.paid_state()
+            prev_alloc = self.allocation_plan if self.allocation_plan is not None else {}
+
+            # Contract-first behavior: if ad accounts are not configured, always use GA-only plan.
+            if not self.cfg_entities.get("entities"):
+                plan, explain = suggest_ga_only_plan(
+                    unified_path=self._view_input(),
+                    total_budget=float(c_cfg["budget_total"]),
+                    cfg_run=self.cfg_run,
+                    constraints_cfg=c_cfg,
+                    prev_allocation=prev_alloc,
+                )
+            else:
+                plan, explain = solve_allocation(
+                    model_state=state,
+                    prev_allocation=prev_alloc,
+                    constraints_cfg=c_cfg,
+                    cfg_value=self.cfg_value,
+                    cfg_run=self.cfg_run,
+                    horizon=horizon,
+                )
+                if bool(planner_cfg(self.cfg_run)["enabled"]):
+                    plan["trajectory"] = plan_trajectory(state, plan, c_cfg, self.cfg_value, self.cfg_run)
+                    explain = explain_plan(plan)
+
+            rec["entities_in"] = int(len(state.get("entities", {})))
+            rec["rows_out"] = int(len(plan.get("campaigns", [])))
+            rec["solver_iterations"] = int(plan.get("solver", {}).get("iterations", 0))
+
+        self.allocation_plan = plan
+        alerts = self.verify(budget=budget) if verify else None
+        if write:
+            dormant = ()
+            if bool(state_tiers_cfg(self.cfg_run)["enabled"]):
+                ids = {c["entity_id"] for c in plan.get("campaigns", [])}
+                dormant = self._cold_lookup([c["entity_id"] for c in prev_alloc.get("campaigns", []) if c["entity_id"] not in ids])
+            write_plan_outputs(self.paths, plan, self.cfg_run, prev_plan=prev_alloc, dormant=dormant)
+            write_text(self.paths["explanation"], explain)
+            if alerts is not None:
+                write_json(self.paths["alerts"], alerts)
+        return plan, explain, alerts
+
+    def verify(self, budget: Optional[float] = None, write: bool = False) -> Dict[str, Any]:
+        plan = self.allocation_plan if self.allocation_plan is not None else {}
+        with self._stage("verify") as rec:
+            alerts = verify_and_challenge(
+                unified_path=self._view_input(),
+                model_state=self.paid_state(),
+                proxy_catalog=self.proxy_catalog if self.proxy_catalog is not None else {},
+                allocation_plan=plan,
+                cfg_run=self.cfg_run,
+                constraints_cfg=self._constraints_with_budget(budget),
+                screening=self.screening,
+            )
+            self.alerts = alerts
+            if write:
+                write_json(self.paths["alerts"], alerts)
+            rec["rows_in"] = int(len(plan.get("campaigns", [])))
+            rec["alerts_out"] = int(len(alerts.get("alerts", [])))
+        return alerts
+
+    def optimize(
+        self,
+        target_incremental_revenue: float,
+        horizon: str = "12h",
+        budget: Optional[float] = None,
+        write: bool = False,
+    ) -> Tuple[Dict[str, Any], str]:
+        state = self.paid_state()
+        with self._stage("optimize_budget") as rec:
+            result, explain = optimize_budget_for_target(
+                model_state=state,
+                prev_allocation=self.allocation_plan if self.allocation_plan is not None else {},
+                constraints_cfg=self._constraints_with_budget(budget),
+                cfg_value=self.cfg_value,
+                cfg_run=self.cfg_run,
+                target_incremental_revenue=float(target_incremental_revenue),
+                horizon=horizon,
+            )
+            if write:
+                write_json(self.paths["optimal_budget"], result)
+                write_text(self.paths["optimal_budget_explanation"], explain)
+            rec["entities_in"] = int(len(state.get("entities", {})))
+            rec["candidates_evaluated"] = int(result["search"]["candidates_evaluated"])
+            rec["solver_iterations"] = int(result["search"]["solver_iterations"])
+        return result, explain
+
+    def record_history(self, command: str = "api", meta: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """
+        Appends the current model state, plan and alerts to the history store when
+        `history.enabled`; returns the run_id (None when disabled).
+        """
+        if not bool(history_cfg(self.cfg_run)["enabled"]):
+            return None
+        with HistoryStore.from_cfg(self.art_dir, self.cfg_run) as store:
+            return store.record_run(self.model_state, self.allocation_plan, self.alerts, command=command, meta=meta)
+
+    def run(
+        self,
+        budget: Optional[float] = None,
+        horizon: str = "12h",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        target_incremental_revenue: Optional[float] = None,
+        write: bool = False,
+        **inputs: Any,
+    ) -> Dict[str, Any]:
+        """Runs build (-> screen) -> proxies -> model -> allocate/verify (-> optimize) in memory."""
+        self.build(start=start, end=end, write=write, **inputs)
+        if bool(screening_cfg(self.cfg_run)["enabled"]):
+            self.screen(write=write)
+        self.evaluate_proxies(write=write)
+        self.update_model(write=write)
+        plan, explain, alerts = self.allocate(budget=budget, horizon=horizon, write=write)
+        out: Dict[str, Any] = {"plan": plan, "explanation": explain, "alerts": alerts}
+        if target_incremental_revenue is not None:
+            result, _ = self.optimize(target_incremental_revenue, horizon=horizon, budget=budget, write=write)
+            out["optimal_budget"] = result
+        if write:
+            out["history_run_id"] = self.record_history(command="run")
+        return out
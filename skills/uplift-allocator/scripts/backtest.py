@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from api import UpliftAllocator
+from build_unified_view import build_unified_frame
+from channel_policy import paid_mask
+from hierarchy import plan_budgets_by_state_entity
+from response_curve import saturation
+from run_metrics import RunMetrics
+from skill_io import FrameSource, read_frame, write_json, write_text
+
+
+def _plan_value(plan: Dict[str, Any], model_state: Dict[str, Any], cfg_value: Dict[str, Any]) -> float:
+    """Incremental value of a plan's budgets under a model state's posterior means and curves."""
+    entities = model_state.get("entities", {})
+    v_rev = float(cfg_value["default_value_per_revenue_eur"])
+    v_pur = float(cfg_value["default_value_per_purchase"])
+    rows = [(b, entities[e]) for e, b in plan_budgets_by_state_entity(plan).items() if e in entities]
+    if not rows:
+        return 0.0
+    b = np.array([r[0] for r in rows])
+    a = np.array([float(s["curve"]["a"]) for _, s in rows])
+    theta = np.array([float(s["curve"]["theta"]) for _, s in rows])
+    v = np.array([v_rev if s.get("outcome_col") == "revenue" else v_pur for _, s in rows])
+    mu = np.array([float(s["u_mean"]) for _, s in rows])
+    return float(np.sum(v * mu * saturation(b, a, theta)))
+
+
+def _true_value(plan: Dict[str, Any], truth: pd.DataFrame) -> float:
+    """Incremental revenue of a plan under known ground truth (synthetic exports)."""
+    budgets = pd.Series({str(c["entity_id"]): float(c["recommended_budget"]) for c in plan.get("campaigns", [])}, dtype=float)
+    t = truth.set_index("entity_id").reindex(budgets.index).dropna(subset=["u_true"])
+    if t.empty:
+        return 0.0
+    g = saturation(budgets[t.index].to_numpy(), t["a_true"].to_numpy(), t["theta_true"].to_numpy())
+    return float(np.sum(t["u_true"].to_numpy() * t["aov"].to_numpy() * g))
+
+
+def run_backtest(
+    ga: FrameSource,
+    spend: Optional[FrameSource],
+    proxy: Optional[FrameSource],
+    start_iso: str,
+    end_iso: str,
+    cfg_run: Dict[str, Any],
+    cfg_constraints: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    cfg_entities: Optional[Dict[str, Any]] = None,
+    budget: Optional[float] = None,
+    horizon: str = "12h",
+    ad_mode: bool = False,
+    truth: Optional[FrameSource] = None,
+    lookback_days: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Replays the 12h loop (proxies -> model -> allocate -> verify) once per bucket in
+    [start_iso, end_iso], carrying proxy catalog, model state and plan forward on one
+    in-memory UpliftAllocator. The unified view is built once and each step sees only
+    rows up to its bucket (lookback_days, default fit_window_days), so nothing is re-read
+    or written per step.
+
+    Each step reports the plan, churn, gate decisions and verification, plus:
+      expected_value  - plan value under the state it was solved with (ex ante)
+      ex_post_value   - the same plan valued with the next step's posterior
+      observed_outcome_next / observed_spend_next - GA outcome and spend in the next bucket
+      true_value      - plan value under ground truth, when a truth frame is given
+    ad_mode forces the solver (entities taken from the data) even if entities.yaml is empty.
+    """
+    fit_days = int(cfg_run["fit_window_days"])
+    lookback = int(lookback_days) if lookback_days is not None else fit_days
+    start_t = pd.Timestamp(start_iso)
+    start_t = start_t.tz_localize("UTC") if start_t.tzinfo is None else start_t.tz_convert("UTC")
+    build_start = (start_t - pd.Timedelta(days=lookback)).isoformat()
+
+    t0 = time.perf_counter()
+    unified = build_unified_frame(ga, spend, proxy, build_start, end_iso, cfg_run)
+    unified["time_bucket_start"] = pd.to_datetime(unified["time_bucket_start"], utc=True)
+    unified = unified.sort_values("time_bucket_start", kind="stable").reset_index(drop=True)
+    build_s = time.perf_counter() - t0
+
+    times = unified["time_bucket_start"]
+    buckets = [b for b in pd.unique(unified["time_bucket_start"]) if b >= start_t]
+    outcome_col = "revenue" if float(unified["revenue"].sum()) > 0 else "purchases"
+    is_paid = paid_mask(unified, cfg_run)
+    paid_ids = sorted(unified.loc[is_paid, "entity_id"].unique())
+
+    if ad_mode:
+        cfg_entities = {"entities": [{"entity_id": e} for e in paid_ids], "parents": []}
+    metrics = RunMetrics("backtest", trace_memory=False)
+    ua = UpliftAllocator(
+        cfg_run=cfg_run,
+        cfg_constraints=cfg_constraints,
+        cfg_value=cfg_value,
+        cfg_entities=cfg_entities if cfg_entities is not None else {},
+        metrics=metrics,
+    )
+    ua.proxy_catalog, ua.model_state, ua.allocation_plan = {}, {}, {}
+    truth_df = read_frame(truth) if truth is not None else None
+
+    steps: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for k, bucket in enumerate(buckets):
+        step_t0 = time.perf_counter()
+        lo = int(times.searchsorted(bucket - pd.Timedelta(days=lookback), side="right"))
+        hi = int(times.searchsorted(bucket, side="right"))
+        ua.unified = unified.iloc[lo:hi]
+        try:
+            ua.evaluate_proxies()
+            ua.update_model()
+            state = ua.paid_state()
+            plan, _, alerts = ua.allocate(budget=budget, horizon=horizon)
+        except ValueError as exc:
+            # A live run would stop here; the replay records the step and keeps going.
+            errors.append({"step": k, "bucket": str(bucket), "error": str(exc)})
+            continue
+
+        campaigns = plan.get("campaigns", [])
+        status = pd.Series([c["gate_status"] for c in campaigns], dtype=object).value_counts()
+        row: Dict[str, Any] = {
+            "step": k,
+            "bucket": str(bucket),
+            "entities": int(len(state.get("entities", {}))),
+            "budget_allocated": float(sum(float(c["recommended_budget"]) for c in campaigns)),
+            "churn": float(plan.get("totals", {}).get("churn", 0.0)),
+            "n_increase": int(status.get("increase", 0)),
+            "n_decrease": int(status.get("decrease", 0)),
+            "n_hold": int(status.get("hold", 0)),
+            "n_gated": int(sum("uncertainty_gate" in c.get("binding_constraints", []) for c in campaigns)),
+            "hard_fail": bool((alerts or {}).get("hard_fail", False)),
+            "alerts": sorted({a["type"] for a in (alerts or {}).get("alerts", [])}),
+            "expected_value": _plan_value(plan, state, cfg_value),
+            "ex_post_value": None,
+            "observed_outcome_next": None,
+            "observed_spend_next": None,
+        }
+        if truth_df is not None:
+            row["true_value"] = _true_value(plan, truth_df)
+        prev_plan = steps[-1].pop("_plan", None) if steps else None
+        if prev_plan is not None and steps[-1]["step"] == k - 1:
+            steps[-1]["ex_post_value"] = _plan_value(prev_plan, state, cfg_value)
+            nxt = unified.iloc[int(times.searchsorted(bucket, side="left")):hi]
+            nxt_paid = nxt[is_paid[nxt.index]]
+            steps[-1]["observed_outcome_next"] = float(nxt_paid[outcome_col].sum())
+            steps[-1]["observed_spend_next"] = float(nxt_paid["spend"].sum()) if "spend" in nxt_paid.columns else 0.0
+        row["_plan"] = plan
+        row["wall_s"] = time.perf_counter() - step_t0
+        steps.append(row)
+    if steps:
+        steps[-1].pop("_plan", None)
+
+    stage_totals: Dict[str, float] = {}
+    for s in metrics.stages:
+        stage_totals[s["stage"]] = stage_totals.get(s["stage"], 0.0) + float(s["wall_s"])
+    churn = np.array([s["churn"] for s in steps]) if steps else np.zeros(1)
+    summary: Dict[str, Any] = {
+        "from": str(start_t),
+        "to": str(end_iso),
+        "n_steps": len(steps),
+        "n_errors": len(errors),
+        "outcome_col": outcome_col,
+        "build_s": build_s,
+        "replay_s": float(sum(s["wall_s"] for s in steps)),
+        "stage_wall_s": stage_totals,
+        "mean_churn": float(churn.mean()),
+        "max_churn": float(churn.max()),
+        "hard_fail_steps": int(sum(s["hard_fail"] for s in steps)),
+        "gated_decisions": int(sum(s["n_gated"] for s in steps)),
+        "expected_value": float(sum(s["expected_value"] for s in steps)),
+        "ex_post_value": float(sum(s["ex_post_value"] or 0.0 for s in steps)),
+    }
+    if truth_df is not None:
+        summary["true_value"] = float(sum(s["true_value"] for s in steps))
+    return {"summary": summary, "steps": steps, "errors": errors}
+
+
+def render_backtest(report: Dict[str, Any]) -> str:
+    s = report["summary"]
+    lines = [
+        "# Backtest report",
+        f"- Window: {s['from']} .. {s['to']} ({s['n_steps']} steps, {s['n_errors']} failed)",
+        f"- Replay time: {s['replay_s']:.2f}s (build {s['build_s']:.2f}s)",
+        f"- Churn: mean {s['mean_churn']:.4f}, max {s['max_churn']:.4f}",
+        f"- Hard-fail steps: {s['hard_fail_steps']}; gated decisions: {s['gated_decisions']}",
+        f"- Expected value (ex ante): {s['expected_value']:.2f}; ex post: {s['ex_post_value']:.2f}",
+    ]
+    if "true_value" in s:
+        lines.append(f"- True incremental value (ground truth): {s['true_value']:.2f}")
+    lines += [
+        "",
+        "| step | bucket | churn | +/-/= | gated | hard_fail | expected | ex_post |",
+        "|---:|---|---:|---|---:|---|---:|---:|",
+    ]
+    for r in report["steps"]:
+        ex_post = "-" if r["ex_post_value"] is None else f"{r['ex_post_value']:.2f}"
+        lines.append(
+            f"| {r['step']} | {r['bucket']} | {r['churn']:.4f} | {r['n_increase']}/{r['n_decrease']}/{r['n_hold']} "
+            f"| {r['n_gated']} | {r['hard_fail']} | {r['expected_value']:.2f} | {ex_post} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_backtest(report: Dict[str, Any], out_dir: Path) -> Dict[str, Path]:
+    paths = {"json": out_dir / "backtest_report.json", "md": out_dir / "backtest_report.md"}
+    write_json(paths["json"], report)
+    write_text(paths["md"], render_backtest(report))
+    return paths
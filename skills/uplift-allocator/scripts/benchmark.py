@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import copy
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from build_unified_view import build_unified_frame
+from model_update import update_model_state
+from allocate import solve_allocation
+from optimize_budget import optimize_budget_for_target
+from channel_policy import filter_model_state_paid
+from schemas import frame_memory_bytes, read_typed
+from screening import screen_unified
+from synthetic_data import generate_synthetic_exports
+from skill_io import read_json, write_json, write_text
+
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+def _timed(fn, repeats: int) -> Tuple[float, Any]:
+    best = float("inf")
+    out = None
+    for _ in range(max(1, repeats)):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def benchmark_size(
+    n_entities: int,
+    n_days: int,
+    cfg_run: Dict[str, Any],
+    cfg_constraints: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    repeats: int = 1,
+    seed: int = 0,
+    optimize_max_entities: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Times each pipeline stage on one synthetic dataset. Returns one row per stage."""
+    frames = generate_synthetic_exports(
+        n_entities, n_days=n_days, cadence_hours=int(cfg_run.get("cadence_hours", 12)), seed=seed
+    )
+    rows: List[Dict[str, Any]] = []
+
+    def record(stage: str, seconds: float, **extra: Any) -> None:
+        rows.append({"stage": stage, "n_entities": int(n_entities), "n_days": int(n_days), "wall_s": float(seconds), **extra})
+
+    t, unified = _timed(
+        lambda: build_unified_frame(frames["ga"], frames["spend"], frames["proxy"], None, None, cfg_run), repeats
+    )
+    record("build", t, rows_in=int(len(frames["ga"])), rows_out=int(len(unified)))
+
+    # Typed read of the unified view CSV vs inferred dtypes with a format-less timestamp parse.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "unified_view.csv"
+        unified.to_csv(path, index=False)
+
+        def untyped() -> pd.DataFrame:
+            df = pd.read_csv(path)
+            df["time_bucket_start"] = pd.to_datetime(df["time_bucket_start"], utc=True)
+            return df
+
+        t_plain, plain = _timed(untyped, repeats)
+        t, typed = _timed(lambda: read_typed(path, "unified"), repeats)
+    record(
+        "read",
+        t,
+        rows=int(len(typed)),
+        untyped_wall_s=float(t_plain),
+        untyped_mb=frame_memory_bytes(plain) / 2**20,
+        typed_mb=frame_memory_bytes(typed) / 2**20,
+    )
+
+    t, (_, report) = _timed(lambda: screen_unified(unified, cfg_run), repeats)
+    record("screen", t, rows=int(len(unified)), rows_flagged=int(report["rows_flagged"]))
+
+    t, (state, _) = _timed(lambda: update_model_state(unified, {}, {}, cfg_run), repeats)
+    record("model", t, entities_out=int(len(state.get("entities", {}))))
+
+    paid = filter_model_state_paid(state, cfg_run)
+    t, (plan, _) = _timed(
+        lambda: solve_allocation(paid, {}, cfg_constraints, cfg_value, cfg_run, horizon="12h"), repeats
+    )
+    record("allocate", t, entities_in=int(len(paid.get("entities", {}))), iterations=int(plan.get("solver", {}).get("iterations", 0)))
+
+    if optimize_max_entities is None or n_entities <= optimize_max_entities:
+        target = float(sum(float(c["recommended_budget"]) for c in plan.get("campaigns", []))) * 1e-3
+        t, (result, _) = _timed(
+            lambda: optimize_budget_for_target(paid, plan, cfg_constraints, cfg_value, cfg_run, target, horizon="12h"),
+            repeats,
+        )
+        record("optimize_budget", t, candidates=int(result.get("search", {}).get("candidates_evaluated", 0)))
+    return rows
+
+
+def run_benchmarks(
+    cfg_run: Dict[str, Any],
+    cfg_constraints: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    n_days: int = 28,
+    repeats: int = 1,
+    seed: int = 0,
+    optimize_max_entities: Optional[int] = 1000,
+) -> Dict[str, Any]:
+    cfg_run = copy.deepcopy(cfg_run)
+    results: List[Dict[str, Any]] = []
+    for n in sizes:
+        results.extend(
+            benchmark_size(
+                int(n),
+                n_days,
+                cfg_run,
+                cfg_constraints,
+                cfg_value,
+                repeats=repeats,
+                seed=seed,
+                optimize_max_entities=optimize_max_entities,
+            )
+        )
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "n_days": int(n_days),
+        "repeats": int(repeats),
+        "results": results,
+    }
+
+
+def _key(row: Dict[str, Any]) -> str:
+    return f"{row['stage']}@{row['n_entities']}x{row['n_days']}d"
+
+
+def compare_to_baseline(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = 0.25,
+    min_seconds: float = 0.01,
+) -> Dict[str, Any]:
+    """
+    Flags a regression when wall time exceeds baseline * (1 + threshold).
+    Timings below min_seconds in both runs are reported but never flagged (timer noise).
+    """
+    base = {_key(r): r for r in baseline.get("results", [])}
+    rows = []
+    for r in current.get("results", []):
+        b = base.get(_key(r))
+        ratio = None
+        status = "new"
+        if b is not None:
+            ratio = float(r["wall_s"]) / max(1e-12, float(b["wall_s"]))
+            if max(float(r["wall_s"]), float(b["wall_s"])) < min_seconds:
+                status = "ok"
+            elif ratio > 1.0 + threshold:
+                status = "regression"
+            elif ratio < 1.0 / (1.0 + threshold):
+                status = "improved"
+            else:
+                status = "ok"
+        rows.append(
+            {
+                "key": _key(r),
+                "stage": r["stage"],
+                "n_entities": r["n_entities"],
+                "wall_s": float(r["wall_s"]),
+                "baseline_wall_s": None if b is None else float(b["wall_s"]),
+                "ratio": ratio,
+                "status": status,
+            }
+        )
+    return {
+        "threshold": float(threshold),
+        "regressions": [r["key"] for r in rows if r["status"] == "regression"],
+        "rows": rows,
+    }
+
+
+def render_report(comparison: Dict[str, Any]) -> str:
+    lines = [
+        "# Stage benchmark report",
+        f"- Regression threshold: +{comparison['threshold'] * 100:.0f}% wall time vs baseline",
+        f"- Regressions: {len(comparison['regressions'])}",
+        "",
+        "| stage | entities | wall_s | baseline_s | ratio | status |",
+        "|---|---:|---:|---:|---:|---|",
+    ]
+    for r in comparison["rows"]:
+        base = "-" if r["baseline_wall_s"] is None else f"{r['baseline_wall_s']:.4f}"
+        ratio = "-" if r["ratio"] is None else f"{r['ratio']:.2f}"
+        lines.append(f"| {r['stage']} | {r['n_entities']} | {r['wall_s']:.4f} | {base} | {ratio} | {r['status']} |")
+    return "\n".join(lines) + "\n"
+
+
+def run_benchmark_suite(
+    cfg_run: Dict[str, Any],
+    cfg_constraints: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    baseline_path: Path,
+    report_dir: Path,
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    n_days: int = 28,
+    repeats: int = 1,
+    threshold: float = 0.25,
+    update_baseline: bool = False,
+    optimize_max_entities: Optional[int] = 1000,
+) -> Dict[str, Any]:
+    current = run_benchmarks(
+        cfg_run,
+        cfg_constraints,
+        cfg_value,
+        sizes=sizes,
+        n_days=n_days,
+        repeats=repeats,
+        optimize_max_entities=optimize_max_entities,
+    )
+    baseline = read_json(baseline_path, default={"results": []})
+    comparison = compare_to_baseline(current, baseline, threshold=threshold)
+    write_json(report_dir / "bench_results.json", current)
+    write_json(report_dir / "bench_report.json", comparison)
+    write_text(report_dir / "bench_report.md", render_report(comparison))
+    if update_baseline:
+        merged = {_key(r): r for r in baseline.get("results", [])}
+        merged.update({_key(r): r for r in current["results"]})
+        write_json(baseline_path, {**current, "results": sorted(merged.values(), key=lambda r: (r["stage"], r["n_entities"], r["n_days"]))})
+    return comparison
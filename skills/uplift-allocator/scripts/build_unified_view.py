@@ -1,77 +1,105 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 import pandas as pd
 
+from ad_sources import ad_sources_cfg, merge_ad_sources
+from rollup_cube import RollupCube
+from skill_io import FrameSource, read_frame
 
-def build_unified_view(
-    ga_csv: Path,
-    ad_spend_csv: Path,
-    ad_proxy_csv: Path,
-    out_csv: Path,
-    start_iso: Optional[str],
-    end_iso: Optional[str],
-    cfg_run: Dict[str, Any],
-) -> None:
-    """
-    Builds a 12h unified view.
-    GA is mandatory. Ad files are optional (can be missing/empty).
-    Output columns (minimum):
-      time_bucket_start, entity_id, channel_id, audience_id, campaign_id,
-      revenue, purchases, spend, proxy_*
-    """
-    _ = cfg_run
-    df_ga = pd.read_csv(ga_csv)
-    df_ga["time"] = pd.to_datetime(df_ga["time"], utc=True)
-    df_ga["time_bucket_start"] = df_ga["time"].dt.floor("12h")
 
-    df_ga["channel_id"] = df_ga.get("default_channel_group", "unknown")
-    if "campaign" in df_ga.columns:
-        df_ga["campaign_id"] = df_ga["campaign"].astype(str)
-    else:
-        df_ga["campaign_id"] = df_ga["source_medium"].astype(str)
+def _optional_frame(src: Optional[FrameSource], schema: str) -> Optional[pd.DataFrame]:
+    if src is None:
+        return None
+    if isinstance(src, pd.DataFrame):
+        return read_frame(src, schema)
+    if not Path(src).exists():
+        return None
+    return read_frame(src, schema)
 
-    df_ga["audience_id"] = "ga"
-    df_ga["entity_id"] = "ga|" + df_ga["channel_id"].astype(str) + "|" + df_ga["campaign_id"].astype(str)
 
-    if "revenue" not in df_ga.columns:
-        df_ga["revenue"] = 0.0
-    if "purchases" not in df_ga.columns:
-        df_ga["purchases"] = 0.0
+def build_rollup_cube(
+    ga_csv: FrameSource,
+    ad_spend_csv: Optional[FrameSource],
+    ad_proxy_csv: Optional[FrameSource],
+    cfg_run: Dict[str, Any],
+    cube: Optional[RollupCube] = None,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    root: Optional[Path] = None,
+) -> RollupCube:
+    """
+    Ingests the exports into a rollup cube (a new one unless `cube` is given, in which
+    case the exports replace the buckets they cover). GA is mandatory; ad inputs are
+    optional and may be CSV paths or already-loaded DataFrames.
+    With `sources` (run.yaml ad_sources.sources; relative paths resolve against root),
+    every ad source is aggregated on its own in parallel and the results are merge-joined
+    on (time_bucket_start, entity_id) under the configured conflict rules.
+    """
+    cube = cube if cube is not None else RollupCube.from_cfg(cfg_run)
+    if not sources:
+        cube.ingest(read_frame(ga_csv, "ga"), _optional_frame(ad_spend_csv, "ad_spend"), _optional_frame(ad_proxy_csv, "ad_proxy"))
+        return cube
 
-    ga_agg = (
-        df_ga.groupby(["time_bucket_start", "entity_id", "channel_id", "audience_id", "campaign_id"], as_index=False)
-        .agg({"revenue": "sum", "purchases": "sum"})
+    # The single spend/proxy exports, if given, join as the lowest-priority source.
+    if ad_spend_csv is not None or ad_proxy_csv is not None:
+        sources = list(sources) + [{"name": "export", "spend": ad_spend_csv, "proxy": ad_proxy_csv, "priority": float("inf")}]
+    s_cfg = ad_sources_cfg(cfg_run)
+    spend, proxy, stats = merge_ad_sources(
+        sources,
+        cube.base_hours,
+        spend_conflict=str(s_cfg["spend_conflict"]),
+        proxy_conflict=str(s_cfg["proxy_conflict"]),
+        workers=int(s_cfg["workers"]),
+        root=root,
     )
+    cube.ingest(read_frame(ga_csv, "ga"))
+    if spend is not None:
+        cube.ingest_base("spend", spend, input_rows=stats["spend_rows"])
+    if proxy is not None:
+        cube.ingest_base("proxy", proxy, input_rows=stats["proxy_rows"])
+    cube.source_stats = stats
+    return cube
 
-    ga_agg["spend"] = 0.0
-
-    if ad_spend_csv.exists():
-        s = pd.read_csv(ad_spend_csv)
-        if not s.empty:
-            s["time"] = pd.to_datetime(s["time"], utc=True)
-            s["time_bucket_start"] = s["time"].dt.floor("12h")
-            s_agg = s.groupby(["time_bucket_start", "entity_id"], as_index=False).agg({"spend": "sum"})
-            ga_agg = ga_agg.merge(s_agg, on=["time_bucket_start", "entity_id"], how="left", suffixes=("", "_ad"))
-            ga_agg["spend"] = ga_agg["spend_ad"].fillna(0.0)
-            ga_agg = ga_agg.drop(columns=["spend_ad"])
 
-    if ad_proxy_csv.exists():
-        p = pd.read_csv(ad_proxy_csv)
-        if not p.empty:
-            p["time"] = pd.to_datetime(p["time"], utc=True)
-            p["time_bucket_start"] = p["time"].dt.floor("12h")
-            proxy_cols = [c for c in p.columns if c.startswith("proxy_")]
-            if proxy_cols:
-                p_agg = p.groupby(["time_bucket_start", "entity_id"], as_index=False).agg({c: "mean" for c in proxy_cols})
-                ga_agg = ga_agg.merge(p_agg, on=["time_bucket_start", "entity_id"], how="left")
+def build_unified_frame(
+    ga_csv: FrameSource,
+    ad_spend_csv: Optional[FrameSource],
+    ad_proxy_csv: Optional[FrameSource],
+    start_iso: Optional[str],
+    end_iso: Optional[str],
+    cfg_run: Dict[str, Any],
+    cube: Optional[RollupCube] = None,
+) -> pd.DataFrame:
+    """
+    Builds the unified view in memory at cadence_hours (run.yaml, default 12h).
+    GA is mandatory. Ad inputs are optional (can be None/missing/empty); each input
+    may be a CSV path or an already-loaded DataFrame. When `cube` is given the exports
+    are ingested into it, so other resolutions can be read from it afterwards.
+    Output columns (minimum):
+      time_bucket_start, entity_id, channel_id, audience_id, campaign_id,
+      revenue, purchases, spend, is_paid, proxy_*
+    is_paid is the paid-channel classification (paid_channel_policy), computed once per
+    entity here so later stages can filter rows instead of re-classifying ids.
+    """
+    cube = build_rollup_cube(ga_csv, ad_spend_csv, ad_proxy_csv, cfg_run, cube)
+    return cube.view(int(cfg_run.get("cadence_hours", 12)), start_iso, end_iso, cfg_run)
 
-    if start_iso:
-        ga_agg = ga_agg[ga_agg["time_bucket_start"] >= pd.to_datetime(start_iso, utc=True)]
-    if end_iso:
-        ga_agg = ga_agg[ga_agg["time_bucket_start"] < pd.to_datetime(end_iso, utc=True)]
 
+def build_unified_view(
+    ga_csv: FrameSource,
+    ad_spend_csv: Optional[FrameSource],
+    ad_proxy_csv: Optional[FrameSource],
+    out_csv: Path,
+    start_iso: Optional[str],
+    end_iso: Optional[str],
+    cfg_run: Dict[str, Any],
+) -> pd.DataFrame:
+    """
+    Builds the unified view and writes it to out_csv.
+    """
+    unified = build_unified_frame(ga_csv, ad_spend_csv, ad_proxy_csv, start_iso, end_iso, cfg_run)
     out_csv.parent.mkdir(parents=True, exist_ok=True)
-    ga_agg.sort_values(["time_bucket_start", "entity_id"]).to_csv(out_csv, index=False)
+    unified.to_csv(out_csv, index=False)
+    return unified
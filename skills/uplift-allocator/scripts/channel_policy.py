@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Tuple
 import re
 
+import numpy as np
+import pandas as pd
+
 
 def _default_policy() -> Dict[str, list[str]]:
     return {
@@ -53,15 +57,35 @@ def _norm(s: str) -> str:
     return re.sub(r"\s+", " ", x)
 
 
-def is_paid_entity(entity_id: str, cfg_run: Dict[str, Any]) -> bool:
+PolicyKey = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]
+
+
+def _policy_key(cfg_run: Dict[str, Any]) -> PolicyKey:
     policy = cfg_run.get("paid_channel_policy", _default_policy())
-    include = [_norm(k) for k in policy.get("include_keywords", [])]
-    exclude = [_norm(k) for k in policy.get("exclude_keywords", [])]
-    exact_paid = {_norm(k) for k in policy.get("exact_paid_channels", [])}
-    exact_unpaid = {_norm(k) for k in policy.get("exact_unpaid_channels", [])}
+    return (
+        tuple(policy.get("include_keywords", [])),
+        tuple(policy.get("exclude_keywords", [])),
+        tuple(policy.get("exact_paid_channels", [])),
+        tuple(policy.get("exact_unpaid_channels", [])),
+    )
+
+
+@lru_cache(maxsize=64)
+def _normalized_policy(key: PolicyKey) -> Tuple[Tuple[str, ...], Tuple[str, ...], frozenset, frozenset]:
+    return (
+        tuple(_norm(k) for k in key[0]),
+        tuple(_norm(k) for k in key[1]),
+        frozenset(_norm(k) for k in key[2]),
+        frozenset(_norm(k) for k in key[3]),
+    )
+
+
+@lru_cache(maxsize=65536)
+def _is_paid_cached(entity_id: str, key: PolicyKey) -> bool:
+    include, exclude, exact_paid, exact_unpaid = _normalized_policy(key)
 
     channel = _norm(parse_channel_from_entity(entity_id))
-    whole = _norm(str(entity_id))
+    whole = _norm(entity_id)
 
     if channel in exact_unpaid:
         return False
@@ -73,6 +97,76 @@ def is_paid_entity(entity_id: str, cfg_run: Dict[str, Any]) -> bool:
     return any(k in channel or k in whole for k in include)
 
 
+def is_paid_entity(entity_id: str, cfg_run: Dict[str, Any]) -> bool:
+    # Classification is pure in (entity_id, policy); memoized because every stage re-filters.
+    return _is_paid_cached(str(entity_id), _policy_key(cfg_run))
+
+
+def _default_pushdown_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "model": "skip",
+        "proxy_weight": 0.0,
+    }
+
+
+def pushdown_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_pushdown_cfg()
+    out.update(cfg_run.get("paid_pushdown", {}) or {})
+    return out
+
+
+def _norm_series(s: pd.Series) -> pd.Series:
+    return s.str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+
+
+def paid_flags(entity_ids: pd.Series, cfg_run: Dict[str, Any]) -> pd.Series:
+    """
+    Paid flag per row, classifying each distinct entity once. Same rules as
+    is_paid_entity, evaluated with vectorized string ops: channel rules once per distinct
+    channel, keyword scans of the whole id only for entities the channel leaves open.
+    """
+    include, exclude, exact_paid, exact_unpaid = _normalized_policy(_policy_key(cfg_run))
+    uniq = pd.Series(pd.unique(entity_ids)).astype(str)
+    parts = uniq.str.split("|", n=2, expand=True)
+    if parts.shape[1] >= 3:
+        channel_raw = parts[1].where(parts[2].notna() & (parts[0].str.lower() == "ga"), parts[0])
+    else:
+        channel_raw = parts[0]
+    ch_codes, ch_uniq = pd.factorize(channel_raw.fillna(""))
+    channel = _norm_series(pd.Series(ch_uniq, dtype=object))
+
+    def mentions(text: pd.Series, keywords: Tuple[str, ...]) -> np.ndarray:
+        if not keywords:
+            return np.zeros(len(text), dtype=bool)
+        # One alternation pass instead of one substring scan per keyword.
+        return text.str.contains("|".join(re.escape(k) for k in keywords), regex=True).to_numpy(dtype=bool)
+
+    unpaid = channel.isin(exact_unpaid).to_numpy()[ch_codes]
+    paid = channel.isin(exact_paid).to_numpy()[ch_codes]
+    ch_excl = mentions(channel, exclude)[ch_codes]
+    ch_incl = mentions(channel, include)[ch_codes]
+
+    flags = paid & ~unpaid
+    open_ = ~unpaid & ~paid
+    if open_.any():
+        whole = _norm_series(uniq[open_])
+        excl = ch_excl[open_] | mentions(whole, exclude)
+        incl = ch_incl[open_] | mentions(whole, include)
+        flags[open_] = ~excl & incl
+    return entity_ids.astype(str).map(dict(zip(uniq, flags))).astype(bool)
+
+
+def paid_mask(df: pd.DataFrame, cfg_run: Dict[str, Any]) -> np.ndarray:
+    """Row mask of paid entities: the unified view's is_paid column when present, else classified here."""
+    if "is_paid" in df.columns:
+        col = df["is_paid"]
+        if col.dtype != bool:
+            col = col.astype(str).str.lower().isin(["true", "1"])
+        return col.to_numpy(dtype=bool)
+    return paid_flags(df["entity_id"], cfg_run).to_numpy(dtype=bool)
+
+
 def filter_model_state_paid(model_state: Dict[str, Any], cfg_run: Dict[str, Any]) -> Dict[str, Any]:
     entities = model_state.get("entities", {})
     paid_entities = {
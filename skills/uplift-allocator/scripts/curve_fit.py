@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import numpy as np
+
+from response_curve import saturation
+
+
+def _default_curve_fit_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "max_iter": 25,
+        "warm_step": 0.05,
+        "cold_step": 0.5,
+        "tol": 0.005,
+        "min_buckets": 6,
+        "min_spend_cv": 0.05,
+        "shrinkage_buckets": 12.0,
+        "a_bounds": [0.3, 3.0],
+    }
+
+
+def curve_fit_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_curve_fit_cfg()
+    out.update(cfg_run.get("curve_fit", {}) or {})
+    return out
+
+
+def _profiled_sse(
+    spend: np.ndarray,
+    y: np.ndarray,
+    mask: np.ndarray,
+    n: np.ndarray,
+    log_a: np.ndarray,
+    log_theta: np.ndarray,
+) -> np.ndarray:
+    """
+    SSE of y ~ c0 + c1 * g(spend; a, theta) per entity (row), with c0 free and c1 >= 0
+    solved in closed form for the given curve. All arrays are (entities x buckets) except the
+    per-entity parameters and counts.
+    """
+    g = saturation(spend, np.exp(log_a)[:, None], np.exp(log_theta)[:, None])
+    g = np.where(mask, g, 0.0)
+    nn = np.maximum(n, 1.0)
+    g_mean = g.sum(axis=1) / nn
+    y_mean = y.sum(axis=1) / nn
+    gc = np.where(mask, g - g_mean[:, None], 0.0)
+    yc = np.where(mask, y - y_mean[:, None], 0.0)
+    var_g = (gc * gc).sum(axis=1)
+    cov = (gc * yc).sum(axis=1)
+    c1 = np.maximum(0.0, cov / np.maximum(var_g, 1e-12))
+    resid = np.where(mask, yc - c1[:, None] * gc, 0.0)
+    return (resid * resid).sum(axis=1)
+
+
+def fit_saturation_curves(
+    spend: np.ndarray,
+    y: np.ndarray,
+    channels: np.ndarray,
+    a_init: np.ndarray,
+    theta_init: np.ndarray,
+    warm: np.ndarray,
+    a_default: float,
+    theta_default: float,
+    cfg: Dict[str, Any],
+) -> Dict[str, np.ndarray]:
+    """
+    Batched per-entity Hill-curve fit across all entities at once.
+
+    spend, y: (entities x buckets) panels with NaN for missing buckets.
+    a_init/theta_init: starting curves (previous unshrunk fits where `warm` is True).
+    Each iteration evaluates the profiled SSE at the four +/- step neighbours in
+    (log a, log theta) for every entity in one vectorized pass, moves entities that improve
+    and halves the step of those that do not. Warm-started entities begin with a small step,
+    so a 12h refit usually converges in a few iterations.
+
+    Fitted values are shrunk toward their channel's (n-weighted) mean in log space with
+    weight n / (n + shrinkage_buckets); entities without enough spend variation take the
+    channel mean, or the defaults when no entity of the channel could be fitted.
+    """
+    n_ent = spend.shape[0]
+    mask = np.isfinite(spend) & np.isfinite(y)
+    spend = np.where(mask, spend, 0.0)
+    y = np.where(mask, y, 0.0)
+    n = mask.sum(axis=1).astype(float)
+
+    pos = mask & (spend > 0)
+    n_pos = pos.sum(axis=1)
+    s_mean = np.where(pos, spend, 0.0).sum(axis=1) / np.maximum(n_pos, 1)
+    s_var = np.where(pos, (spend - s_mean[:, None]) ** 2, 0.0).sum(axis=1) / np.maximum(n_pos, 1)
+    cv = np.sqrt(s_var) / np.maximum(s_mean, 1e-12)
+    fit_ok = (n_pos >= int(cfg["min_buckets"])) & (cv >= float(cfg["min_spend_cv"]))
+
+    a_lo, a_hi = (float(v) for v in cfg["a_bounds"])
+    max_spend = np.where(pos, spend, 0.0).max(axis=1) if spend.shape[1] else np.zeros(n_ent)
+    lt_lo = np.full(n_ent, np.log(1.0))
+    lt_hi = np.log(np.maximum(100.0 * np.maximum(max_spend, 1.0), theta_default))
+
+    log_a = np.log(np.clip(a_init, a_lo, a_hi))
+    log_t = np.clip(np.log(np.maximum(theta_init, 1.0)), lt_lo, lt_hi)
+    step = np.where(warm, float(cfg["warm_step"]), float(cfg["cold_step"]))
+    tol = float(cfg["tol"])
+    iters = np.zeros(n_ent, dtype=int)
+    active = fit_ok & (step >= tol)
+
+    sse = _profiled_sse(spend, y, mask, n, log_a, log_t)
+    for _ in range(int(cfg["max_iter"])):
+        if not active.any():
+            break
+        iters += active
+        best_sse = sse.copy()
+        best_a = log_a.copy()
+        best_t = log_t.copy()
+        for da, dt in ((1.0, 0.0), (-1.0, 0.0), (0.0, 1.0), (0.0, -1.0)):
+            cand_a = np.clip(log_a + da * step, np.log(a_lo), np.log(a_hi))
+            cand_t = np.clip(log_t + dt * step, lt_lo, lt_hi)
+            cand = _profiled_sse(spend, y, mask, n, cand_a, cand_t)
+            better = active & (cand < best_sse - 1e-12)
+            best_sse = np.where(better, cand, best_sse)
+            best_a = np.where(better, cand_a, best_a)
+            best_t = np.where(better, cand_t, best_t)
+        moved = active & (best_sse < sse - 1e-12)
+        log_a, log_t, sse = best_a, best_t, best_sse
+        step = np.where(active & ~moved, step * 0.5, step)
+        active = active & (step >= tol)
+
+    sst = np.where(mask, (y - (y.sum(axis=1) / np.maximum(n, 1.0))[:, None]) ** 2, 0.0).sum(axis=1)
+    r2 = np.where(fit_ok & (sst > 1e-12), 1.0 - sse / np.maximum(sst, 1e-12), np.nan)
+
+    # Channel-level shrinkage in log space.
+    k = float(cfg["shrinkage_buckets"])
+    out_a = np.full(n_ent, np.log(a_default))
+    out_t = np.full(n_ent, np.log(max(theta_default, 1.0)))
+    source = np.full(n_ent, "default", dtype=object)
+    for ch in np.unique(channels):
+        in_ch = channels == ch
+        fitted = in_ch & fit_ok
+        if fitted.any():
+            w = n[fitted]
+            ch_a = float(np.average(log_a[fitted], weights=w))
+            ch_t = float(np.average(log_t[fitted], weights=w))
+            out_a[in_ch] = ch_a
+            out_t[in_ch] = ch_t
+            source[in_ch] = "channel"
+            lam = n[fitted] / (n[fitted] + k)
+            out_a[fitted] = lam * log_a[fitted] + (1.0 - lam) * ch_a
+            out_t[fitted] = lam * log_t[fitted] + (1.0 - lam) * ch_t
+            source[fitted] = "fit"
+
+    return {
+        "a": np.exp(out_a),
+        "theta": np.exp(out_t),
+        "a_raw": np.exp(log_a),
+        "theta_raw": np.exp(log_t),
+        "r2": r2,
+        "iterations": iters,
+        "converged": fit_ok & (step < tol),
+        "fitted": fit_ok,
+        "source": source,
+        "n_obs": n,
+    }
+
+
+def summarize_fit(fit: Dict[str, np.ndarray], warm: np.ndarray) -> Dict[str, Any]:
+    fitted = fit["fitted"]
+    r2 = fit["r2"][fitted]
+    r2 = r2[np.isfinite(r2)]
+    its = fit["iterations"][fitted]
+    return {
+        "n_fitted": int(fitted.sum()),
+        "n_channel_prior": int((fit["source"] == "channel").sum()),
+        "n_default": int((fit["source"] == "default").sum()),
+        "n_warm_started": int((warm & fitted).sum()),
+        "converged_share": float(fit["converged"][fitted].mean()) if fitted.any() else None,
+        "mean_iterations": float(its.mean()) if its.size else None,
+        "max_iterations": int(its.max()) if its.size else 0,
+        "median_r2": float(np.median(r2)) if r2.size else None,
+    }
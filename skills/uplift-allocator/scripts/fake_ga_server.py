@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from ga_fetch import GA_DIMENSIONS, GA_METRICS
+from skill_io import FrameSource, read_frame
+
+
+_ROUTE = re.compile(r"^/v1beta/properties/[^/]+:runReport$")
+
+
+def _report_rows(ga: pd.DataFrame, timezone: str = "UTC") -> pd.DataFrame:
+    """
+    GA export rows summed per (hour, channel, campaign), as a GA report would return them
+    (dateHour local to the property time zone).
+    """
+    df = ga.copy()
+    df["dateHour"] = pd.to_datetime(df["time"], utc=True).dt.tz_convert(timezone).dt.strftime("%Y%m%d%H")
+    df["sessionDefaultChannelGroup"] = df.get("default_channel_group", "unknown")
+    df["sessionCampaignName"] = df["campaign"].astype(str) if "campaign" in df.columns else df["source_medium"].astype(str)
+    df["purchaseRevenue"] = df["revenue"] if "revenue" in df.columns else 0.0
+    df["ecommercePurchases"] = df["purchases"] if "purchases" in df.columns else 0.0
+    dims, mets = list(GA_DIMENSIONS), list(GA_METRICS)
+    out = df.groupby(dims, as_index=False, observed=True)[mets].sum()
+    return out.sort_values(dims).reset_index(drop=True)
+
+
+class FakeGAServer:
+    """
+    Local stand-in for the GA4 Data API runReport endpoint, serving a GA export (CSV path
+    or DataFrame) for tests and offline benchmarking of the fetcher.
+
+    Supports dateRanges (inclusive dates in `timezone`, the property's reporting time
+    zone), offset/limit paging and rowCount. Faults can be
+    injected: latency_s per request, a 503 on every fail_every-th request, and a 429 with
+    Retry-After whenever more than max_concurrent requests are in flight. Request counts and
+    the peak number of concurrent requests are kept in `stats`.
+    """
+
+    def __init__(
+        self,
+        ga: FrameSource,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_s: float = 0.0,
+        fail_every: int = 0,
+        max_concurrent: int = 0,
+        timezone: str = "UTC",
+    ) -> None:
+        self.rows = _report_rows(read_frame(ga, "ga"), timezone)
+        self.latency_s = float(latency_s)
+        self.fail_every = int(fail_every)
+        self.max_concurrent = int(max_concurrent)
+        self.stats: Dict[str, int] = {"requests": 0, "served": 0, "failed": 0, "throttled": 0, "max_in_flight": 0}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, int(port)), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def report(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        dims = [d["name"] for d in query.get("dimensions", [])]
+        mets = [m["name"] for m in query.get("metrics", [])]
+        unknown = [n for n in dims + mets if n not in self.rows.columns]
+        if unknown:
+            raise ValueError(f"unsupported fields: {unknown}")
+        rows = self.rows
+        for rng in query.get("dateRanges", [])[:1]:
+            start = str(rng["startDate"]).replace("-", "") + "00"
+            end = str(rng["endDate"]).replace("-", "") + "23"
+            rows = rows[(rows["dateHour"] >= start) & (rows["dateHour"] <= end)]
+        if dims != list(GA_DIMENSIONS):
+            rows = rows.groupby(dims, as_index=False, observed=True)[mets].sum() if dims else rows[mets].sum().to_frame().T
+        offset = int(query.get("offset", 0))
+        page = rows.iloc[offset : offset + int(query.get("limit", 10000))]
+        return {
+            "dimensionHeaders": [{"name": n} for n in dims],
+            "metricHeaders": [{"name": n, "type": "TYPE_FLOAT"} for n in mets],
+            "rows": [
+                {
+                    "dimensionValues": [{"value": str(r[n])} for n in dims],
+                    "metricValues": [{"value": repr(float(r[n]))} for n in mets],
+                }
+                for r in page.to_dict("records")
+            ],
+            "rowCount": int(len(rows)),
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, code: int, obj: Any, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                n = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(n)
+                if not _ROUTE.match(self.path):
+                    self._send(404, {"error": f"unknown path {self.path}"})
+                    return
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    seq = fake.stats["requests"]
+                    fake._in_flight += 1
+                    in_flight = fake._in_flight
+                    fake.stats["max_in_flight"] = max(fake.stats["max_in_flight"], in_flight)
+                try:
+                    if fake.max_concurrent and in_flight > fake.max_concurrent:
+                        with fake._lock:
+                            fake.stats["throttled"] += 1
+                        self._send(429, {"error": "rate limited"}, {"Retry-After": "0"})
+                        return
+                    if fake.latency_s:
+                        time.sleep(fake.latency_s)
+                    if fake.fail_every and seq % fake.fail_every == 0:
+                        with fake._lock:
+                            fake.stats["failed"] += 1
+                        self._send(503, {"error": "injected failure"})
+                        return
+                    try:
+                        out = fake.report(json.loads(raw or b"{}"))
+                    except (ValueError, KeyError) as exc:
+                        self._send(400, {"error": str(exc)})
+                        return
+                    with fake._lock:
+                        fake.stats["served"] += 1
+                    self._send(200, out)
+                finally:
+                    with fake._lock:
+                        fake._in_flight -= 1
+
+            def log_message(self, format: str, *args: Any) -> None:
+                return
+
+        return Handler
+
+    def start(self) -> "FakeGAServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeGAServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rollup_cube import rollup_cfg
+
+
+# GA report fields requested per page and their column names in the GA export CSV.
+GA_DIMENSIONS = {
+    "dateHour": "time",
+    "sessionDefaultChannelGroup": "default_channel_group",
+    "sessionCampaignName": "campaign",
+}
+GA_METRICS = {
+    "purchaseRevenue": "revenue",
+    "ecommercePurchases": "purchases",
+}
+_KEYS = list(GA_DIMENSIONS.values())
+_VALUES = list(GA_METRICS.values())
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _default_fetch_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "base_url": None,
+        "property_id": "0",
+        "timezone": "UTC",  # the property's reporting time zone (dateHour is local to it)
+        "token_env": "GA_ACCESS_TOKEN",
+        "lookback_days": None,  # None = fit_window_days + 1
+        "page_size": 10000,
+        "concurrency": 8,
+        "rate_limit_per_s": 10.0,
+        "max_retries": 5,
+        "backoff_s": 0.5,
+        "max_backoff_s": 8.0,
+        "timeout_s": 60.0,
+    }
+
+
+def fetch_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_fetch_cfg()
+    out.update(cfg_run.get("ga_fetch", {}) or {})
+    return out
+
+
+def report_date_range(start_iso: Optional[str], end_iso: Optional[str], cfg_run: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    GA date range (inclusive YYYY-MM-DD, dates in the property time zone) covering
+    [start_iso, end_iso); defaults to the last lookback_days ending today.
+    """
+    tz = str(fetch_cfg(cfg_run)["timezone"])
+    end = (pd.to_datetime(end_iso, utc=True) if end_iso else pd.Timestamp.now(tz="UTC")).tz_convert(tz)
+    if start_iso:
+        start = pd.to_datetime(start_iso, utc=True).tz_convert(tz)
+    else:
+        days = fetch_cfg(cfg_run)["lookback_days"]
+        days = int(days) if days is not None else int(cfg_run.get("fit_window_days", 28)) + 1
+        start = end.normalize() - pd.Timedelta(days=days)
+    if end_iso and end == end.normalize():
+        # end_iso is exclusive; midnight belongs to the previous day.
+        end = end - pd.Timedelta(days=1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def parse_date_hour(values: pd.Series, timezone: str = "UTC") -> pd.Series:
+    """
+    GA dateHour (YYYYMMDDHH in the property's reporting time zone) as UTC timestamps.
+    The hour repeated when clocks go back is read as its first (daylight-saving) occurrence.
+    """
+    t = pd.to_datetime(values, format="%Y%m%d%H")
+    if timezone == "UTC":
+        return t.dt.tz_localize("UTC")
+    local = t.dt.tz_localize(timezone, ambiguous=np.ones(len(t), dtype=bool), nonexistent="shift_forward")
+    return local.dt.tz_convert("UTC")
+
+
+class _RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart (across all workers)."""
+
+    def __init__(self, rate_per_s: float) -> None:
+        self.interval = 1.0 / float(rate_per_s) if rate_per_s and rate_per_s > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+class _PageAggregator:
+    """
+    Folds report pages into sums per (base bucket, channel, campaign) as they arrive, so
+    raw pages are dropped immediately and memory is bounded by the aggregated size.
+    Partials are compacted once their row count outgrows the last compacted size.
+    """
+
+    def __init__(self, base_hours: int, timezone: str = "UTC") -> None:
+        self.base_hours = max(1, int(base_hours))
+        self.timezone = str(timezone)
+        self._parts: List[pd.DataFrame] = []
+        self._pending = 0
+        self._compacted = 0
+        self.rows_in = 0
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        df = pd.DataFrame.from_records(rows, columns=_KEYS + _VALUES)
+        df["time"] = parse_date_hour(df["time"], self.timezone).dt.floor(f"{self.base_hours}h")
+        df[_VALUES] = df[_VALUES].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        self.rows_in += len(df)
+        part = df.groupby(_KEYS, as_index=False, sort=False)[_VALUES].sum()
+        self._parts.append(part)
+        self._pending += len(part)
+        if self._pending > max(4096, 2 * self._compacted):
+            self._compact()
+
+    def _compact(self) -> None:
+        if len(self._parts) > 1:
+            merged = pd.concat(self._parts, ignore_index=True)
+            self._parts = [merged.groupby(_KEYS, as_index=False, sort=False)[_VALUES].sum()]
+        self._compacted = len(self._parts[0]) if self._parts else 0
+        self._pending = self._compacted
+
+    def frame(self) -> pd.DataFrame:
+        self._compact()
+        if not self._parts:
+            return pd.DataFrame(columns=_KEYS + _VALUES)
+        return self._parts[0].sort_values(_KEYS).reset_index(drop=True)
+
+
+def _page_rows(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    dims = [GA_DIMENSIONS[h["name"]] for h in payload.get("dimensionHeaders", [])]
+    mets = [GA_METRICS[h["name"]] for h in payload.get("metricHeaders", [])]
+    out = []
+    for r in payload.get("rows", []) or []:
+        rec = {c: v["value"] for c, v in zip(dims, r.get("dimensionValues", []))}
+        rec.update({c: v["value"] for c, v in zip(mets, r.get("metricValues", []))})
+        out.append(rec)
+    return out
+
+
+class GAReportFetcher:
+    """
+    Pulls a GA runReport (GA4 Data API request/response shape) page by page.
+
+    The first page gives rowCount; the remaining pages are requested concurrently, with
+    at most `concurrency` in flight and request starts spaced by rate_limit_per_s.
+    429/5xx responses and connection errors are retried with jittered exponential backoff
+    (Retry-After is honoured). Each page is handed to on_page as soon as it arrives, in
+    completion order. Blocking HTTP runs on a private thread pool sized to concurrency.
+    """
+
+    def __init__(self, cfg_run: Dict[str, Any], base_url: Optional[str] = None) -> None:
+        self.cfg = fetch_cfg(cfg_run)
+        base_url = base_url or self.cfg["base_url"]
+        if not base_url:
+            raise ValueError("ga_fetch.base_url is not set (run.yaml) and no URL was given.")
+        self.url = f"{str(base_url).rstrip('/')}/v1beta/properties/{self.cfg['property_id']}:runReport"
+        self.page_size = max(1, int(self.cfg["page_size"]))
+        self.concurrency = max(1, int(self.cfg["concurrency"]))
+        token = os.environ.get(str(self.cfg["token_env"] or ""), "")
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.stats: Dict[str, Any] = {}
+
+    def _body(self, start_date: str, end_date: str, offset: int) -> bytes:
+        return json.dumps(
+            {
+                "dateRanges": [{"startDate": start_date, "endDate": end_date}],
+                "dimensions": [{"name": n} for n in GA_DIMENSIONS],
+                "metrics": [{"name": n} for n in GA_METRICS],
+                "offset": int(offset),
+                "limit": self.page_size,
+            }
+        ).encode("utf-8")
+
+    def _post(self, body: bytes) -> Dict[str, Any]:
+        req = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(req, timeout=float(self.cfg["timeout_s"])) as resp:
+            return json.loads(resp.read())
+
+    async def _request(self, pool: ThreadPoolExecutor, sem: asyncio.Semaphore, limiter: _RateLimiter, body: bytes) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        max_retries = int(self.cfg["max_retries"])
+        for attempt in range(max_retries + 1):
+            async with sem:
+                await limiter.wait()
+                self.stats["requests"] += 1
+                self._in_flight += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+                try:
+                    return await loop.run_in_executor(pool, self._post, body)
+                except urllib.error.HTTPError as exc:
+                    if exc.code not in _RETRY_STATUS or attempt == max_retries:
+                        raise RuntimeError(f"GA report request failed: HTTP {exc.code} {exc.reason}") from exc
+                    if exc.code == 429:
+                        self.stats["throttled"] += 1
+                    retry_after = exc.headers.get("Retry-After") if exc.headers else None
+                except (urllib.error.URLError, TimeoutError, ConnectionError) as exc:
+                    if attempt == max_retries:
+                        raise RuntimeError(f"GA report request failed: {exc}") from exc
+                    retry_after = None
+                finally:
+                    self._in_flight -= 1
+            self.stats["retries"] += 1
+            delay = min(float(self.cfg["max_backoff_s"]), float(self.cfg["backoff_s"]) * 2**attempt) * random.uniform(0.5, 1.0)
+            if retry_after is not None:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            await asyncio.sleep(delay)
+        raise RuntimeError("GA report request failed.")  # unreachable
+
+    async def _fetch(self, start_date: str, end_date: str, on_page: Callable[[List[Dict[str, Any]]], None]) -> None:
+        sem = asyncio.Semaphore(self.concurrency)
+        limiter = _RateLimiter(float(self.cfg["rate_limit_per_s"]))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+
+            async def page(offset: int) -> int:
+                payload = await self._request(pool, sem, limiter, self._body(start_date, end_date, offset))
+                rows = _page_rows(payload)
+                on_page(rows)
+                self.stats["pages"] += 1
+                self.stats["rows"] += len(rows)
+                return int(payload.get("rowCount", len(rows)))
+
+            total = await page(0)
+            await asyncio.gather(*(page(off) for off in range(self.page_size, total, self.page_size)))
+
+    def fetch(self, start_date: str, end_date: str, on_page: Callable[[List[Dict[str, Any]]], None]) -> Dict[str, Any]:
+        self.stats = {"pages": 0, "rows": 0, "requests": 0, "retries": 0, "throttled": 0, "max_in_flight": 0}
+        self._in_flight = 0
+        t0 = time.perf_counter()
+        asyncio.run(self._fetch(start_date, end_date, on_page))
+        self.stats["elapsed_s"] = time.perf_counter() - t0
+        return self.stats
+
+
+def fetch_ga_frame(
+    cfg_run: Dict[str, Any],
+    start_iso: Optional[str] = None,
+    end_iso: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Fetches the GA report for [start_iso, end_iso) and returns it in the GA export shape
+    (time, default_channel_group, campaign, revenue, purchases), already summed to the
+    rollup cube's base_hours buckets, plus fetch stats.
+    """
+    start_date, end_date = report_date_range(start_iso, end_iso, cfg_run)
+    agg = _PageAggregator(int(rollup_cfg(cfg_run)["base_hours"]), str(fetch_cfg(cfg_run)["timezone"]))
+    fetcher = GAReportFetcher(cfg_run, base_url)
+    stats = fetcher.fetch(start_date, end_date, agg.add)
+    out = agg.frame()
+    stats["rows_out"] = int(len(out))
+    return out, stats
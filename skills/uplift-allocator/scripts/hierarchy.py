@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from projection import project_capped_simplex
+
+
+POOLED_CAMPAIGN = "__pooled__"
+
+
+def _default_hierarchy_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "level": "audience",
+        "min_info_score": 2.0,
+        "min_members": 2,
+        "share_smoothing": 1.0,
+    }
+
+
+def hierarchy_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_hierarchy_cfg()
+    out.update(cfg_run.get("hierarchy", {}) or {})
+    return out
+
+
+def entity_parts(entity_id: str) -> Tuple[str, str, str]:
+    """
+    Splits an entity id into (channel, audience, campaign).
+    GA ids "ga|<channel>|<campaign>" use audience "ga"; ad ids are "<channel>|<audience>|<campaign>".
+    """
+    parts = str(entity_id).split("|")
+    if len(parts) >= 3 and parts[0].lower() == "ga":
+        return parts[1], "ga", "|".join(parts[2:])
+    if len(parts) >= 3:
+        return parts[0], parts[1], "|".join(parts[2:])
+    if len(parts) == 2:
+        return parts[0], "", parts[1]
+    return parts[0], "", ""
+
+
+def parent_entity_id(entity_id: str, level: str = "audience") -> str:
+    """Pseudo-entity id of the parent a campaign is pooled into (parses like any other entity id)."""
+    channel, audience, _ = entity_parts(entity_id)
+    if audience == "ga":
+        return f"ga|{channel}|{POOLED_CAMPAIGN}"
+    if level == "channel":
+        return f"{channel}|*|{POOLED_CAMPAIGN}"
+    return f"{channel}|{audience}|{POOLED_CAMPAIGN}"
+
+
+def pool_low_info_entities(
+    dfw: pd.DataFrame,
+    info: pd.Series,
+    outcome_col: str,
+    cfg_run: Dict[str, Any],
+) -> Tuple[pd.DataFrame, Dict[str, Dict[str, float]]]:
+    """
+    Collapses entities whose information score is below `hierarchy.min_info_score` into
+    their parent pseudo-entity (rows summed per bucket; proxies averaged).
+    Parents with fewer than `hierarchy.min_members` low-info members are left untouched.
+    Returns the pooled frame and {parent_id: {member_id: smoothed outcome share}}.
+    """
+    h = hierarchy_cfg(cfg_run)
+    if not bool(h["enabled"]) or dfw.empty:
+        return dfw, {}
+
+    low = info[info < float(h["min_info_score"])]
+    if low.empty:
+        return dfw, {}
+
+    level = str(h["level"])
+    parent_of = pd.Series({e: parent_entity_id(e, level) for e in low.index}, dtype=object)
+    counts = parent_of.value_counts()
+    keep_parents = counts[counts >= int(h["min_members"])].index
+    parent_of = parent_of[parent_of.isin(keep_parents)]
+    if parent_of.empty:
+        return dfw, {}
+
+    pooled_mask = dfw["entity_id"].isin(parent_of.index)
+    pooled = dfw[pooled_mask].copy()
+    pooled["parent_id"] = pooled["entity_id"].map(parent_of)
+
+    smoothing = float(h["share_smoothing"])
+    member_outcome = pooled.groupby(["parent_id", "entity_id"], observed=True)[outcome_col].sum() + smoothing
+    member_share = member_outcome / member_outcome.groupby(level=0, observed=True).transform("sum")
+    members: Dict[str, Dict[str, float]] = {}
+    for (parent, member), share in member_share.items():
+        members.setdefault(str(parent), {})[str(member)] = float(share)
+
+    proxy_cols = [c for c in pooled.columns if c.startswith("proxy_")]
+    agg: Dict[str, str] = {c: "sum" for c in ("revenue", "purchases", "spend") if c in pooled.columns}
+    agg.update({c: "mean" for c in proxy_cols})
+    parent_rows = pooled.groupby(["time_bucket_start", "parent_id"], as_index=False, observed=True).agg(agg)
+    parent_rows = parent_rows.rename(columns={"parent_id": "entity_id"})
+
+    out = pd.concat([dfw[~pooled_mask], parent_rows], ignore_index=True, sort=False)
+    return out, members
+
+
+def pooled_prior(
+    parent_id: str,
+    members: Dict[str, float],
+    state_prev: Dict[str, Any],
+    default_mean: float,
+    default_sd: float,
+) -> Tuple[float, float]:
+    """Prior for a parent: its own previous posterior, else the share-weighted members' posteriors."""
+    if parent_id in state_prev:
+        p = state_prev[parent_id]
+        return float(p.get("u_mean", default_mean)), float(p.get("u_sd", default_sd))
+    known = [(w, state_prev[m]) for m, w in members.items() if m in state_prev]
+    if not known:
+        return default_mean, default_sd
+    w_sum = sum(w for w, _ in known)
+    mu = sum(w * float(s.get("u_mean", default_mean)) for w, s in known) / max(1e-12, w_sum)
+    sd = sum(w * float(s.get("u_sd", default_sd)) for w, s in known) / max(1e-12, w_sum)
+    return float(mu), float(sd)
+
+
+def prev_budget_for(entity_id: str, s: Dict[str, Any], prev_map: Dict[str, float]) -> float:
+    """Previous budget of a state entity; pooled parents carry the sum of their members' budgets."""
+    members = s.get("members")
+    if members:
+        return float(sum(float(prev_map.get(m, 0.0)) for m in members))
+    return float(prev_map.get(entity_id, 0.0))
+
+
+def plan_budgets_by_state_entity(plan: Dict[str, Any]) -> Dict[str, float]:
+    """Rolls plan campaign rows back up to model-state entity ids (members -> pooled parent)."""
+    out: Dict[str, float] = {}
+    for c in plan.get("campaigns", []):
+        key = str(c.get("parent_id", c["entity_id"]))
+        out[key] = out.get(key, 0.0) + float(c["recommended_budget"])
+    return out
+
+
+def disaggregate_budget(
+    parent_budget: float,
+    members: Dict[str, float],
+    member_prev: Dict[str, float],
+    member_lo: Dict[str, float],
+    member_hi: Dict[str, float],
+    max_shift: float = float("inf"),
+) -> Dict[str, float]:
+    """
+    Splits a parent budget over its members by smoothed shares.
+    Without previous member budgets the split is the smoothed shares. Otherwise it starts
+    from the previous proportions and moves toward the smoothed shares by at most
+    max_shift in total (the churn left for re-splitting the pool; newly pooled members
+    come in this way). The split is then projected into each member's step/bound window
+    so member rows satisfy the same per-campaign limits as unpooled entities.
+    """
+    ids = list(members.keys())
+    prev = np.array([float(member_prev.get(m, 0.0)) for m in ids])
+    shares = np.array([float(members[m]) for m in ids])
+    prev_total = float(prev.sum())
+    goal = parent_budget * shares / max(1e-12, float(shares.sum()))
+    if prev_total > 1e-9:
+        target = parent_budget * prev / prev_total
+        gap = float(np.abs(goal - target).sum())
+        if gap > 1e-12:
+            target = target + min(1.0, max(0.0, float(max_shift)) / gap) * (goal - target)
+    else:
+        target = goal
+    lo = np.array([float(member_lo[m]) for m in ids])
+    hi = np.array([float(member_hi[m]) for m in ids])
+    x = project_capped_simplex(target, lo, hi, float(parent_budget))
+    return {m: float(b) for m, b in zip(ids, x)}
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+def _default_history_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "path": "history.sqlite",
+        "keep_days": None,
+        "busy_timeout_ms": 5000,
+    }
+
+
+def history_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_history_cfg()
+    out.update(cfg_run.get("history", {}) or {})
+    return out
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_ts TEXT NOT NULL,
+    data_ts TEXT,
+    command TEXT,
+    horizon TEXT,
+    budget_total REAL,
+    budget_allocated REAL,
+    churn REAL,
+    hard_fail INTEGER,
+    n_entities INTEGER,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_run_ts ON runs (run_ts);
+CREATE INDEX IF NOT EXISTS runs_data_ts ON runs (data_ts);
+
+CREATE TABLE IF NOT EXISTS entity_state (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    run_ts TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    u_mean REAL,
+    u_sd REAL,
+    p_u_gt_u_min REAL,
+    info_score_I REAL,
+    proxies_on INTEGER,
+    curve_a REAL,
+    curve_theta REAL,
+    members TEXT,
+    PRIMARY KEY (run_id, entity_id)
+);
+CREATE INDEX IF NOT EXISTS entity_state_entity_ts ON entity_state (entity_id, run_ts);
+
+CREATE TABLE IF NOT EXISTS plan_rows (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    run_ts TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    parent_id TEXT,
+    recommended_budget REAL,
+    previous_budget REAL,
+    gate_status TEXT,
+    binding_constraints TEXT,
+    PRIMARY KEY (run_id, entity_id)
+);
+CREATE INDEX IF NOT EXISTS plan_rows_entity_ts ON plan_rows (entity_id, run_ts);
+CREATE INDEX IF NOT EXISTS plan_rows_parent_ts ON plan_rows (parent_id, run_ts);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    run_ts TEXT NOT NULL,
+    type TEXT,
+    severity TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_run ON alerts (run_id);
+CREATE INDEX IF NOT EXISTS alerts_type_ts ON alerts (type, run_ts);
+"""
+
+
+# Upper bound for open-ended time ranges; sorts after any ISO-8601 timestamp.
+_MAX_TS = "9999"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class HistoryStore:
+    """
+    Append-only run history in one SQLite file (WAL mode).
+
+    Every recorded run appends its per-entity model state, plan rows and alerts under a
+    new run_id, indexed by run timestamp and entity, so "how did this campaign evolve"
+    and "what did we know at time T" are index lookups instead of parsing file copies.
+    WAL lets readers (verify, reporting, a resident server) query while a run writes; a
+    run is one transaction, so readers see either all of it or none of it.
+    Timestamps are ISO-8601 UTC strings, which order correctly as text. With keep_days,
+    each recorded run also prunes runs older than keep_days before it.
+    """
+
+    def __init__(self, path: Path, readonly: bool = False, busy_timeout_ms: int = 5000, keep_days: Optional[float] = None) -> None:
+        self.path = Path(path)
+        self.readonly = readonly
+        self.keep_days = None if keep_days is None else float(keep_days)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=busy_timeout_ms / 1000.0)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=busy_timeout_ms / 1000.0)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+        self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+
+    @classmethod
+    def from_cfg(cls, art_dir: Path, cfg_run: Dict[str, Any], readonly: bool = False) -> "HistoryStore":
+        h = history_cfg(cfg_run)
+        return cls(
+            Path(art_dir) / str(h["path"]),
+            readonly=readonly,
+            busy_timeout_ms=int(h["busy_timeout_ms"]),
+            keep_days=h.get("keep_days"),
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    # ---- writes ----------------------------------------------------------
+
+    def record_run(
+        self,
+        model_state: Optional[Dict[str, Any]],
+        plan: Optional[Dict[str, Any]],
+        alerts: Optional[Dict[str, Any]],
+        command: str = "run",
+        run_ts: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Appends one run in a single transaction (pruning runs older than keep_days before
+        it) and returns its run_id.
+        """
+        model_state = model_state or {}
+        plan = plan or {}
+        alerts = alerts or {}
+        run_ts = run_ts or _now_iso()
+        totals = plan.get("totals", {})
+        entities = model_state.get("entities", {})
+        campaigns = plan.get("campaigns", [])
+
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (run_ts, data_ts, command, horizon, budget_total, budget_allocated, churn, hard_fail, n_entities, meta)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_ts,
+                    model_state.get("updated_at"),
+                    command,
+                    plan.get("run", {}).get("horizon"),
+                    totals.get("budget_total"),
+                    totals.get("budget_allocated", sum(float(c["recommended_budget"]) for c in campaigns)),
+                    totals.get("churn"),
+                    int(bool(alerts.get("hard_fail", False))),
+                    len(entities),
+                    json.dumps(meta or {}),
+                ),
+            )
+            run_id = int(cur.lastrowid)
+            self.conn.executemany(
+                "INSERT INTO entity_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        run_ts,
+                        ent_id,
+                        s.get("u_mean"),
+                        s.get("u_sd"),
+                        s.get("p_u_gt_u_min"),
+                        s.get("info_score_I"),
+                        int(bool(s.get("proxies_on", False))),
+                        (s.get("curve") or {}).get("a"),
+                        (s.get("curve") or {}).get("theta"),
+                        json.dumps(s["members"]) if s.get("members") else None,
+                    )
+                    for ent_id, s in entities.items()
+                ],
+            )
+            self.conn.executemany(
+                "INSERT INTO plan_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        run_ts,
+                        c["entity_id"],
+                        c.get("parent_id"),
+                        c.get("recommended_budget"),
+                        c.get("previous_budget"),
+                        c.get("gate_status"),
+                        json.dumps(c.get("binding_constraints", [])),
+                    )
+                    for c in campaigns
+                ],
+            )
+            self.conn.executemany(
+                "INSERT INTO alerts VALUES (?, ?, ?, ?, ?)",
+                [(run_id, run_ts, a.get("type"), a.get("severity"), a.get("detail")) for a in alerts.get("alerts", [])],
+            )
+            if self.keep_days is not None:
+                self._prune((pd.Timestamp(run_ts) - pd.Timedelta(days=self.keep_days)).isoformat())
+        return run_id
+
+    def _prune(self, before: str) -> int:
+        """Deletes runs (and their rows) with run_ts < before; returns the number of runs."""
+        for table in ("entity_state", "plan_rows", "alerts"):
+            self.conn.execute(f"DELETE FROM {table} WHERE run_ts < ?", (before,))
+        return int(self.conn.execute("DELETE FROM runs WHERE run_ts < ?", (before,)).rowcount)
+
+    # ---- queries ---------------------------------------------------------
+
+    def runs(self, since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+        """Run summaries with since <= run_ts <= until, oldest first."""
+        return pd.read_sql_query(
+            "SELECT * FROM runs WHERE run_ts >= ? AND run_ts <= ? ORDER BY run_ts, run_id",
+            self.conn,
+            params=(since or "", until or _MAX_TS),
+        )
+
+    def entity_history(self, entity_id: str, since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+        """
+        One row per run that touched the entity: posterior (own, or its pooled parent's)
+        and plan row side by side. Matches plan rows by entity_id or parent_id, so a pooled
+        parent's history lists its members' budgets.
+        """
+        q = """
+            SELECT r.run_id, r.run_ts, r.data_ts, p.entity_id AS plan_entity_id, p.parent_id,
+                   p.recommended_budget, p.previous_budget, p.gate_status, p.binding_constraints,
+                   s.u_mean, s.u_sd, s.p_u_gt_u_min, s.info_score_I, s.proxies_on, s.curve_a, s.curve_theta
+            FROM runs r
+            LEFT JOIN plan_rows p ON p.run_id = r.run_id AND (p.entity_id = :e OR p.parent_id = :e)
+            LEFT JOIN entity_state s ON s.run_id = r.run_id AND s.entity_id = COALESCE(p.parent_id, p.entity_id, :e)
+            WHERE r.run_ts >= :since AND r.run_ts <= :until
+              AND (p.entity_id IS NOT NULL OR s.entity_id IS NOT NULL)
+            ORDER BY r.run_ts, r.run_id, p.entity_id
+        """
+        df = pd.read_sql_query(q, self.conn, params={"e": entity_id, "since": since or "", "until": until or _MAX_TS})
+        df["binding_constraints"] = df["binding_constraints"].map(lambda x: json.loads(x) if isinstance(x, str) else [])
+        return df
+
+    def run_at(self, ts: str) -> Optional[int]:
+        """run_id of the latest run recorded at or before ts."""
+        row = self.conn.execute("SELECT run_id FROM runs WHERE run_ts <= ? ORDER BY run_ts DESC, run_id DESC LIMIT 1", (ts,)).fetchone()
+        return int(row[0]) if row else None
+
+    def as_of(self, ts: str) -> Optional[Dict[str, Any]]:
+        """
+        Time travel: the model state, plan rows and alerts of the latest run at or before ts,
+        shaped like model_state.json / allocation_plan.json / alerts.json.
+        """
+        run_id = self.run_at(ts)
+        if run_id is None:
+            return None
+        self.conn.row_factory = sqlite3.Row
+        try:
+            run = dict(self.conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone())
+            entities: Dict[str, Any] = {}
+            for r in self.conn.execute("SELECT * FROM entity_state WHERE run_id = ?", (run_id,)):
+                s = {
+                    "u_mean": r["u_mean"],
+                    "u_sd": r["u_sd"],
+                    "p_u_gt_u_min": r["p_u_gt_u_min"],
+                    "info_score_I": r["info_score_I"],
+                    "proxies_on": bool(r["proxies_on"]),
+                    "curve": {"a": r["curve_a"], "theta": r["curve_theta"]},
+                }
+                if r["members"]:
+                    s["members"] = json.loads(r["members"])
+                entities[r["entity_id"]] = s
+            campaigns: List[Dict[str, Any]] = []
+            for r in self.conn.execute("SELECT * FROM plan_rows WHERE run_id = ? ORDER BY rowid", (run_id,)):
+                c = {
+                    "entity_id": r["entity_id"],
+                    "recommended_budget": r["recommended_budget"],
+                    "previous_budget": r["previous_budget"],
+                    "gate_status": r["gate_status"],
+                    "binding_constraints": json.loads(r["binding_constraints"] or "[]"),
+                }
+                if r["parent_id"]:
+                    c["parent_id"] = r["parent_id"]
+                campaigns.append(c)
+            alerts = [
+                {"type": r["type"], "severity": r["severity"], "detail": r["detail"]}
+                for r in self.conn.execute("SELECT * FROM alerts WHERE run_id = ? ORDER BY rowid", (run_id,))
+            ]
+        finally:
+            self.conn.row_factory = None
+        return {
+            "run": run,
+            "model_state": {"updated_at": run["data_ts"], "entities": entities},
+            "allocation_plan": {
+                "run": {"horizon": run["horizon"]},
+                "totals": {"budget_total": run["budget_total"], "budget_allocated": run["budget_allocated"], "churn": run["churn"]},
+                "campaigns": campaigns,
+            },
+            "alerts": {"hard_fail": bool(run["hard_fail"]), "alerts": alerts},
+        }
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Fixed prior used when no hyperprior applies (cold start, unknown channel).
+DEFAULT_U_MEAN = 0.02
+DEFAULT_U_SD = 0.03
+
+
+def _default_hyperprior_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "levels": ["channel"],
+        "min_entities": 3,
+        "shrinkage_entities": 5.0,
+        "sd_floor": 0.005,
+        "sparse_info_score": 2.0,
+    }
+
+
+def hyperprior_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_hyperprior_cfg()
+    out.update(cfg_run.get("hyperpriors", {}) or {})
+    levels = out.get("levels") or []
+    out["levels"] = [levels] if isinstance(levels, str) else list(levels)
+    bad = [lv for lv in out["levels"] if lv not in ("channel", "audience")]
+    if bad:
+        raise ValueError(f"hyperpriors.levels must be channel and/or audience, got {bad}")
+    return out
+
+
+def _group_keys(ids) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized hierarchy.entity_parts: channel key and channel|audience key per entity id."""
+    parts = pd.Series(list(ids), dtype=object).astype(str).str.split("|", n=2, expand=True)
+    for j in range(parts.shape[1], 3):
+        parts[j] = None
+    ga = parts[2].notna() & (parts[0].str.lower() == "ga")
+    channel = np.where(ga, parts[1], parts[0]).astype(object)
+    audience = np.where(ga, "ga", parts[1].where(parts[2].notna(), "").fillna("")).astype(object)
+    return channel, (pd.Series(channel, dtype=object) + "|" + pd.Series(audience, dtype=object)).to_numpy(dtype=object)
+
+
+def _moments(key: np.ndarray, m: np.ndarray, se2: np.ndarray, tau2_floor: float) -> pd.DataFrame:
+    """
+    Normal-normal method of moments per group: between-entity variance
+    tau2 = var(u_mean) - mean(u_sd^2) (floored), then the precision-weighted mean with
+    weights 1 / (u_sd^2 + tau2).
+    """
+    f = pd.DataFrame({"key": key, "m": m, "m2": m * m, "se2": se2})
+    g = f.groupby("key", sort=True)
+    first = g[["m", "m2", "se2"]].mean()
+    tau2 = np.maximum(tau2_floor, first["m2"] - first["m"] ** 2 - first["se2"])
+    w = 1.0 / (f["se2"].to_numpy() + tau2.reindex(f["key"]).to_numpy())
+    sums = pd.DataFrame({"key": key, "w": w, "wm": w * m}).groupby("key", sort=True)[["w", "wm"]].sum()
+    return pd.DataFrame({"n": g.size(), "u_mean": sums["wm"] / sums["w"], "tau2": tau2})
+
+
+def _shrink(groups: pd.DataFrame, parent_mean: pd.Series, parent_tau2: pd.Series, k: float) -> pd.DataFrame:
+    # Small groups lean on their parent level (k pseudo-entities at the parent's moments).
+    n = groups["n"].to_numpy(dtype=float)
+    wt = n / (n + k)
+    out = groups.copy()
+    out["u_mean"] = wt * groups["u_mean"].to_numpy() + (1.0 - wt) * parent_mean.to_numpy()
+    out["tau2"] = wt * groups["tau2"].to_numpy() + (1.0 - wt) * parent_tau2.to_numpy()
+    return out
+
+
+def _as_dict(frame: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    # Prior sd covers the spread of entities within the group plus the error of its mean.
+    sd = np.sqrt(frame["tau2"] * (1.0 + 1.0 / frame["n"]))
+    return {
+        str(k): {"u_mean": float(mu), "u_sd": float(s), "n": int(n)}
+        for k, mu, s, n in zip(frame.index, frame["u_mean"], sd, frame["n"])
+    }
+
+
+def estimate_hyperpriors(
+    ent_ids,
+    u_mean: np.ndarray,
+    u_sd: np.ndarray,
+    cfg_run: Dict[str, Any],
+    mask: Optional[np.ndarray] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Empirical-Bayes priors from every entity's posterior in one grouped pass: a global
+    prior, then per channel (and per channel|audience) shrunk toward the level above.
+    Groups with fewer than min_entities entities are left out, so lookups for their
+    entities (new or sparse alike) fall back a level, ultimately to the global prior.
+    Entities where mask is False (e.g. pooled parents) are ignored.
+    Returns None when there are too few entities.
+    """
+    h_cfg = hyperprior_cfg(cfg_run)
+    ids = np.asarray(list(ent_ids), dtype=object)
+    m = np.asarray(u_mean, dtype=float)
+    se2 = np.asarray(u_sd, dtype=float) ** 2
+    keep = np.isfinite(m) & np.isfinite(se2)
+    if mask is not None:
+        keep &= np.asarray(mask, dtype=bool)
+    ids, m, se2 = ids[keep], m[keep], se2[keep]
+    min_n = max(1, int(h_cfg["min_entities"]))
+    if len(ids) < min_n:
+        return None
+
+    tau2_floor = float(h_cfg["sd_floor"]) ** 2
+    k = max(0.0, float(h_cfg["shrinkage_entities"]))
+    channel, audience = _group_keys(ids)
+    glob = _moments(np.full(len(ids), "*", dtype=object), m, se2, tau2_floor)
+    out: Dict[str, Any] = {"global": _as_dict(glob)["*"]}
+
+    ch = _moments(channel, m, se2, tau2_floor)
+    ch = _shrink(ch, pd.Series(glob.at["*", "u_mean"], index=ch.index), pd.Series(glob.at["*", "tau2"], index=ch.index), k)
+    if "channel" in h_cfg["levels"]:
+        out["channel"] = _as_dict(ch[ch["n"] >= min_n])
+    if "audience" in h_cfg["levels"]:
+        au = _moments(audience, m, se2, tau2_floor)
+        parent = pd.Series(au.index, index=au.index).str.split("|", n=1).str[0]
+        au = _shrink(au, ch["u_mean"].reindex(parent).set_axis(au.index), ch["tau2"].reindex(parent).set_axis(au.index), k)
+        out["audience"] = _as_dict(au[au["n"] >= min_n])
+    return out
+
+
+def hyperprior_arrays(ent_ids, hyperpriors: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Prior (u_mean, u_sd) per entity: the most specific hyperprior available, else the
+    global pooled hyperprior; the fixed prior only when there are no hyperpriors at all.
+    """
+    n = len(ent_ids)
+    mu = np.full(n, DEFAULT_U_MEAN)
+    sd = np.full(n, DEFAULT_U_SD)
+    if not hyperpriors or n == 0:
+        return mu, sd
+    g = hyperpriors.get("global") or {}
+    mu[:] = float(g.get("u_mean", DEFAULT_U_MEAN))
+    sd[:] = float(g.get("u_sd", DEFAULT_U_SD))
+    channel, audience = _group_keys(ent_ids)
+    for level, key in (("channel", channel), ("audience", audience)):
+        table = hyperpriors.get(level) or {}
+        if not table:
+            continue
+        frame = pd.DataFrame.from_dict(table, orient="index")
+        pos = frame.index.get_indexer(pd.Index(key))
+        hit = pos >= 0
+        mu[hit] = frame["u_mean"].to_numpy(dtype=float)[pos[hit]]
+        sd[hit] = frame["u_sd"].to_numpy(dtype=float)[pos[hit]]
+    return mu, sd
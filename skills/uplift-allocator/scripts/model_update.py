@@ -6,10 +6,100 @@ import numpy as np
 import pandas as pd
 from math import erf, sqrt
 
+from skill_io import read_frame
+from hierarchy import pool_low_info_entities, pooled_prior
+from hyperprior import estimate_hyperpriors, hyperprior_arrays, hyperprior_cfg
+from curve_fit import curve_fit_cfg, fit_saturation_curves, summarize_fit
+from channel_policy import paid_mask, parse_channel_from_entity, pushdown_cfg
+from quantile_sketch import sketch_cfg, update_sketch_state, windowed_medians
+from response_curve import saturation
 
-def _sat(b: float, a: float, theta: float) -> float:
-    b = max(0.0, float(b))
-    return (b**a) / (b**a + theta**a + 1e-12)
+
+def _entity_curves(
+    dfw: pd.DataFrame,
+    ent_ids: list,
+    outcome_col: str,
+    state_prev: Dict[str, Any],
+    a_default: float,
+    theta_default: float,
+    cfg_run: Dict[str, Any],
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any] | None]:
+    cfg = curve_fit_cfg(cfg_run)
+    if not bool(cfg["enabled"]) or not ent_ids:
+        return {e: {"a": a_default, "theta": theta_default} for e in ent_ids}, None
+
+    keys = [dfw["entity_id"], dfw["time_bucket_start"]]
+    spend = dfw["spend"].groupby(keys, observed=True).sum().unstack().reindex(ent_ids).to_numpy(dtype=float)
+    y = dfw[outcome_col].groupby(keys, observed=True).sum().unstack().reindex(ent_ids).to_numpy(dtype=float)
+    channels = np.array([parse_channel_from_entity(e) for e in ent_ids], dtype=object)
+
+    # Warm start from the previous unshrunk fit (falls back to the stored curve).
+    prev_curves = [state_prev.get(e, {}).get("curve") or {} for e in ent_ids]
+    warm = np.array([bool(c) for c in prev_curves])
+    a_init = np.array([float(c.get("a_raw", c.get("a", a_default))) for c in prev_curves])
+    theta_init = np.array([float(c.get("theta_raw", c.get("theta", theta_default))) for c in prev_curves])
+
+    fit = fit_saturation_curves(spend, y, channels, a_init, theta_init, warm, a_default, theta_default, cfg)
+    curves: Dict[str, Dict[str, Any]] = {}
+    for i, e in enumerate(ent_ids):
+        r2 = float(fit["r2"][i])
+        curves[e] = {
+            "a": float(fit["a"][i]),
+            "theta": float(fit["theta"][i]),
+            "a_raw": float(fit["a_raw"][i]),
+            "theta_raw": float(fit["theta_raw"][i]),
+            "source": str(fit["source"][i]),
+            "fit_r2": r2 if np.isfinite(r2) else None,
+            "fit_iterations": int(fit["iterations"][i]),
+        }
+    return curves, summarize_fit(fit, warm)
+
+
+def _grid_posterior(
+    mu0: np.ndarray,
+    sd0: np.ndarray,
+    base: np.ndarray,
+    m: np.ndarray,
+    y: np.ndarray,
+    proxies_on: np.ndarray,
+    proxies: Dict[str, np.ndarray],
+    proxy_catalog: Dict[str, Any],
+    tau_w: float,
+    chunk: int = 2048,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Posterior mean/sd of u on a fixed grid for all entities, evaluated as (entities x grid)
+    blocks of at most `chunk` entities to bound memory:
+      prior N(mu0, sd0^2) x Poisson-style outcome likelihood at lam = base + u * g(spend)
+      x proxy likelihoods N(p | u, sigma^2) for entities whose proxy gate is on.
+    """
+    grid = np.linspace(0.0, 0.25, 501)
+    mu_post = np.empty(mu0.shape[0])
+    sd_post = np.empty(mu0.shape[0])
+    for lo in range(0, mu0.shape[0], chunk):
+        sl = slice(lo, lo + chunk)
+        logp = -0.5 * ((grid[None, :] - mu0[sl, None]) ** 2) / (sd0[sl, None] ** 2 + 1e-12)
+
+        lam = np.clip(base[sl, None] + grid[None, :] * m[sl, None], 1e-9, None)
+        logp += y[sl, None] * np.log(lam) - lam
+
+        w = 1.0
+        for name, p_val in proxies.items():
+            on = proxies_on[sl] & ~np.isnan(p_val[sl])
+            if not on.any():
+                continue
+            sigma = float(proxy_catalog[name].get("sigma", 3.0))
+            ll = -0.5 * ((p_val[sl, None] - w * grid[None, :]) ** 2) / (sigma**2 + 1e-12) - 0.5 * (w**2) / (tau_w**2 + 1e-12)
+            logp += np.where(on[:, None], ll, 0.0)
+
+        logp -= np.max(logp, axis=1, keepdims=True)
+        wts = np.exp(logp)
+        wts /= np.sum(wts, axis=1, keepdims=True) + 1e-12
+        mu_c = wts @ grid
+        var_c = np.sum((grid[None, :] - mu_c[:, None]) ** 2 * wts, axis=1)
+        mu_post[sl] = mu_c
+        sd_post[sl] = np.sqrt(np.maximum(var_c, 1e-12))
+    return mu_post, sd_post
 
 
 def update_model_state(
@@ -18,7 +108,7 @@ def update_model_state(
     proxy_catalog: Dict[str, Any],
     cfg_run: Dict[str, Any],
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    df = pd.read_csv(unified_path)
+    df = read_frame(unified_path, "unified", ["time_bucket_start", "revenue", "purchases", "spend"])
     if df.empty:
         return {"updated_at": None, "entities": {}}, {
             "outcome_col": "revenue",
@@ -27,8 +117,6 @@ def update_model_state(
             "last_bucket": None,
         }
 
-    df["time_bucket_start"] = pd.to_datetime(df["time_bucket_start"], utc=True)
-
     fit_days = int(cfg_run["fit_window_days"])
     end_t = df["time_bucket_start"].max()
     start_t = end_t - pd.Timedelta(days=fit_days)
@@ -41,7 +129,47 @@ def update_model_state(
     I_min_pur = int(cfg_run["I_min_purchases_sum"])
 
     a = 0.8
-    theta = max(50.0, float(dfw["spend"].median() + 1e-9))
+    # With sketches on, medians come from panes carried in state; only panes whose rows
+    # changed are rebuilt.
+    sketches = None
+    entity_medians = None
+    if bool(sketch_cfg(cfg_run)["enabled"]):
+        sketches = update_sketch_state(prev_state.get("sketches"), dfw, outcome_col, start_t, cfg_run)
+        sketch_ingested = int(sketches.pop("ingested_buckets"))
+        spend_median, entity_medians = windowed_medians(sketches)
+        theta = max(50.0, float(spend_median + 1e-9))
+    else:
+        theta = max(50.0, float(dfw["spend"].median() + 1e-9))
+
+    # Outcome choice and default theta above come from all rows; only posteriors are pushed down.
+    p_cfg = pushdown_cfg(cfg_run)
+    n_unpaid_skipped = 0
+    if bool(p_cfg["enabled"]):
+        mode = str(p_cfg["model"])
+        if mode not in ("skip", "keep"):
+            raise ValueError(f"paid_pushdown.model must be 'skip' or 'keep', got {mode!r}")
+        if mode == "skip":
+            paid = paid_mask(dfw, cfg_run)
+            n_unpaid_skipped = int(dfw.loc[~paid, "entity_id"].nunique())
+            dfw = dfw[paid]
+            if dfw.empty:
+                empty_state: Dict[str, Any] = {"updated_at": None, "entities": {}}
+                if sketches is not None:
+                    empty_state["sketches"] = sketches
+                return empty_state, {
+                    "outcome_col": outcome_col,
+                    "fit_window_days": fit_days,
+                    "n_entities": 0,
+                    "n_unpaid_skipped": n_unpaid_skipped,
+                    "last_bucket": None,
+                }
+
+    # Low-information campaigns are modeled (and later solved) at parent level.
+    if use_revenue:
+        info = (dfw["revenue"] > 0).groupby(dfw["entity_id"], observed=True).sum()
+    else:
+        info = dfw["purchases"].groupby(dfw["entity_id"], observed=True).sum()
+    dfw, pooled_members = pool_low_info_entities(dfw, info, outcome_col, cfg_run)
 
     state_prev = prev_state.get("entities", {})
     u_min = float(cfg_run["u_min"])
@@ -53,79 +181,112 @@ def update_model_state(
     min_update_weight = float(smooth_cfg.get("min_update_weight", 0.20))
     info_for_full_update = float(smooth_cfg.get("info_for_full_update", 12.0))
 
-    entities_out: Dict[str, Any] = {}
+    ent_ids = sorted(dfw["entity_id"].unique())
+    curves, curve_diag = _entity_curves(dfw, ent_ids, outcome_col, state_prev, a, theta, cfg_run)
 
-    for ent_id in sorted(dfw["entity_id"].unique()):
-        prior = state_prev.get(ent_id, {})
-        mu0 = float(prior.get("u_mean", 0.02))
-        sd0 = float(prior.get("u_sd", 0.03))
-        var0 = sd0 * sd0
-
-        dwe = dfw[dfw["entity_id"] == ent_id]
-        d_tail = dwe.sort_values("time_bucket_start").tail(max(1, smoothing_buckets))
-        spend = float(d_tail["spend"].mean())
-        y = float(d_tail[outcome_col].mean())
-        if use_revenue:
-            I = int((dwe["revenue"] > 0).sum())
-            proxies_on = I < I_min_rev
-        else:
-            I = float(dwe["purchases"].sum())
-            proxies_on = I < I_min_pur
-
-        m = _sat(spend, a, theta)
-        base = float(dwe[outcome_col].median())
-
-        grid = np.linspace(0.0, 0.25, 501)
-        prior_ll = -0.5 * ((grid - mu0) ** 2) / (var0 + 1e-12)
-
-        lam = np.clip(base + grid * m, 1e-9, None)
-        ll_y = y * np.log(lam) - lam
-
-        ll_p = 0.0
-        if proxies_on:
-            proxy_cols = [c for c in d_tail.columns if c.startswith("proxy_")]
-            proxies = {c: float(d_tail[c].mean()) for c in proxy_cols}
-            for name, p_val in proxies.items():
-                if name not in proxy_catalog or np.isnan(p_val):
-                    continue
-                sigma = float(proxy_catalog[name].get("sigma", 3.0))
-                w = 1.0
-                ll_p += -0.5 * ((p_val - w * grid) ** 2) / (sigma**2 + 1e-12)
-                ll_p += -0.5 * (w**2) / (tau_w**2 + 1e-12)
-
-        logp = prior_ll + ll_y + ll_p
-        logp = logp - np.max(logp)
-        wts = np.exp(logp)
-        wts = wts / (np.sum(wts) + 1e-12)
+    # Entities without a posterior of their own start from last run's channel/audience
+    # hyperprior; sparse ones (little information behind their posterior) lean toward it.
+    h_cfg = hyperprior_cfg(cfg_run)
+    h_on = bool(h_cfg["enabled"])
+    hp_mu, hp_sd = hyperprior_arrays(ent_ids, prev_state.get("hyperpriors") if h_on else None)
+    sparse_info = float(h_cfg["sparse_info_score"]) if h_on else 0.0
+    mu0 = np.empty(len(ent_ids))
+    sd0 = np.empty(len(ent_ids))
+    n_hyperprior = 0
+    for i, ent_id in enumerate(ent_ids):
+        if ent_id in pooled_members:
+            mu0[i], sd0[i] = pooled_prior(ent_id, pooled_members[ent_id], state_prev, hp_mu[i], hp_sd[i])
+            continue
+        prior = state_prev.get(ent_id)
+        if prior is None:
+            mu0[i], sd0[i] = hp_mu[i], hp_sd[i]
+            n_hyperprior += int(h_on)
+            continue
+        mu0[i] = float(prior.get("u_mean", hp_mu[i]))
+        sd0[i] = float(prior.get("u_sd", hp_sd[i]))
+        prev_info = float(prior.get("info_score_I", sparse_info))
+        if prev_info < sparse_info:
+            r = max(0.0, prev_info) / sparse_info
+            mu0[i] = r * mu0[i] + (1.0 - r) * hp_mu[i]
+            sd0[i] = sqrt(r * sd0[i] ** 2 + (1.0 - r) * hp_sd[i] ** 2)
+            n_hyperprior += 1
 
-        mu_post = float(np.sum(grid * wts))
-        var_post = float(np.sum((grid - mu_post) ** 2 * wts))
-        sd_post = float(np.sqrt(max(var_post, 1e-12)))
+    # Per-entity aggregates in grouped passes (tail = last smoothing_buckets buckets).
+    by_ent = dfw.groupby("entity_id", sort=True, observed=True)
+    d_tail = dfw.sort_values("time_bucket_start", kind="stable").groupby("entity_id", observed=True).tail(max(1, smoothing_buckets))
+    tail_mean = d_tail.groupby("entity_id", observed=True).mean(numeric_only=True).reindex(ent_ids)
+    spend = tail_mean["spend"].to_numpy(dtype=float)
+    y = tail_mean[outcome_col].to_numpy(dtype=float)
+    if entity_medians is not None:
+        base_s = entity_medians.reindex(ent_ids)
+        missing = base_s.index[base_s.isna()]
+        if len(missing):
+            # Pooled parents are not sketched (membership changes run to run).
+            rows = dfw[dfw["entity_id"].isin(missing)]
+            base_s[missing] = rows.groupby("entity_id", observed=True)[outcome_col].median().reindex(missing)
+        base = base_s.to_numpy(dtype=float)
+    else:
+        base = by_ent[outcome_col].median().reindex(ent_ids).to_numpy(dtype=float)
+    if use_revenue:
+        I = (dfw["revenue"] > 0).groupby(dfw["entity_id"], observed=True).sum().reindex(ent_ids).to_numpy(dtype=float)
+        proxies_on = I < I_min_rev
+    else:
+        I = by_ent["purchases"].sum().reindex(ent_ids).to_numpy(dtype=float)
+        proxies_on = I < I_min_pur
 
-        info_ratio = float(np.clip(float(I) / max(1e-9, info_for_full_update), 0.0, 1.0))
-        blend = max(min_update_weight, info_ratio)
-        mu = float((1.0 - blend) * mu0 + blend * mu_post)
-        sd = float(max(sd_post, (1.0 - blend) * sd0))
+    # Last bucket with any spend or outcome (state_tiers moves entities idle since to cold storage).
+    active = dfw[(dfw["spend"] > 0) | (dfw[outcome_col] > 0)]
+    last_active = active.groupby("entity_id", observed=True)["time_bucket_start"].max().reindex(ent_ids)
 
-        z = (u_min - mu) / (sd + 1e-12)
-        p_gt = float(np.clip(0.5 * (1.0 - erf(z / sqrt(2.0))), 0.0, 1.0))
+    m = saturation(spend, np.array([c["a"] for c in curves.values()]), np.array([c["theta"] for c in curves.values()]))
+    proxies = {
+        c: tail_mean[c].to_numpy(dtype=float)
+        for c in tail_mean.columns
+        if c.startswith("proxy_") and c in proxy_catalog
+    }
+    mu_post, sd_post = _grid_posterior(mu0, sd0, base, m, y, proxies_on, proxies, proxy_catalog, tau_w)
 
+    info_ratio = np.clip(I / max(1e-9, info_for_full_update), 0.0, 1.0)
+    blend = np.maximum(min_update_weight, info_ratio)
+    mu = (1.0 - blend) * mu0 + blend * mu_post
+    sd = np.maximum(sd_post, (1.0 - blend) * sd0)
+    z = (u_min - mu) / (sd + 1e-12)
+
+    entities_out: Dict[str, Any] = {}
+    for i, ent_id in enumerate(ent_ids):
+        p_gt = float(np.clip(0.5 * (1.0 - erf(float(z[i]) / sqrt(2.0))), 0.0, 1.0))
         entities_out[ent_id] = {
-            "u_mean": mu,
-            "u_sd": sd,
+            "u_mean": float(mu[i]),
+            "u_sd": float(sd[i]),
             "p_u_gt_u_min": p_gt,
-            "proxies_on": bool(proxies_on),
-            "info_score_I": float(I),
+            "proxies_on": bool(proxies_on[i]),
+            "info_score_I": float(I[i]),
             "outcome_col": outcome_col,
-            "curve": {"a": a, "theta": theta},
+            "curve": curves[ent_id],
             "last_bucket": str(last_bucket),
+            "last_active": str(last_active.iloc[i]) if pd.notna(last_active.iloc[i]) else None,
         }
+        if ent_id in pooled_members:
+            entities_out[ent_id]["members"] = pooled_members[ent_id]
 
     state = {"updated_at": str(last_bucket), "entities": entities_out}
+    if sketches is not None:
+        state["sketches"] = sketches
+    if h_on:
+        # Pooled parents aggregate many campaigns; only campaign-level posteriors inform the prior.
+        hyperpriors = estimate_hyperpriors(ent_ids, mu, sd, cfg_run, mask=[e not in pooled_members for e in ent_ids])
+        if hyperpriors is not None:
+            state["hyperpriors"] = hyperpriors
     diag = {
         "outcome_col": outcome_col,
         "fit_window_days": fit_days,
         "n_entities": len(entities_out),
+        "n_unpaid_skipped": n_unpaid_skipped,
+        "n_pooled_parents": len(pooled_members),
+        "n_pooled_members": int(sum(len(m) for m in pooled_members.values())),
+        "curve_fit": curve_diag,
+        "sketch_buckets_ingested": sketch_ingested if sketches is not None else None,
+        "n_hyperprior_priors": n_hyperprior if h_on else None,
         "last_bucket": str(last_bucket),
     }
     return state, diag
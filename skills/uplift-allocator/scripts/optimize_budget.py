@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Tuple
+import math
+from typing import Callable, Dict, Any, List, Tuple
+
+import numpy as np
 
 from allocate import solve_allocation
 from channel_policy import parse_channel_from_entity
-
-
-def _sat(b: float, a: float, theta: float) -> float:
-    b = max(0.0, float(b))
-    return (b**a) / (b**a + theta**a + 1e-12)
+from hierarchy import plan_budgets_by_state_entity, prev_budget_for
+from response_curve import marginal, saturation
 
 
 def _expected_incremental(
@@ -21,36 +21,103 @@ def _expected_incremental(
     v_rev = float(cfg_value["default_value_per_revenue_eur"])
     v_pur = float(cfg_value["default_value_per_purchase"])
 
-    optimistic = 0.0
-    expected = 0.0
-    conservative = 0.0
+    rows = [(budget, entities[e]) for e, budget in plan_budgets_by_state_entity(plan).items() if entities.get(e)]
+    if not rows:
+        return {"optimistic": 0.0, "expected": 0.0, "conservative": 0.0}
 
-    for c in plan.get("campaigns", []):
-        ent_id = c["entity_id"]
-        s = entities.get(ent_id, {})
-        if not s:
-            continue
-        curve = s["curve"]
-        g = _sat(float(c["recommended_budget"]), float(curve["a"]), float(curve["theta"]))
+    b = np.array([budget for budget, _ in rows], dtype=float)
+    states = [s for _, s in rows]
+    a = np.array([float(s["curve"]["a"]) for s in states])
+    theta = np.array([float(s["curve"]["theta"]) for s in states])
+    v = np.array([v_rev if s.get("outcome_col") == "revenue" else v_pur for s in states])
+    mu = np.array([float(s["u_mean"]) for s in states])
+    sd = np.array([float(s["u_sd"]) for s in states])
 
-        v = v_rev if s.get("outcome_col") == "revenue" else v_pur
-        mu = float(s["u_mean"])
-        sd = float(s["u_sd"])
+    vg = v * saturation(b, a, theta)
+    expected = float(np.sum(vg * mu))
+    conservative = float(np.sum(vg * np.maximum(0.0, mu - z_score * sd)))
+    optimistic = float(np.sum(vg * np.maximum(0.0, mu + z_score * sd)))
 
-        u_low = max(0.0, mu - z_score * sd)
-        u_high = max(0.0, mu + z_score * sd)
+    return {"optimistic": optimistic, "expected": expected, "conservative": conservative}
 
-        expected += v * mu * g
-        conservative += v * u_low * g
-        optimistic += v * u_high * g
 
+def _default_risk_cfg() -> Dict[str, Any]:
     return {
-        "optimistic": float(optimistic),
-        "expected": float(expected),
-        "conservative": float(conservative),
+        "risk_mode": "bounds",
+        "mc_samples": 4000,
+        "mc_chunk": 512,
+        "mc_seed": 0,
+        "mc_quantiles": [0.1, 0.5, 0.9],
     }
 
 
+def risk_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_risk_cfg()
+    out.update({k: v for k, v in (cfg_run.get("optimizer", {}) or {}).items() if k in out})
+    return out
+
+
+def _monte_carlo_incremental(
+    plans: List[Dict[str, Any]],
+    model_state: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    r_cfg: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Portfolio distribution of incremental value for every candidate plan.
+
+    u is drawn as max(0, N(u_mean, u_sd)) independently per entity, in (samples x entities)
+    chunks of mc_chunk rows so memory stays at chunk * (entities + candidates). Each chunk of
+    draws is scored against all candidates in one matrix product (common random numbers), so
+    differences between neighbouring budgets reflect the plans rather than sampling noise.
+    Returns, per plan, the mean (expected), the lowest/highest configured quantiles
+    (conservative/optimistic) and all quantiles.
+    """
+    entities = model_state.get("entities", {})
+    ent_ids = sorted(entities)
+    col = {e: j for j, e in enumerate(ent_ids)}
+    v_rev = float(cfg_value["default_value_per_revenue_eur"])
+    v_pur = float(cfg_value["default_value_per_purchase"])
+
+    a = np.array([float(entities[e]["curve"]["a"]) for e in ent_ids])
+    theta = np.array([float(entities[e]["curve"]["theta"]) for e in ent_ids])
+    v = np.array([v_rev if entities[e].get("outcome_col") == "revenue" else v_pur for e in ent_ids])
+    mu = np.array([float(entities[e]["u_mean"]) for e in ent_ids])
+    sd = np.array([float(entities[e]["u_sd"]) for e in ent_ids])
+
+    # (entities x candidates) value-weighted response of each plan.
+    budgets = np.zeros((len(ent_ids), len(plans)))
+    for k, plan in enumerate(plans):
+        for e, b in plan_budgets_by_state_entity(plan).items():
+            if e in col:
+                budgets[col[e], k] = b
+    vg = v[:, None] * saturation(budgets, a[:, None], theta[:, None])
+
+    n_samples = max(1, int(r_cfg["mc_samples"]))
+    chunk = max(1, int(r_cfg["mc_chunk"]))
+    rng = np.random.default_rng(int(r_cfg["mc_seed"]))
+    totals = np.empty((n_samples, len(plans)))
+    for start in range(0, n_samples, chunk):
+        stop = min(n_samples, start + chunk)
+        u = np.maximum(0.0, mu[None, :] + sd[None, :] * rng.standard_normal((stop - start, len(ent_ids))))
+        totals[start:stop] = u @ vg
+
+    qs = sorted(float(q) for q in r_cfg["mc_quantiles"])
+    q_vals = np.quantile(totals, qs, axis=0)
+    means = totals.mean(axis=0)
+    out = []
+    for k in range(len(plans)):
+        out.append(
+            {
+                "optimistic": float(q_vals[-1, k]),
+                "expected": float(means[k]),
+                "conservative": float(q_vals[0, k]),
+                "quantiles": {f"q{q * 100:g}": float(q_vals[i, k]) for i, q in enumerate(qs)},
+            }
+        )
+    return out
+
+
 def _channel_aggregate(plan: Dict[str, Any]) -> Dict[str, float]:
     out: Dict[str, float] = {}
     for c in plan.get("campaigns", []):
@@ -59,6 +126,73 @@ def _channel_aggregate(plan: Dict[str, Any]) -> Dict[str, float]:
     return out
 
 
+def _budget_slope(
+    plan: Dict[str, Any],
+    model_state: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    z_score: float,
+    metric: str,
+) -> float:
+    """
+    d(metric)/d(budget) at a solved plan, from its shadow prices: the next unit of budget
+    goes to shadow_prices.budget.next_unit_entity, worth v * u * g'(b) there, with u the
+    metric's per-entity uplift (mu, mu + z*sd or mu - z*sd).
+    """
+    ent = (plan.get("shadow_prices", {}).get("budget", {}) or {}).get("next_unit_entity")
+    s = model_state.get("entities", {}).get(ent) if ent else None
+    if not s:
+        return 0.0
+    b = plan_budgets_by_state_entity(plan).get(ent, 0.0)
+    v = float(cfg_value["default_value_per_revenue_eur"] if s.get("outcome_col") == "revenue" else cfg_value["default_value_per_purchase"])
+    mu, sd = float(s["u_mean"]), float(s["u_sd"])
+    u = {"optimistic": mu + z_score * sd, "expected": mu, "conservative": mu - z_score * sd}[metric]
+    return v * max(0.0, u) * float(marginal(b, float(s["curve"]["a"]), float(s["curve"]["theta"])))
+
+
+def _pruned_search(
+    budgets: List[float],
+    evaluate: Callable[[float], Dict[str, Any]],
+    slope: Callable[[Dict[str, Any], str], float],
+    target: float,
+) -> List[Dict[str, Any]]:
+    """
+    Finds, per metric, the first grid budget whose fit reaches target without solving
+    the whole grid. Assumes fits rise with the budget (as the linear scan's "first budget"
+    does): the grid ends are solved, then each bracket [last miss, first hit] is narrowed
+    by alternating a Newton step along the plan's budget shadow price and a bisection.
+    Returns the solved candidates in budget order.
+    """
+    done: Dict[int, Dict[str, Any]] = {}
+
+    def at(k: int) -> Dict[str, Any]:
+        if k not in done:
+            done[k] = evaluate(budgets[k])
+        return done[k]
+
+    last = len(budgets) - 1
+    at(0)
+    at(last)
+    width = (budgets[-1] - budgets[0]) / max(1, last)
+    for metric in ("optimistic", "expected", "conservative"):
+        if at(last)["fit"][metric] < target or at(0)["fit"][metric] >= target:
+            continue
+        lo = max(k for k in done if done[k]["fit"][metric] < target)
+        hi = min(k for k in done if k > lo and done[k]["fit"][metric] >= target)
+        newton = True
+        while hi - lo > 1:
+            k = (lo + hi) // 2
+            s = slope(done[lo], metric) if newton else 0.0
+            if s > 0 and width > 0:
+                k = lo + math.ceil((target - done[lo]["fit"][metric]) / s / width)
+                k = min(hi - 1, max(lo + 1, k))
+            newton = not newton
+            if at(k)["fit"][metric] >= target:
+                hi = k
+            else:
+                lo = k
+    return [done[k] for k in sorted(done)]
+
+
 def optimize_budget_for_target(
     model_state: Dict[str, Any],
     prev_allocation: Dict[str, Any],
@@ -80,8 +214,8 @@ def optimize_budget_for_target(
     step_pct = float(cfg_run["step_pct_limit"])
     min_budget = 0.0
     max_budget = 0.0
-    for ent_id in entities:
-        b_prev = float(prev_map.get(ent_id, 0.0))
+    for ent_id, s in entities.items():
+        b_prev = prev_budget_for(ent_id, s, prev_map)
         step = step_pct * max(1.0, b_prev)
         min_budget += max(0.0, b_prev - step)
         max_budget += b_prev + step
@@ -102,7 +236,15 @@ def optimize_budget_for_target(
             for i in range(grid_points)
         ]
 
-    for b in budgets:
+    r_cfg = risk_cfg(cfg_run)
+    risk_mode = str(r_cfg["risk_mode"])
+    if risk_mode not in ("monte_carlo", "bounds"):
+        raise ValueError(f"Unknown optimizer.risk_mode: {risk_mode}")
+    search = str(cfg_run.get("optimizer", {}).get("search", "grid"))
+    if search not in ("grid", "pruned"):
+        raise ValueError(f"optimizer.search must be 'grid' or 'pruned', got {search!r}")
+
+    def solve(b: float) -> Dict[str, Any]:
         c_cfg = dict(constraints_cfg)
         c_cfg["budget_total"] = float(b)
         plan, _ = solve_allocation(
@@ -113,8 +255,32 @@ def optimize_budget_for_target(
             cfg_run=cfg_run,
             horizon=horizon,
         )
-        fit = _expected_incremental(plan, model_state, cfg_value, z_score)
-        candidates.append({"budget": float(b), "fit": fit, "plan": plan})
+        return plan
+
+    def fit_plans(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Monte Carlo draws depend only on the seed and the entities, so plans fitted in
+        # separate calls still share random numbers.
+        if risk_mode == "monte_carlo":
+            return _monte_carlo_incremental(plans, model_state, cfg_value, r_cfg)
+        return [_expected_incremental(p, model_state, cfg_value, z_score) for p in plans]
+
+    if search == "pruned":
+
+        def evaluate(b: float) -> Dict[str, Any]:
+            plan = solve(b)
+            return {"budget": float(b), "plan": plan, "fit": fit_plans([plan])[0]}
+
+        candidates = _pruned_search(
+            budgets,
+            evaluate,
+            lambda c, metric: _budget_slope(c["plan"], model_state, cfg_value, z_score, metric),
+            float(target_incremental_revenue),
+        )
+    else:
+        for b in budgets:
+            candidates.append({"budget": float(b), "plan": solve(b)})
+        for c, fit in zip(candidates, fit_plans([c["plan"] for c in candidates])):
+            c["fit"] = fit
 
     def first_budget(metric: str) -> float | None:
         for row in candidates:
@@ -169,6 +335,17 @@ def optimize_budget_for_target(
             "search_bounds": {"min": float(min_budget), "max": float(max_budget)},
         },
         "channel_budget_ranges": channel_ranges,
+        "risk": {
+            "mode": risk_mode,
+            "samples": int(r_cfg["mc_samples"]) if risk_mode == "monte_carlo" else None,
+            "curve": [{"budget": c["budget"], **c["fit"]} for c in candidates],
+        },
+        "search": {
+            "mode": search,
+            "grid_points": len(budgets),
+            "candidates_evaluated": len(candidates),
+            "solver_iterations": int(sum(c["plan"].get("solver", {}).get("iterations", 0) for c in candidates)),
+        },
     }
 
     explain = "\n".join(
@@ -179,6 +356,8 @@ def optimize_budget_for_target(
             f"- Expected budget point: {float(b_exp):.2f}" + ("" if b_exp_hit is not None else " (fallback max budget; target not reached)"),
             f"- Conservative budget point: {('not reachable' if b_con is None else f'{float(b_con):.2f}')}",
             "- Channel ranges are derived from expected-to-conservative plans for reliable spend bands.",
+            f"- Risk mode: {risk_mode}"
+            + (f" ({int(r_cfg['mc_samples'])} portfolio samples; conservative/optimistic = q{min(r_cfg['mc_quantiles']) * 100:g}/q{max(r_cfg['mc_quantiles']) * 100:g})" if risk_mode == "monte_carlo" else " (per-entity mu +/- z*sd summed)"),
         ]
     )
 
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from skill_io import read_json, write_json
+
+
+def _default_plan_output_cfg() -> Dict[str, Any]:
+    return {
+        "full_json": True,
+        "ndjson": False,
+        "delta": False,
+    }
+
+
+def plan_output_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_plan_output_cfg()
+    out.update(cfg_run.get("plan_output", {}) or {})
+    return out
+
+
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), default=float)
+
+
+def plan_delta(plan: Dict[str, Any], prev_plan: Optional[Dict[str, Any]] = None, dormant: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    The part of a plan an executor has to apply: totals plus every campaign whose
+    gate_status is not "hold", and the ids of campaigns in prev_plan that the new plan no
+    longer contains (their budget should be stopped). Ids in dormant (entities state_tiers
+    moved to cold storage) are listed apart: nothing decided to stop them, so their budget
+    is left as it is.
+    """
+    campaigns = plan.get("campaigns", [])
+    ids = {c["entity_id"] for c in campaigns}
+    gone = sorted(c["entity_id"] for c in (prev_plan or {}).get("campaigns", []) if c["entity_id"] not in ids)
+    dormant = set(dormant)
+    changed = [c for c in campaigns if c.get("gate_status") != "hold"]
+    return {
+        "run": plan.get("run", {}),
+        "totals": plan.get("totals", {}),
+        "n_campaigns": len(campaigns),
+        "n_changed": len(changed),
+        "campaigns": changed,
+        "removed": [e for e in gone if e not in dormant],
+        "dormant": [e for e in gone if e in dormant],
+    }
+
+
+def _replace_atomically(path: Path, write) -> None:
+    # Executors may poll these files; they only ever see a complete file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        write(fh)
+    os.replace(tmp, path)
+
+
+def write_plan_ndjson(path: Path, plan: Dict[str, Any]) -> None:
+    """
+    Line 1: every top-level plan field except campaigns (run, totals, solver, trajectory)
+    plus n_campaigns; then one compact campaign object per line.
+    """
+
+    def write(fh) -> None:
+        header = {k: v for k, v in plan.items() if k != "campaigns"}
+        header["n_campaigns"] = len(plan.get("campaigns", []))
+        fh.write(_compact(header) + "\n")
+        for c in plan.get("campaigns", []):
+            fh.write(_compact(c) + "\n")
+
+    _replace_atomically(path, write)
+
+
+def iter_plan_ndjson(path: Path) -> Iterator[Dict[str, Any]]:
+    """Campaign rows of an allocation_plan.ndjson, one at a time (the header is skipped)."""
+    with Path(path).open("r", encoding="utf-8") as fh:
+        next(fh, None)
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_plan_ndjson(path: Path) -> Dict[str, Any]:
+    with Path(path).open("r", encoding="utf-8") as fh:
+        first = fh.readline()
+        if not first.strip():
+            return {}
+        plan = json.loads(first)
+        plan.pop("n_campaigns", None)
+        plan["campaigns"] = [json.loads(line) for line in fh if line.strip()]
+    return plan
+
+
+def write_plan_delta(
+    path: Path,
+    plan: Dict[str, Any],
+    prev_plan: Optional[Dict[str, Any]] = None,
+    dormant: Iterable[str] = (),
+) -> Dict[str, Any]:
+    delta = plan_delta(plan, prev_plan, dormant)
+    _replace_atomically(path, lambda fh: fh.write(_compact(delta)))
+    return delta
+
+
+def write_plan_outputs(
+    paths: Dict[str, Path],
+    plan: Dict[str, Any],
+    cfg_run: Dict[str, Any],
+    prev_plan: Optional[Dict[str, Any]] = None,
+    dormant: Iterable[str] = (),
+) -> None:
+    """Writes the plan in every format enabled in run.yaml `plan_output`."""
+    o_cfg = plan_output_cfg(cfg_run)
+    if bool(o_cfg["full_json"]):
+        write_json(paths["allocation"], plan)
+    elif paths["allocation"].exists():
+        # A stale full plan would otherwise be picked up as the previous plan.
+        paths["allocation"].unlink()
+    if bool(o_cfg["ndjson"]) or not bool(o_cfg["full_json"]):
+        write_plan_ndjson(paths["allocation_ndjson"], plan)
+    if bool(o_cfg["delta"]):
+        write_plan_delta(paths["allocation_delta"], plan, prev_plan, dormant)
+
+
+def read_plan(json_path: Path, ndjson_path: Optional[Path] = None) -> Dict[str, Any]:
+    """The persisted plan: allocation_plan.json if present, else allocation_plan.ndjson."""
+    if json_path.exists() or ndjson_path is None or not Path(ndjson_path).exists():
+        return read_json(json_path, default={})
+    return read_plan_ndjson(Path(ndjson_path))
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from allocate import bounds_for_entity, shadow_prices, to_float
+from channel_policy import parse_channel_from_entity
+from hierarchy import plan_budgets_by_state_entity
+from projection import project_with_group_caps
+from response_curve import marginal, saturation
+
+
+def _default_planner_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "periods": 6,
+        "max_iter": 100,
+        "tol": 1e-6,
+    }
+
+
+def planner_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_planner_cfg()
+    out.update(cfg_run.get("planner", {}) or {})
+    return out
+
+
+def _period_window(
+    x_prev: np.ndarray, min_b: np.ndarray, max_b: np.ndarray, gate_hi: np.ndarray, step_pct: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One period's (lo, hi, hi without the gate) around x_prev: step window within bounds."""
+    step = step_pct * np.maximum(1.0, x_prev)
+    lo = np.minimum(np.maximum(np.maximum(0.0, x_prev - step), min_b), x_prev)
+    hi_free = np.maximum(np.minimum(x_prev + step, max_b), x_prev)
+    return lo, np.maximum(np.minimum(hi_free, gate_hi), x_prev), hi_free
+
+
+def _period_feasible(
+    target: np.ndarray,
+    x_prev: np.ndarray,
+    min_b: np.ndarray,
+    max_b: np.ndarray,
+    gate_hi: np.ndarray,
+    total: float,
+    step_pct: float,
+    churn_limit: float,
+    groups: np.ndarray,
+    caps: Dict[str, float],
+    anchor: Optional[np.ndarray] = None,
+    pinned: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Maps a target for one period onto that period's feasible set given the previous period:
+    step window around x_prev, bounds, gated entities capped, channel caps and sum = total,
+    then shrinks the move toward x_prev until churn = sum|dx| / sum(x_prev) <= churn_limit.
+    Shrinking keeps every other constraint because x_prev itself satisfies them; it is
+    skipped while x_prev does not yet sum to total (the budget total takes precedence).
+    With an anchor (a point already feasible for this period, e.g. the committed plan) the
+    move is shrunk toward the anchor instead, and `pinned` entities are held at it.
+    """
+    lo, hi, _ = _period_window(x_prev, min_b, max_b, gate_hi, step_pct)
+    if anchor is not None and pinned is not None:
+        lo = np.where(pinned, anchor, lo)
+        hi = np.where(pinned, anchor, hi)
+    x = project_with_group_caps(target, lo, hi, total, groups, caps)
+    moved = float(np.abs(x - x_prev).sum())
+    # The same hair under the limit as the solver's churn budget.
+    allowed = churn_limit * max(1e-9, float(x_prev.sum())) * (1.0 - 1e-6)
+    if moved > allowed and abs(float(x_prev.sum()) - total) <= 1e-6 * max(1.0, total):
+        if anchor is None:
+            x = x_prev + (x - x_prev) * (allowed / moved)
+        else:
+            # Churn is convex along the segment anchor -> x and within the limit at the anchor.
+            r_lo, r_hi = 0.0, 1.0
+            for _ in range(50):
+                r = 0.5 * (r_lo + r_hi)
+                if float(np.abs(anchor + (x - anchor) * r - x_prev).sum()) <= allowed:
+                    r_lo = r
+                else:
+                    r_hi = r
+            x = anchor + (x - anchor) * r_lo
+    return x
+
+
+def _commit_period_one(
+    plan: Dict[str, Any],
+    budgets: Dict[str, float],
+    roi: Dict[str, float],
+    shadow: Dict[str, Any],
+    churn_used: float,
+) -> None:
+    """
+    Writes re-planned period-1 budgets back onto the plan: campaign rows and totals, and
+    the solver's view of them (shadow prices, the uncertainty gate binding, churn used),
+    so everything in the plan describes the committed budgets.
+    """
+    gate = {r["entity_id"] for r in shadow["campaign_limits"] if r["constraint"] == "uncertainty_gate"}
+    churn_num = 0.0
+    churn_den = 0.0
+    for c in plan.get("campaigns", []):
+        e = str(c["entity_id"])
+        if "parent_id" not in c and e in budgets:
+            b, b_prev = float(budgets[e]), float(c["previous_budget"])
+            c["recommended_budget"] = b
+            c["delta_abs"] = b - b_prev
+            c["delta_pct"] = (b - b_prev) / max(1e-9, b_prev)
+            c["gate_status"] = "hold" if abs(b - b_prev) < 1e-9 else ("increase" if b > b_prev else "decrease")
+            c["marginal_roi"] = float(roi[e])
+            c["binding_constraints"] = ["uncertainty_gate"] if e in gate else []
+        churn_num += abs(float(c["recommended_budget"]) - float(c["previous_budget"]))
+        churn_den += max(1e-9, float(c["previous_budget"]))
+    totals = plan.setdefault("totals", {})
+    allocated = sum(float(c["recommended_budget"]) for c in plan.get("campaigns", []))
+    totals["budget_allocated"] = allocated
+    totals["budget_gap"] = float(totals.get("budget_total", allocated)) - allocated
+    totals["churn"] = float(churn_num / max(1e-9, churn_den))
+    plan["shadow_prices"] = shadow
+    solver = plan.setdefault("solver", {})
+    budget = solver.get("churn_budget")
+    solver["churn_used"] = float(churn_used)
+    solver["churn_bound"] = budget is not None and churn_used >= float(budget) - 1e-6 * max(1.0, float(budget))
+
+
+def plan_trajectory(
+    model_state: Dict[str, Any],
+    plan: Dict[str, Any],
+    constraints_cfg: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    cfg_run: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Glide path over the next `planner.periods` cadences from the previous budgets b_0.
+
+    Periods 1..K are optimized jointly by projected gradient ascent on
+        sum_t sum_i [ V_i (u_mean_i - gamma u_sd_i) g_i(b_ti) - lambda_inertia (b_ti - b_{t-1,i})^2 ]
+    starting from the solver's plan, so period 1 (what gets executed and verified) is chosen
+    knowing the moves that follow it. Each iterate is mapped period by period onto the same
+    step/bound/cap/churn limits the solver uses; gated entities cannot rise above b_0.
+    Pooled parents keep the solver's period-1 budget (their member split is already fixed),
+    and period 1 stays as solved when b_0 does not sum to the budget total (cold start or a
+    changed total). The re-planned period 1 is written back onto `plan` in place, with its
+    shadow prices, gate bindings and churn used recomputed for those budgets. Budgets
+    are reported per model-state entity (pooled parents are not split over members).
+    """
+    p_cfg = planner_cfg(cfg_run)
+    periods = max(1, int(p_cfg["periods"]))
+    entities = model_state.get("entities", {})
+    committed = plan_budgets_by_state_entity(plan)
+    ent_ids = [e for e in committed if e in entities]
+    cadence = int(cfg_run.get("cadence_hours", 12))
+
+    B = float(constraints_cfg["budget_total"])
+    step_pct = float(cfg_run["step_pct_limit"])
+    churn_limit = to_float(cfg_run.get("daily_churn_limit"), float("inf"))
+    gamma = float(cfg_run["gamma_risk"])
+    lam = float(cfg_run["lambda_inertia"])
+    alpha = float(cfg_run["alpha_gate"])
+    v_rev = float(cfg_value["default_value_per_revenue_eur"])
+    v_pur = float(cfg_value["default_value_per_purchase"])
+
+    states = [entities[e] for e in ent_ids]
+    a = np.array([float(s["curve"]["a"]) for s in states])
+    theta = np.array([float(s["curve"]["theta"]) for s in states])
+    v = np.array([v_rev if s.get("outcome_col") == "revenue" else v_pur for s in states])
+    value = v * np.array([float(s["u_mean"]) for s in states])
+    w = v * np.array([float(s["u_mean"]) - gamma * float(s["u_sd"]) for s in states])
+    gated = np.array([float(s["p_u_gt_u_min"]) < (1.0 - alpha) for s in states], dtype=bool)
+
+    x1 = np.array([committed[e] for e in ent_ids], dtype=float)
+    prev_by_id = {str(c.get("parent_id", c["entity_id"])): 0.0 for c in plan.get("campaigns", [])}
+    for c in plan.get("campaigns", []):
+        prev_by_id[str(c.get("parent_id", c["entity_id"]))] += float(c.get("previous_budget", 0.0))
+    x0 = np.array([prev_by_id.get(e, 0.0) for e in ent_ids], dtype=float)
+
+    min_b = np.zeros(len(ent_ids))
+    max_b = np.full(len(ent_ids), np.inf)
+    for idx, e in enumerate(ent_ids):
+        members = entities[e].get("members") or {e: 1.0}
+        bounds = [bounds_for_entity(m, constraints_cfg) for m in members]
+        min_b[idx] = sum(b[0] for b in bounds)
+        max_b[idx] = sum(b[1] for b in bounds)
+    gate_hi = np.where(gated, x0, np.inf)
+    pinned = np.array([bool(entities[e].get("members")) for e in ent_ids], dtype=bool)
+    if abs(float(x0.sum()) - B) > 1e-6 * max(1.0, B):
+        pinned[:] = True
+    groups = np.array([parse_channel_from_entity(e) for e in ent_ids], dtype=object)
+    caps_raw = constraints_cfg.get("channel_caps", {})
+    caps = {str(k): to_float(val, float("inf")) for k, val in caps_raw.items()} if isinstance(caps_raw, dict) else {}
+
+    def step_row(t: int, x: np.ndarray, x_prev: np.ndarray) -> Dict[str, Any]:
+        return {
+            "period": t,
+            "offset_hours": (t - 1) * cadence,
+            "budgets": {e: float(b) for e, b in zip(ent_ids, x)},
+            "churn": float(np.abs(x - x_prev).sum() / max(1e-9, float(x_prev.sum()))),
+            "expected_value": float(np.sum(value * saturation(x, a, theta))),
+        }
+
+    if not ent_ids or (periods == 1 and pinned.all()):
+        return {"periods": periods, "cadence_hours": cadence, "iterations": 0, "steps": [step_row(1, x1, x0)]}
+
+    def feasible(X: np.ndarray) -> np.ndarray:
+        out = np.empty_like(X)
+        out[0] = _period_feasible(X[0], x0, min_b, max_b, gate_hi, B, step_pct, churn_limit, groups, caps, anchor=x1, pinned=pinned)
+        for t in range(1, X.shape[0]):
+            out[t] = _period_feasible(X[t], out[t - 1], min_b, max_b, gate_hi, B, step_pct, churn_limit, groups, caps)
+        return out
+
+    def objective(X: np.ndarray) -> float:
+        full = np.vstack([x0[None, :], X])
+        return float(np.sum(w * saturation(X, a, theta)) - lam * np.sum(np.diff(full, axis=0) ** 2))
+
+    def gradient(X: np.ndarray) -> np.ndarray:
+        full = np.vstack([x0[None, :], X])
+        d = np.diff(full, axis=0)
+        grad = w * marginal(X, a, theta) - 2.0 * lam * d
+        grad[:-1] += 2.0 * lam * d[1:]
+        return grad
+
+    # Start from the committed plan followed by "repeat its move direction" and let the
+    # ascent reshape both.
+    X = feasible(np.vstack([x1[None, :], np.tile(x1 + (x1 - x0), (periods - 1, 1))]))
+    J = objective(X)
+    eta = 0.0
+    iterations = 0
+    for _ in range(int(p_cfg["max_iter"])):
+        iterations += 1
+        g = gradient(X)
+        g_scale = float(np.max(np.abs(g)))
+        if g_scale <= 1e-15:
+            break
+        if eta <= 0.0:
+            eta = step_pct * max(1.0, float(np.mean(x1))) / g_scale
+        improved = False
+        while eta * g_scale > 1e-9 * max(1.0, B):
+            cand = feasible(X + eta * g)
+            J_cand = objective(cand)
+            if J_cand > J:
+                improved = True
+                break
+            eta *= 0.5
+        if not improved:
+            break
+        gain = J_cand - J
+        X, J = cand, J_cand
+        eta *= 2.0
+        if gain <= float(p_cfg["tol"]) * max(1.0, abs(J)):
+            break
+
+    if np.abs(X[0] - x1).sum() <= 1e-9 * max(1.0, B):
+        # Period 1 is the solver's plan up to rounding; keep it (and its solver metadata) exact.
+        X[0] = x1
+    else:
+        lo, hi, hi_free = _period_window(x0, min_b, max_b, gate_hi, step_pct)
+        ch_total: Dict[str, float] = {}
+        for g, b in zip(groups, X[0]):
+            ch_total[g] = ch_total.get(g, 0.0) + float(b)
+        solved = {
+            "b": X[0],
+            "lo": lo,
+            "hi": hi,
+            "hi_free": hi_free,
+            "prev": x0,
+            "w": w,
+            "a": a,
+            "theta": theta,
+            "gated": gated,
+            "ch_ids": list(groups),
+            "ch_total": ch_total,
+            "caps": caps,
+            "lam": lam,
+            "tiny": 1e-9 * max(1.0, B),
+        }
+        items = [{"entity_id": e, "members": entities[e].get("members") or {}} for e in ent_ids]
+        _commit_period_one(
+            plan,
+            {e: float(b) for e, b in zip(ent_ids, X[0])},
+            {e: float(r) for e, r in zip(ent_ids, value * marginal(X[0], a, theta))},
+            shadow_prices(items, solved, constraints_cfg),
+            float(np.abs(X[0] - x0).sum()),
+        )
+    rows: List[Dict[str, Any]] = []
+    x_prev = x0
+    for t in range(X.shape[0]):
+        rows.append(step_row(t + 1, X[t], x_prev))
+        x_prev = X[t]
+    return {
+        "periods": periods,
+        "cadence_hours": cadence,
+        "iterations": iterations,
+        "objective": J,
+        "period1_shift": float(np.abs(X[0] - x1).sum()),
+        "steps": rows,
+    }
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def project_capped_simplex(
+    target: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    total: float,
+    iters: int = 100,
+) -> np.ndarray:
+    """
+    Euclidean projection of `target` onto {x : lo <= x <= hi, sum(x) = total}.
+    Solved by bisection on the shift tau in x = clip(target - tau, lo, hi), which is
+    monotone in tau. If total lies outside [sum(lo), sum(hi)] the nearest box corner
+    (all lo / all hi) is returned.
+    """
+    target = np.asarray(target, dtype=float)
+    lo = np.asarray(lo, dtype=float)
+    hi = np.maximum(np.asarray(hi, dtype=float), lo)
+    if target.size == 0:
+        return target.copy()
+
+    lo_sum = float(lo.sum())
+    hi_sum = float(hi.sum())
+    if total <= lo_sum:
+        return lo.copy()
+    if total >= hi_sum:
+        return hi.copy()
+
+    finite_hi = np.where(np.isfinite(hi), hi, target)
+    t_lo = float(np.min(target - finite_hi)) - 1.0
+    t_hi = float(np.max(target - lo)) + 1.0
+    # With unbounded coordinates the lower bracket must be widened until it overshoots.
+    width = max(1.0, t_hi - t_lo)
+    while float(np.clip(target - t_lo, lo, hi).sum()) <= total:
+        width *= 2.0
+        t_lo = t_hi - width
+    for _ in range(iters):
+        tau = 0.5 * (t_lo + t_hi)
+        s = float(np.clip(target - tau, lo, hi).sum())
+        if s > total:
+            t_lo = tau
+        else:
+            t_hi = tau
+        if t_hi - t_lo <= 1e-12 * max(1.0, abs(tau)):
+            break
+    x = np.clip(target - 0.5 * (t_lo + t_hi), lo, hi)
+
+    # Remove the residual bisection error on coordinates that still have slack.
+    gap = float(total - x.sum())
+    if abs(gap) > 0.0:
+        slack = (hi - x) if gap > 0 else (x - lo)
+        slack = np.where(np.isfinite(slack), slack, abs(gap))
+        s_sum = float(slack.sum())
+        if s_sum > 0:
+            x = x + np.sign(gap) * slack * min(1.0, abs(gap) / s_sum)
+    return x
+
+
+def project_with_group_caps(
+    target: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    total: float,
+    groups: np.ndarray,
+    caps: dict,
+    max_rounds: int = 50,
+) -> np.ndarray:
+    """
+    Projection onto {lo <= x <= hi, sum(x) = total, sum_{i in g} x_i <= caps[g]}.
+    Groups whose cap is violated are projected onto their cap and frozen, and the
+    remaining budget is re-projected over the other coordinates until no cap is violated.
+    """
+    target = np.asarray(target, dtype=float)
+    lo = np.asarray(lo, dtype=float)
+    hi = np.maximum(np.asarray(hi, dtype=float), lo)
+    groups = np.asarray(groups, dtype=object)
+    x = np.zeros_like(target)
+    free = np.ones(target.shape[0], dtype=bool)
+    remaining = float(total)
+
+    for _ in range(max_rounds):
+        x[free] = project_capped_simplex(target[free], lo[free], hi[free], remaining)
+        violated = []
+        for g, cap in caps.items():
+            if cap is None or not np.isfinite(float(cap)):
+                continue
+            m = free & (groups == g)
+            if m.any() and float(x[m].sum()) > float(cap) + 1e-9:
+                violated.append((g, m, float(cap)))
+        if not violated:
+            break
+        for _, m, cap in violated:
+            x[m] = project_capped_simplex(target[m], lo[m], hi[m], cap)
+            free &= ~m
+            remaining -= float(x[m].sum())
+        if not free.any():
+            break
+    return x
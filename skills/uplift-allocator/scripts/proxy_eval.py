@@ -5,6 +5,22 @@ from typing import Dict, Any, Tuple
 import numpy as np
 import pandas as pd
 
+from channel_policy import paid_mask, pushdown_cfg
+from skill_io import read_frame
+
+
+def _weighted_corr(p: pd.Series, y: pd.Series, w: np.ndarray) -> float:
+    ok = (p.notna() & y.notna()).to_numpy()
+    if ok.sum() < 2:
+        return float("nan")
+    x, v, w = p.to_numpy(dtype=float)[ok], y.to_numpy(dtype=float)[ok], w[ok]
+    if w.sum() <= 0:
+        return float("nan")
+    dx = x - np.average(x, weights=w)
+    dv = v - np.average(v, weights=w)
+    den = np.sqrt(np.sum(w * dx * dx) * np.sum(w * dv * dv))
+    return float(np.sum(w * dx * dv) / den) if den > 0 else float("nan")
+
 
 def evaluate_proxies(
     unified_path,
@@ -16,8 +32,10 @@ def evaluate_proxies(
     - sigma starts high
     - sigma only reduces if it improves held-out prediction of GA outcomes
     Here we implement conservative heuristics as a baseline.
+    With paid_pushdown enabled, unpaid entities count with weight paid_pushdown.proxy_weight
+    (0 drops their rows before any proxy work).
     """
-    df = pd.read_csv(unified_path)
+    df = read_frame(unified_path, "unified", ["time_bucket_start", "revenue", "purchases"])
     df["time_bucket_start"] = pd.to_datetime(df["time_bucket_start"], utc=True)
 
     proxy_cols = [c for c in df.columns if c.startswith("proxy_")]
@@ -30,6 +48,15 @@ def evaluate_proxies(
     sigma_ceiling = float(cfg_run["proxy"]["sigma_ceiling"])
 
     has_revenue = df["revenue"].sum() > 0
+    weights = None
+    p_cfg = pushdown_cfg(cfg_run)
+    if bool(p_cfg["enabled"]):
+        w_unpaid = float(np.clip(float(p_cfg["proxy_weight"]), 0.0, 1.0))
+        paid = paid_mask(df, cfg_run)
+        if w_unpaid <= 0.0:
+            df = df[paid].reset_index(drop=True)
+        elif w_unpaid < 1.0:
+            weights = np.where(paid, 1.0, w_unpaid)
     y = df["revenue"] if has_revenue else df["purchases"]
 
     report = ["# Proxy report (secondary-only)\n"]
@@ -37,11 +64,17 @@ def evaluate_proxies(
 
     for c in proxy_cols:
         s = pd.to_numeric(df[c], errors="coerce")
-        miss = float(s.isna().mean())
+        if weights is None:
+            miss = float(s.isna().mean())
+        else:
+            miss = float(np.average(s.isna().to_numpy(), weights=weights)) if len(s) else 0.0
 
         tmp = pd.DataFrame({"entity_id": df["entity_id"], "p": s, "y": y})
-        tmp["y_lead"] = tmp.groupby("entity_id")["y"].shift(-1)
-        corr = tmp[["p", "y_lead"]].corr().iloc[0, 1]
+        tmp["y_lead"] = tmp.groupby("entity_id", observed=True)["y"].shift(-1)
+        if weights is None:
+            corr = tmp[["p", "y_lead"]].corr().iloc[0, 1]
+        else:
+            corr = _weighted_corr(tmp["p"], tmp["y_lead"], weights)
         corr = float(0.0 if np.isnan(corr) else corr)
 
         entry = catalog.get(c, {})
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _default_sketch_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "k": 200,
+        "entity_k": 16,
+        "pane_hours": 168,
+    }
+
+
+def sketch_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_sketch_cfg()
+    out.update(cfg_run.get("sketches", {}) or {})
+    if int(out["pane_hours"]) < 1:
+        raise ValueError(f"sketches.pane_hours must be at least 1, got {out['pane_hours']!r}")
+    return out
+
+
+class QuantileSketch:
+    """
+    KLL-style mergeable quantile sketch.
+
+    Items live in levels; an item at level h stands for 2^h observations. When a level
+    outgrows its capacity (k at the top, shrinking by 2/3 per level below) it is sorted
+    and every other item is promoted, so memory stays O(k log n) while rank error stays
+    around 1/k. Sketches of disjoint data merge by concatenating levels and compacting.
+    Until the first compaction the sketch holds the raw values and is exact.
+    """
+
+    def __init__(self, k: int = 200, levels: Optional[List[np.ndarray]] = None) -> None:
+        self.k = max(8, int(k))
+        self.levels: List[np.ndarray] = [np.asarray(v, dtype=float) for v in levels] if levels else [np.empty(0)]
+        self._flip = 0
+
+    @property
+    def n(self) -> int:
+        return int(sum(len(v) << h for h, v in enumerate(self.levels)))
+
+    def _capacity(self, h: int) -> int:
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** (len(self.levels) - 1 - h))))
+
+    def _compress(self) -> None:
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                arr = np.sort(self.levels[h])
+                odd = len(arr) % 2
+                # Alternate which half is promoted so compaction error does not drift one way.
+                up = arr[odd + self._flip :: 2]
+                self._flip ^= 1
+                self.levels[h] = arr[:odd]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], up])
+            h += 1
+
+    def update(self, values: Iterable[float]) -> "QuantileSketch":
+        vals = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=float)
+        vals = vals[~np.isnan(vals)]
+        if vals.size:
+            self.levels[0] = np.concatenate([self.levels[0], vals])
+            self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, v in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], v])
+        self._compress()
+        return self
+
+    def items(self) -> Tuple[np.ndarray, np.ndarray]:
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), float(1 << h)) for h, v in enumerate(self.levels)])
+        return values, weights
+
+    def quantile(self, q: float) -> float:
+        values, weights = self.items()
+        if values.size == 0:
+            return float("nan")
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        cw = np.cumsum(weights)
+        target = q * cw[-1]
+        i = int(np.searchsorted(cw, target, side="left"))
+        i = min(i, len(values) - 1)
+        if abs(cw[i] - target) <= 1e-9 and i + 1 < len(values):
+            return float(0.5 * (values[i] + values[i + 1]))
+        return float(values[i])
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "levels": [v.tolist() for v in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "QuantileSketch":
+        return cls(int(d.get("k", 200)), [np.asarray(v, dtype=float) for v in d.get("levels", [[]])])
+
+
+def grouped_weighted_median(keys: np.ndarray, values: np.ndarray, weights: np.ndarray) -> pd.Series:
+    """
+    Weighted median per key in one sorted pass (same convention as QuantileSketch.median:
+    the midpoint when the cumulative weight lands exactly on half, so unit weights give
+    the ordinary median).
+    """
+    if len(values) == 0:
+        return pd.Series(dtype=float)
+    codes, uniq = pd.factorize(np.asarray(keys), sort=True)
+    order = np.lexsort((values, codes))
+    c, v, w = codes[order], np.asarray(values, dtype=float)[order], np.asarray(weights, dtype=float)[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(c)) + 1]
+    ends = np.r_[starts[1:], len(c)]
+    csum = np.cumsum(w)
+    before = np.r_[0.0, csum[starts[1:] - 1]]
+    totals = csum[ends - 1] - before
+    sizes = ends - starts
+    cw = csum - np.repeat(before, sizes)
+    half = np.repeat(0.5 * totals, sizes)
+    reached = np.flatnonzero(cw >= half - 1e-9)
+    idx = reached[np.searchsorted(reached, starts)]
+    exact = (np.abs(cw[idx] - half[idx]) <= 1e-9) & (idx + 1 < ends)
+    med = np.where(exact, 0.5 * (v[idx] + v[np.minimum(idx + 1, len(v) - 1)]), v[idx])
+    return pd.Series(med, index=pd.Index(uniq[c[starts]]))
+
+
+def _pane_key(ts: pd.Timestamp) -> str:
+    return pd.Timestamp(ts).isoformat()
+
+
+def _fingerprints(codes: np.ndarray, keys: List[str], rows: pd.DataFrame) -> Dict[str, str]:
+    """
+    Content key per pane (codes index keys): the wrapping uint64 sum of per-row hashes plus
+    the row count. Any restated, added or dropped row changes it, and keys of disjoint row
+    sets add up.
+    """
+    h = pd.util.hash_pandas_object(rows, index=False).to_numpy(dtype=np.uint64)
+    sums = np.zeros(len(keys), dtype=np.uint64)
+    np.add.at(sums, codes, h)
+    counts = np.bincount(codes, minlength=len(keys))
+    return {p: f"{int(x):016x}-{int(n)}" for p, x, n in zip(keys, sums, counts)}
+
+
+def _combine_fingerprints(a: str, b: str) -> str:
+    (ha, na), (hb, nb) = (x.split("-") for x in (a, b))
+    return f"{(int(ha, 16) + int(hb, 16)) % (1 << 64):016x}-{int(na) + int(nb)}"
+
+
+def _entity_sketches(entities: np.ndarray, values: np.ndarray, k: int) -> Dict[str, List[List[float]]]:
+    """
+    Per-entity sketch levels for one pane. An entity with at most k values keeps them as a
+    single exact level (no per-entity sketch object is built); larger ones are compacted,
+    so an entity never holds more than O(k log n) items per pane.
+    """
+    keep = ~np.isnan(values)
+    e = pd.Series(entities[keep]).astype(str).to_numpy()
+    v = values[keep]
+    if len(v) == 0:
+        return {}
+    order = np.lexsort((v, e))
+    e, v = e[order], v[order]
+    starts = np.r_[0, np.flatnonzero(e[1:] != e[:-1]) + 1]
+    out: Dict[str, List[List[float]]] = {}
+    for ent, vals in zip(e[starts], np.split(v, starts[1:])):
+        if len(vals) <= k:
+            out[str(ent)] = [vals.tolist()]
+        else:
+            out[str(ent)] = [lvl.tolist() for lvl in QuantileSketch(k).update(vals).levels]
+    return out
+
+
+def _merge_levels(a: List[List[float]], b: List[List[float]], k: int) -> List[List[float]]:
+    sk = QuantileSketch(k, [np.asarray(v, dtype=float) for v in a]).merge(QuantileSketch(k, [np.asarray(v, dtype=float) for v in b]))
+    return [lvl.tolist() for lvl in sk.levels]
+
+
+def update_sketch_state(
+    prev: Optional[Dict[str, Any]],
+    dfw: pd.DataFrame,
+    outcome_col: str,
+    window_start: pd.Timestamp,
+    cfg_run: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Maintains windowed sketches in model state: one pane per pane_hours of buckets
+    (epoch-aligned), each holding a global spend sketch and a fixed-size per-entity
+    outcome sketch (at most entity_k items per level).
+
+    Panes are keyed by content: a pane is rebuilt from dfw only when the fingerprint of
+    its rows in the window differs from the stored one, i.e. it is new, it was restated by
+    a re-export, or the window start moved into it; every other pane is kept as is.
+    Panes with no rows in the window are dropped. A change of outcome column, k, entity_k
+    or pane_hours starts over.
+    """
+    s_cfg = sketch_cfg(cfg_run)
+    k, entity_k, pane_hours = int(s_cfg["k"]), int(s_cfg["entity_k"]), int(s_cfg["pane_hours"])
+    prev = prev or {}
+    if (prev.get("outcome_col"), prev.get("k"), prev.get("entity_k"), prev.get("pane_hours")) != (outcome_col, k, entity_k, pane_hours):
+        prev = {}
+
+    rows = dfw[dfw["time_bucket_start"] >= pd.Timestamp(window_start)]
+    rows = rows[["time_bucket_start", "entity_id", "spend", outcome_col]]
+    codes, uniq = pd.factorize(rows["time_bucket_start"].dt.floor(f"{pane_hours}h"), sort=True)
+    keys = [_pane_key(t) for t in uniq]
+    fingerprints = _fingerprints(codes, keys, rows)
+    old_fp = prev.get("fingerprints", {})
+    stale = [i for i, p in enumerate(keys) if old_fp.get(p) != fingerprints[p]]
+
+    global_spend = {p: sk for p, sk in prev.get("global_spend", {}).items() if p in fingerprints and old_fp.get(p) == fingerprints[p]}
+    entity_outcome = {p: blk for p, blk in prev.get("entity_outcome", {}).items() if p in fingerprints and old_fp.get(p) == fingerprints[p]}
+
+    rebuild = np.isin(codes, stale)
+    for code, grp in rows[rebuild].groupby(codes[rebuild], sort=True):
+        key = keys[int(code)]
+        global_spend[key] = QuantileSketch(k).update(grp["spend"].to_numpy(dtype=float)).to_dict()
+        entity_outcome[key] = _entity_sketches(grp["entity_id"].to_numpy(), grp[outcome_col].to_numpy(dtype=float), entity_k)
+
+    last = rows["time_bucket_start"].max() if not rows.empty else None
+    return {
+        "k": k,
+        "entity_k": entity_k,
+        "pane_hours": pane_hours,
+        "outcome_col": outcome_col,
+        "last_bucket": _pane_key(last) if last is not None else prev.get("last_bucket"),
+        "fingerprints": fingerprints,
+        "global_spend": global_spend,
+        "entity_outcome": entity_outcome,
+        "ingested_buckets": int(rows.loc[rebuild, "time_bucket_start"].nunique()),
+    }
+
+
+def merge_sketch_states(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    """Combines sketch states built on disjoint shards (by rows or by entities)."""
+    for key in ("outcome_col", "entity_k", "pane_hours"):
+        if a.get(key) != b.get(key):
+            raise ValueError(f"cannot merge sketch states with different {key}")
+    k = int(a.get("k", 200))
+    entity_k = int(a.get("entity_k", 8))
+
+    global_spend = dict(a.get("global_spend", {}))
+    for p, sk in b.get("global_spend", {}).items():
+        global_spend[p] = QuantileSketch.from_dict(global_spend[p]).merge(QuantileSketch.from_dict(sk)).to_dict() if p in global_spend else sk
+    entity_outcome = {p: dict(blk) for p, blk in a.get("entity_outcome", {}).items()}
+    for p, blk in b.get("entity_outcome", {}).items():
+        out = entity_outcome.setdefault(p, {})
+        for ent, levels in blk.items():
+            out[ent] = _merge_levels(out[ent], levels, entity_k) if ent in out else levels
+    fingerprints = dict(a.get("fingerprints", {}))
+    for p, fp in b.get("fingerprints", {}).items():
+        fingerprints[p] = _combine_fingerprints(fingerprints[p], fp) if p in fingerprints else fp
+    lasts = [x for x in (a.get("last_bucket"), b.get("last_bucket")) if x]
+    return {
+        "k": k,
+        "entity_k": entity_k,
+        "pane_hours": a.get("pane_hours"),
+        "outcome_col": a.get("outcome_col"),
+        "last_bucket": max(lasts) if lasts else None,
+        "fingerprints": fingerprints,
+        "global_spend": global_spend,
+        "entity_outcome": entity_outcome,
+    }
+
+
+def windowed_medians(sk_state: Dict[str, Any]) -> Tuple[float, pd.Series]:
+    """(global spend median, per-entity outcome median) over the panes held in state."""
+    k = int(sk_state.get("k", 200))
+    g = QuantileSketch(k)
+    for sk in sk_state.get("global_spend", {}).values():
+        g.merge(QuantileSketch.from_dict(sk))
+
+    keys: List[Any] = []
+    vals: List[float] = []
+    wts: List[float] = []
+    for blk in sk_state.get("entity_outcome", {}).values():
+        for ent, levels in blk.items():
+            for h, lvl in enumerate(levels):
+                keys += [ent] * len(lvl)
+                vals += lvl
+                wts += [float(1 << h)] * len(lvl)
+    if not vals:
+        return g.median(), pd.Series(dtype=float)
+    return g.median(), grouped_weighted_median(np.asarray(keys, dtype=object), np.asarray(vals, dtype=float), np.asarray(wts))
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from typing import Union
+
+import numpy as np
+
+
+ArrayLike = Union[float, np.ndarray]
+
+_EPS = 1e-12
+
+
+def saturation(b: ArrayLike, a: ArrayLike, theta: ArrayLike) -> ArrayLike:
+    """
+    Hill saturation g(b) = b^a / (b^a + theta^a), broadcast over numpy arrays like a ufunc.
+    Negative budgets are treated as zero. Scalar inputs return a Python float.
+    """
+    ba = np.power(np.maximum(np.asarray(b, dtype=float), 0.0), a)
+    out = ba / (ba + np.power(theta, a) + _EPS)
+    return float(out) if np.ndim(out) == 0 else out
+
+
+def marginal(b: ArrayLike, a: ArrayLike, theta: ArrayLike) -> ArrayLike:
+    """
+    Derivative dg/db = a * b^(a-1) * theta^a / (b^a + theta^a)^2 (marginal response per unit budget).
+    Evaluated at max(b, tiny) so a < 1 curves stay finite at zero.
+    """
+    b = np.maximum(np.asarray(b, dtype=float), _EPS)
+    ba = np.power(b, a)
+    ta = np.power(theta, a)
+    out = np.asarray(a, dtype=float) * ba / b * ta / ((ba + ta) ** 2 + _EPS)
+    return float(out) if np.ndim(out) == 0 else out
+
+
+class CurveTable:
+    """
+    Precomputed g(start_i + k * quantum) for every item i and k = 0..n_steps.
+
+    The greedy allocator only ever evaluates curves on each item's quantum grid, so a table
+    replaces per-step power evaluations with array lookups. Points beyond the table (the grid
+    was capped to bound memory) are evaluated directly.
+    """
+
+    def __init__(self, a: np.ndarray, theta: np.ndarray, start: np.ndarray, quantum: float, n_steps: int) -> None:
+        self.a = np.asarray(a, dtype=float)
+        self.theta = np.asarray(theta, dtype=float)
+        self.start = np.asarray(start, dtype=float)
+        self.quantum = float(quantum)
+        self.n_steps = max(0, int(n_steps))
+        grid = self.start[:, None] + self.quantum * np.arange(self.n_steps + 1)[None, :]
+        self.values = saturation(grid, self.a[:, None], self.theta[:, None])
+
+    def at(self, i: int, k: int) -> float:
+        if 0 <= k <= self.n_steps:
+            return float(self.values[i, k])
+        return float(saturation(self.start[i] + self.quantum * k, self.a[i], self.theta[i]))
+
+
+def build_curve_table(
+    a: np.ndarray,
+    theta: np.ndarray,
+    start: np.ndarray,
+    span: np.ndarray,
+    quantum: float,
+    max_cells: int,
+) -> CurveTable | None:
+    """
+    Table covering [start_i, start_i + span_i] on the quantum grid, or None when the
+    table would be empty or the per-item step count must be cut below one.
+    """
+    n = int(np.asarray(a).size)
+    if n == 0 or quantum <= 0:
+        return None
+    finite_span = np.where(np.isfinite(span), span, 0.0)
+    n_steps = int(np.ceil(float(np.max(finite_span)) / quantum)) + 1 if finite_span.size else 1
+    n_steps = min(n_steps, int(max_cells) // n - 1)
+    if n_steps < 1:
+        return None
+    return CurveTable(a, theta, start, quantum, n_steps)
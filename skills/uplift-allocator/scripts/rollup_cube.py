@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from channel_policy import paid_flags
+
+
+GA_KEYS = ["time_bucket_start", "entity_id", "channel_id", "audience_id", "campaign_id"]
+AD_KEYS = ["time_bucket_start", "entity_id"]
+TABLES = ("ga", "spend", "proxy")
+
+
+def _default_rollup_cfg() -> Dict[str, Any]:
+    return {
+        "base_hours": 1,
+        "levels": [12, 24, 168],
+    }
+
+
+def rollup_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_rollup_cfg()
+    out.update(cfg_run.get("rollup", {}) or {})
+    return out
+
+
+def horizon_hours(horizon: str | int) -> int:
+    """'12h' -> 12, '1d' -> 24, '1w' -> 168; bare numbers are hours."""
+    text = str(horizon).strip().lower()
+    units = {"h": 1, "d": 24, "w": 168}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def _plain_keys(df: pd.DataFrame) -> pd.DataFrame:
+    # Typed reads hold labels as categoricals; the cube keeps plain string keys so tables
+    # from different reads concatenate and join without category unions.
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(str)
+    return df
+
+
+def _integral_counts(df: pd.DataFrame) -> pd.DataFrame:
+    # Purchases are counts; typed reads hold them as float, the cube returns int64 like
+    # the raw exports whenever every value is whole.
+    v = df["purchases"].to_numpy(dtype=float)
+    if np.all(np.isfinite(v)) and np.all(v == np.round(v)):
+        df["purchases"] = v.astype(np.int64)
+    return df
+
+
+def base_ga(df: pd.DataFrame, base_hours: int) -> pd.DataFrame:
+    """GA export rows summed per (base bucket, entity) in the cube's GA table layout."""
+    df = df.copy()
+    df["time_bucket_start"] = pd.to_datetime(df["time"], utc=True).dt.floor(f"{base_hours}h")
+    df["channel_id"] = df.get("default_channel_group", "unknown")
+    if "campaign" in df.columns:
+        df["campaign_id"] = df["campaign"].astype(str)
+    else:
+        df["campaign_id"] = df["source_medium"].astype(str)
+    df["audience_id"] = "ga"
+    df["entity_id"] = "ga|" + df["channel_id"].astype(str) + "|" + df["campaign_id"].astype(str)
+    if "revenue" not in df.columns:
+        df["revenue"] = 0.0
+    if "purchases" not in df.columns:
+        df["purchases"] = 0
+    out = df.groupby(GA_KEYS, as_index=False, observed=True).agg({"revenue": "sum", "purchases": "sum"})
+    return _integral_counts(_plain_keys(out))
+
+
+def base_spend(df: pd.DataFrame, base_hours: int) -> pd.DataFrame:
+    """Spend export rows summed per (base bucket, entity)."""
+    df = df.copy()
+    df["time_bucket_start"] = pd.to_datetime(df["time"], utc=True).dt.floor(f"{base_hours}h")
+    return _plain_keys(df.groupby(AD_KEYS, as_index=False, observed=True).agg({"spend": "sum"}))
+
+
+def base_proxy(df: pd.DataFrame, base_hours: int) -> pd.DataFrame:
+    """
+    Proxy export rows per (base bucket, entity) as <col>__sum / <col>__n: proxies are
+    averaged, so the cube keeps sum and count to roll means up exactly.
+    """
+    proxy_cols = [c for c in df.columns if c.startswith("proxy_")]
+    df = df.copy()
+    df["time_bucket_start"] = pd.to_datetime(df["time"], utc=True).dt.floor(f"{base_hours}h")
+    for c in proxy_cols:
+        df[f"{c}__n"] = df[c].notna().astype(float)
+    agg = {c: "sum" for c in proxy_cols}
+    agg.update({f"{c}__n": "sum" for c in proxy_cols})
+    out = _plain_keys(df.groupby(AD_KEYS, as_index=False, observed=True).agg(agg))
+    return out.rename(columns={c: f"{c}__sum" for c in proxy_cols})
+
+
+def _rollup(base: pd.DataFrame, hours: int) -> pd.DataFrame:
+    keys = [k for k in base.columns if k in GA_KEYS]
+    values = [c for c in base.columns if c not in keys]
+    df = base.assign(time_bucket_start=base["time_bucket_start"].dt.floor(f"{hours}h"))
+    return df.groupby(keys, as_index=False)[values].sum()
+
+
+def _replace_buckets(old: Optional[pd.DataFrame], new: pd.DataFrame, buckets: pd.Series) -> pd.DataFrame:
+    if old is None or old.empty:
+        return new.reset_index(drop=True)
+    keep = old[~old["time_bucket_start"].isin(buckets)]
+    return pd.concat([keep, new], ignore_index=True, sort=False)
+
+
+class RollupCube:
+    """
+    Per-entity aggregates of the GA, spend and proxy exports at a base resolution
+    (base_hours, default hourly) plus precomputed rollups at each of `levels` hours.
+
+    Tables are kept separately and joined only when a view is requested, so a view at any
+    resolution equals building the unified view at that resolution from the raw exports
+    (GA stays the left side of the join). Buckets are aligned to the epoch like
+    Series.dt.floor.
+
+    ingest() is incremental: an export is authoritative for the base buckets it covers,
+    so re-ingesting an overlapping export replaces those buckets instead of double
+    counting, and each rollup recomputes only the coarse buckets that contain them.
+    """
+
+    def __init__(self, base_hours: int = 1, levels: Optional[List[int]] = None) -> None:
+        self.base_hours = max(1, int(base_hours))
+        levels = levels if levels is not None else _default_rollup_cfg()["levels"]
+        bad = [h for h in levels if int(h) % self.base_hours]
+        if bad:
+            raise ValueError(f"rollup levels {bad} are not multiples of base_hours={self.base_hours}")
+        self.levels = sorted({int(h) for h in levels})
+        self.base: Dict[str, Optional[pd.DataFrame]] = {t: None for t in TABLES}
+        self.rollups: Dict[int, Dict[str, Optional[pd.DataFrame]]] = {h: {t: None for t in TABLES} for h in self.levels}
+        self.input_rows = {t: 0 for t in TABLES}
+        self.source_stats: Dict[str, Any] = {}
+
+    @classmethod
+    def from_cfg(cls, cfg_run: Dict[str, Any]) -> "RollupCube":
+        r_cfg = rollup_cfg(cfg_run)
+        return cls(int(r_cfg["base_hours"]), [int(h) for h in r_cfg["levels"]])
+
+    def ingest(
+        self,
+        ga: Optional[pd.DataFrame] = None,
+        spend: Optional[pd.DataFrame] = None,
+        proxy: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, int]:
+        """Adds raw export rows; returns the number of base buckets touched per table."""
+        builders = {"ga": base_ga, "spend": base_spend, "proxy": base_proxy}
+        touched: Dict[str, int] = {}
+        for name, raw in (("ga", ga), ("spend", spend), ("proxy", proxy)):
+            if raw is None or raw.empty:
+                continue
+            self.input_rows[name] += int(len(raw))
+            if name == "proxy" and not any(c.startswith("proxy_") for c in raw.columns):
+                continue
+            touched[name] = self.ingest_base(name, builders[name](raw, self.base_hours))
+        return touched
+
+    def ingest_base(self, name: str, new: pd.DataFrame, input_rows: Optional[int] = None) -> int:
+        """
+        Adds rows already aggregated at base_hours in the cube's table layout (proxies as
+        <col>__sum / <col>__n); returns the number of base buckets touched. input_rows (raw
+        rows behind `new`) is added to the table's running count.
+        """
+        if input_rows is not None:
+            self.input_rows[name] += int(input_rows)
+        if new.empty:
+            return 0
+        buckets = pd.Series(new["time_bucket_start"].unique())
+        self.base[name] = _replace_buckets(self.base[name], new, buckets)
+        base = self.base[name]
+        for h in self.levels:
+            coarse = pd.Series(buckets.dt.floor(f"{h}h").unique())
+            part = base[base["time_bucket_start"].dt.floor(f"{h}h").isin(coarse)]
+            self.rollups[h][name] = _replace_buckets(self.rollups[h][name], _rollup(part, h), coarse)
+        return int(len(buckets))
+
+    def _table(self, name: str, hours: int) -> Optional[pd.DataFrame]:
+        if hours == self.base_hours:
+            return self.base[name]
+        if hours in self.rollups:
+            return self.rollups[hours][name]
+        if hours % self.base_hours:
+            raise ValueError(f"horizon {hours}h is not a multiple of base_hours={self.base_hours}")
+        # Not precomputed: roll up from the coarsest level that divides it (buckets nest).
+        src = max([h for h in self.levels if hours % h == 0] or [self.base_hours])
+        table = self._table(name, src)
+        return None if table is None else _rollup(table, hours)
+
+    def view(
+        self,
+        hours: int,
+        start_iso: Optional[str] = None,
+        end_iso: Optional[str] = None,
+        cfg_run: Optional[Dict[str, Any]] = None,
+    ) -> pd.DataFrame:
+        """
+        Unified view at `hours` resolution in [start_iso, end_iso):
+          time_bucket_start, entity_id, channel_id, audience_id, campaign_id,
+          revenue, purchases, spend, is_paid (when cfg_run is given), proxy_*
+        """
+        hours = int(hours)
+        ga = self._table("ga", hours)
+        if ga is None:
+            raise ValueError("rollup cube has no GA rows")
+        out = ga.copy()
+        if start_iso:
+            out = out[out["time_bucket_start"] >= pd.to_datetime(start_iso, utc=True)]
+        if end_iso:
+            out = out[out["time_bucket_start"] < pd.to_datetime(end_iso, utc=True)]
+
+        spend = self._table("spend", hours)
+        if spend is not None:
+            out = out.merge(spend, on=AD_KEYS, how="left")
+            out["spend"] = out["spend"].fillna(0.0)
+        else:
+            out["spend"] = 0.0
+
+        proxy = self._table("proxy", hours)
+        if proxy is not None:
+            names = [c[: -len("__sum")] for c in proxy.columns if c.endswith("__sum")]
+            means = proxy[AD_KEYS].copy()
+            for c in names:
+                n = proxy[f"{c}__n"].to_numpy(dtype=float)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    means[c] = np.where(n > 0, proxy[f"{c}__sum"].to_numpy(dtype=float) / n, np.nan)
+            out = out.merge(means, on=AD_KEYS, how="left")
+
+        out = _integral_counts(out.sort_values(["time_bucket_start", "entity_id"]).reset_index(drop=True))
+        if cfg_run is not None:
+            out.insert(out.columns.get_loc("spend") + 1, "is_paid", paid_flags(out["entity_id"], cfg_run))
+        out.attrs["input_rows"] = dict(self.input_rows)
+        return out
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle(
+            {
+                "base_hours": self.base_hours,
+                "levels": self.levels,
+                "base": self.base,
+                "rollups": self.rollups,
+                "input_rows": self.input_rows,
+            },
+            path,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "RollupCube":
+        data = pd.read_pickle(path)
+        cube = cls(int(data["base_hours"]), list(data["levels"]))
+        cube.base = data["base"]
+        cube.rollups = data["rollups"]
+        cube.input_rows = data["input_rows"]
+        return cube
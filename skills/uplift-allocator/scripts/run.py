@@ -1,24 +1,30 @@
 from __future__ import annotations
 
 import argparse
+import json
 from pathlib import Path
 
-from skill_io import read_yaml, read_json, write_json, write_text
 from ga_gate import enforce_ga_connected_or_stop
-from build_unified_view import build_unified_view
-from proxy_eval import evaluate_proxies
-from model_update import update_model_state
-from allocate import solve_allocation
-from verify import verify_and_challenge
-from suggest_ga_only_plan import suggest_ga_only_plan
-from optimize_budget import optimize_budget_for_target
-from channel_policy import filter_model_state_paid
+from api import UpliftAllocator
+from run_metrics import RunMetrics
+from serve import serve_forever
+from skill_io import read_yaml
+from synthetic_data import write_synthetic_exports
+from benchmark import DEFAULT_SIZES, run_benchmark_suite
+from backtest import run_backtest, write_backtest
+from tune import run_tuning, write_tuning
+from history_store import HistoryStore, history_cfg
+from ga_fetch import fetch_cfg
+from fake_ga_server import FakeGAServer
+from ad_sources import ad_sources_cfg
+from screening import screening_cfg
 
 
 ROOT = Path(__file__).resolve().parents[1]
 CFG = ROOT / "config"
 DATA = ROOT / "data"
 ART = ROOT / "artifacts"
+BENCH = ROOT / "benchmarks"
 
 
 def main() -> None:
@@ -27,117 +33,217 @@ def main() -> None:
     p = argparse.ArgumentParser()
     sub = p.add_subparsers(dest="cmd", required=True)
 
-    run = sub.add_parser("run")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--profile", action="store_true", help="dump cProfile stats per stage to artifacts/profiles/")
+
+    run = sub.add_parser("run", parents=[common])
     run.add_argument("--start", default=None)
     run.add_argument("--end", default=None)
     run.add_argument("--horizon", default="12h")
     run.add_argument("--budget", default=None)
     run.add_argument("--target-incremental-revenue", default=None)
+    run.add_argument("--ga-url", default=None, help="fetch GA from this report endpoint instead of the CSV export")
 
-    sub.add_parser("build")
-    sub.add_parser("proxies")
-    sub.add_parser("model")
-    sub.add_parser("allocate")
-    sub.add_parser("verify")
-    optimize = sub.add_parser("optimize_budget")
+    build = sub.add_parser("build", parents=[common])
+    build.add_argument("--incremental", action="store_true", help="ingest into the persisted rollup cube instead of rebuilding")
+    build.add_argument("--start", default=None)
+    build.add_argument("--end", default=None)
+    build.add_argument("--ga-url", default=None, help="fetch GA from this report endpoint instead of the CSV export")
+    sub.add_parser("screen", parents=[common])
+    sub.add_parser("proxies", parents=[common])
+    sub.add_parser("model", parents=[common])
+    sub.add_parser("allocate", parents=[common])
+    sub.add_parser("verify", parents=[common])
+    optimize = sub.add_parser("optimize_budget", parents=[common])
     optimize.add_argument("--target-incremental-revenue", required=True, type=float)
     optimize.add_argument("--horizon", default="12h")
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", default=8765, type=int)
+    serve.add_argument("--socket", default=None)
+    serve.add_argument("--cache-size", default=128, type=int)
+    synth = sub.add_parser("synth")
+    synth.add_argument("--entities", default=100, type=int)
+    synth.add_argument("--days", default=28, type=int)
+    synth.add_argument("--seed", default=0, type=int)
+    synth.add_argument("--out", default=str(DATA / "synthetic"))
+    bench = sub.add_parser("bench")
+    bench.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES))
+    bench.add_argument("--days", default=28, type=int)
+    bench.add_argument("--repeats", default=1, type=int)
+    bench.add_argument("--threshold", default=0.25, type=float)
+    bench.add_argument("--optimize-max-entities", default=1000, type=int)
+    bench.add_argument("--baseline", default=str(BENCH / "baseline.json"))
+    bench.add_argument("--update-baseline", action="store_true")
+    bench.add_argument("--fail-on-regression", action="store_true")
+    replay = argparse.ArgumentParser(add_help=False)
+    replay.add_argument("--from", dest="from_", required=True)
+    replay.add_argument("--to", required=True)
+    replay.add_argument("--ga", default=str(DATA / "ga" / "ga_export_example.csv"))
+    replay.add_argument("--spend", default=str(DATA / "ad" / "spend_example.csv"))
+    replay.add_argument("--proxy", default=str(DATA / "ad" / "proxy_example.csv"))
+    replay.add_argument("--truth", default=None, help="ground-truth CSV (synthetic exports) to score plans against")
+    replay.add_argument("--budget", default=None, type=float)
+    replay.add_argument("--ad-mode", action="store_true", help="use the solver even if entities.yaml is empty")
+    backtest = sub.add_parser("backtest", parents=[replay])
+    backtest.add_argument("--horizon", default="12h")
+    backtest.add_argument("--lookback-days", default=None, type=int)
+    fake_ga = sub.add_parser("fake_ga")
+    fake_ga.add_argument("--ga", default=str(DATA / "ga" / "ga_export_example.csv"))
+    fake_ga.add_argument("--host", default="127.0.0.1")
+    fake_ga.add_argument("--port", default=8766, type=int)
+    fake_ga.add_argument("--latency-ms", default=0.0, type=float)
+    fake_ga.add_argument("--fail-every", default=0, type=int, help="answer every Nth request with 503")
+    fake_ga.add_argument("--max-concurrent", default=0, type=int, help="answer 429 above this many in-flight requests")
+    fake_ga.add_argument("--timezone", default="UTC", help="property reporting time zone for dateHour")
+    history = sub.add_parser("history")
+    history.add_argument("--entity", default=None, help="per-entity posterior and budget history")
+    history.add_argument("--as-of", default=None, help="ISO timestamp: state, plan and alerts of the latest run at or before it")
+    history.add_argument("--since", default=None)
+    history.add_argument("--until", default=None)
+    tune = sub.add_parser("tune", parents=[replay])
+    tune.add_argument("--samples", default=None, type=int)
+    tune.add_argument("--workers", default=None, type=int)
 
     args = p.parse_args()
 
-    cfg_run = read_yaml(CFG / "run.yaml")
-    cfg_constraints = read_yaml(CFG / "constraints.yaml")
-    cfg_value = read_yaml(CFG / "value.yaml")
-    cfg_entities = read_yaml(CFG / "entities.yaml")
+    # Offline tooling on synthetic data: no GA connection or artifacts involved.
+    if args.cmd == "synth":
+        cfg_run = read_yaml(CFG / "run.yaml")
+        paths = write_synthetic_exports(
+            Path(args.out), args.entities, n_days=args.days, cadence_hours=int(cfg_run["cadence_hours"]), seed=args.seed
+        )
+        print("\n".join(f"{k}: {v}" for k, v in paths.items()))
+        return
+    if args.cmd == "bench":
+        comparison = run_benchmark_suite(
+            cfg_run=read_yaml(CFG / "run.yaml"),
+            cfg_constraints=read_yaml(CFG / "constraints.yaml"),
+            cfg_value=read_yaml(CFG / "value.yaml"),
+            baseline_path=Path(args.baseline),
+            report_dir=ART,
+            sizes=[int(x) for x in args.sizes.split(",") if x.strip()],
+            n_days=args.days,
+            repeats=args.repeats,
+            threshold=args.threshold,
+            update_baseline=args.update_baseline,
+            optimize_max_entities=args.optimize_max_entities,
+        )
+        print((ART / "bench_report.md").read_text(encoding="utf-8"))
+        if args.fail_on_regression and comparison["regressions"]:
+            raise SystemExit(f"Benchmark regressions: {', '.join(comparison['regressions'])}")
+        return
+    if args.cmd == "fake_ga":
+        srv = FakeGAServer(
+            Path(args.ga),
+            host=args.host,
+            port=args.port,
+            latency_s=args.latency_ms / 1000.0,
+            fail_every=args.fail_every,
+            max_concurrent=args.max_concurrent,
+            timezone=args.timezone,
+        )
+        print(f"fake GA report server listening on {srv.base_url}", flush=True)
+        try:
+            srv.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server.server_close()
+        return
+    if args.cmd == "history":
+        cfg_run = read_yaml(CFG / "run.yaml")
+        path = ART / str(history_cfg(cfg_run)["path"])
+        if not path.exists():
+            raise SystemExit(f"No history store at {path}; enable `history` in run.yaml and run the pipeline.")
+        with HistoryStore.from_cfg(ART, cfg_run, readonly=True) as store:
+            if args.as_of:
+                print(json.dumps(store.as_of(args.as_of), indent=2, default=str))
+            elif args.entity:
+                print(store.entity_history(args.entity, args.since, args.until).to_string(index=False))
+            else:
+                print(store.runs(args.since, args.until).to_string(index=False))
+        return
+    if args.cmd in ("backtest", "tune"):
+        spend = Path(args.spend)
+        proxy = Path(args.proxy)
+        replay_kwargs = dict(
+            ga=Path(args.ga),
+            spend=spend if spend.exists() else None,
+            proxy=proxy if proxy.exists() else None,
+            start_iso=args.from_,
+            end_iso=args.to,
+            cfg_run=read_yaml(CFG / "run.yaml"),
+            cfg_constraints=read_yaml(CFG / "constraints.yaml"),
+            cfg_value=read_yaml(CFG / "value.yaml"),
+            cfg_entities=read_yaml(CFG / "entities.yaml") or {},
+            budget=args.budget,
+            ad_mode=args.ad_mode,
+            truth=Path(args.truth) if args.truth else None,
+        )
+        if args.cmd == "backtest":
+            report = run_backtest(horizon=args.horizon, lookback_days=args.lookback_days, **replay_kwargs)
+            paths = write_backtest(report, ART)
+        else:
+            report = run_tuning(samples=args.samples, workers=args.workers, **replay_kwargs)
+            paths = write_tuning(report, ART)
+        print(paths["md"].read_text(encoding="utf-8").split("\n\n")[0])
+        return
 
-    if args.cmd == "run" and args.budget is not None:
-        cfg_constraints["budget_total"] = float(args.budget)
+    metrics = RunMetrics(args.cmd, profile_dir=ART / "profiles" if getattr(args, "profile", False) else None)
+    ua = UpliftAllocator(root=ROOT, cfg_dir=CFG, data_dir=DATA, art_dir=ART, metrics=metrics)
+    budget = float(args.budget) if args.cmd == "run" and args.budget is not None else None
+    horizon = getattr(args, "horizon", "12h")
 
     enforce_ga_connected_or_stop(ART / "ga_connection_status.json")
 
-    unified_path = ART / "unified_view.csv"
-    proxies_path = ART / "proxies_catalog.json"
-    state_path = ART / "model_state.json"
-    alloc_path = ART / "allocation_plan.json"
-    explain_path = ART / "allocation_explanations.md"
-    alerts_path = ART / "alerts.json"
-    optimal_budget_path = ART / "optimal_budget_range.json"
-    optimal_budget_explain_path = ART / "optimal_budget_explanations.md"
+    if args.cmd == "serve":
+        serve_forever(
+            cfg_dir=CFG,
+            art_dir=ART,
+            host=args.host,
+            port=args.port,
+            socket_path=args.socket,
+            cache_size=args.cache_size,
+        )
+        return
+
+    ua.load_artifacts()
 
     if args.cmd in ("run", "build"):
-        build_unified_view(
-            ga_csv=DATA / "ga" / "ga_export_example.csv",
-            ad_spend_csv=DATA / "ad" / "spend_example.csv",
-            ad_proxy_csv=DATA / "ad" / "proxy_example.csv",
-            out_csv=unified_path,
-            start_iso=getattr(args, "start", None),
-            end_iso=getattr(args, "end", None),
-            cfg_run=cfg_run,
+        ga_url = getattr(args, "ga_url", None)
+        ga = DATA / "ga" / "ga_export_example.csv"
+        if ga_url or bool(fetch_cfg(ua.cfg_run)["enabled"]):
+            try:
+                ga = ua.fetch_ga(getattr(args, "start", None), getattr(args, "end", None), base_url=ga_url)
+            except RuntimeError as exc:
+                raise SystemExit(str(exc))
+        # Configured ad sources replace the single example spend/proxy exports.
+        single = not ad_sources_cfg(ua.cfg_run)["sources"]
+        ua.build(
+            ga=ga,
+            spend=DATA / "ad" / "spend_example.csv" if single else None,
+            proxy=DATA / "ad" / "proxy_example.csv" if single else None,
+            start=getattr(args, "start", None),
+            end=getattr(args, "end", None),
+            write=True,
+            incremental=bool(getattr(args, "incremental", False)),
         )
 
+    if args.cmd == "screen" or args.cmd == "run" and bool(screening_cfg(ua.cfg_run)["enabled"]):
+        ua.screen(write=True)
+
     if args.cmd in ("run", "proxies"):
-        prior = read_json(proxies_path, default={})
-        catalog, report = evaluate_proxies(unified_path, prior, cfg_run)
-        write_json(proxies_path, catalog)
-        write_text(ART / "proxy_report.md", report)
+        ua.evaluate_proxies(write=True)
 
     if args.cmd in ("run", "model"):
-        catalog = read_json(proxies_path, default={})
-        prev = read_json(state_path, default={})
-        state, diag = update_model_state(unified_path, prev, catalog, cfg_run)
-        write_json(state_path, state)
-        write_json(ART / "fit_diagnostics.json", diag)
+        ua.update_model(write=True)
 
     if args.cmd in ("run", "allocate"):
-        state_raw = read_json(state_path, default={})
-        state = filter_model_state_paid(state_raw, cfg_run)
-        prev_alloc = read_json(alloc_path, default={})
-        has_ad_entities = bool(cfg_entities.get("entities"))
-
-        # Contract-first behavior: if ad accounts are not configured, always use GA-only plan.
-        if not has_ad_entities:
-            plan, explain = suggest_ga_only_plan(
-                unified_path=unified_path,
-                total_budget=float(cfg_constraints["budget_total"]),
-                cfg_run=cfg_run,
-            )
-        else:
-            plan, explain = solve_allocation(
-                model_state=state,
-                prev_allocation=prev_alloc,
-                constraints_cfg=cfg_constraints,
-                cfg_value=cfg_value,
-                cfg_run=cfg_run,
-                horizon=getattr(args, "horizon", "12h"),
-            )
-
-        write_json(alloc_path, plan)
-        write_text(explain_path, explain)
-
-        catalog = read_json(proxies_path, default={})
-        alerts = verify_and_challenge(
-            unified_path=unified_path,
-            model_state=state,
-            proxy_catalog=catalog,
-            allocation_plan=plan,
-            cfg_run=cfg_run,
-            constraints_cfg=cfg_constraints,
-        )
-        write_json(alerts_path, alerts)
+        ua.allocate(budget=budget, horizon=horizon, write=True)
 
     if args.cmd == "verify":
-        state = filter_model_state_paid(read_json(state_path, default={}), cfg_run)
-        catalog = read_json(proxies_path, default={})
-        plan = read_json(alloc_path, default={})
-        alerts = verify_and_challenge(
-            unified_path=unified_path,
-            model_state=state,
-            proxy_catalog=catalog,
-            allocation_plan=plan,
-            cfg_run=cfg_run,
-            constraints_cfg=cfg_constraints,
-        )
-        write_json(alerts_path, alerts)
+        ua.verify(budget=budget, write=True)
 
     if args.cmd in ("run", "optimize_budget"):
         target = (
@@ -146,19 +252,12 @@ def main() -> None:
             else None
         )
         if target is not None:
-            state = filter_model_state_paid(read_json(state_path, default={}), cfg_run)
-            prev_alloc = read_json(alloc_path, default={})
-            optimal, explain = optimize_budget_for_target(
-                model_state=state,
-                prev_allocation=prev_alloc,
-                constraints_cfg=cfg_constraints,
-                cfg_value=cfg_value,
-                cfg_run=cfg_run,
-                target_incremental_revenue=target,
-                horizon=getattr(args, "horizon", "12h"),
-            )
-            write_json(optimal_budget_path, optimal)
-            write_text(optimal_budget_explain_path, explain)
+            ua.optimize(target, horizon=horizon, budget=budget, write=True)
+
+    if args.cmd in ("run", "allocate"):
+        ua.record_history(command=args.cmd)
+
+    metrics.write(ART / "run_metrics.json", history_path=ART / "run_metrics_history.jsonl")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from skill_io import write_json
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+def _max_rss_bytes() -> Optional[int]:
+    """The process's resident-set high-water mark (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    rss = int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class RunMetrics:
+    """
+    Collects per-stage wall time, CPU time, peak memory and stage-reported counters
+    (rows/entities in and out, solver iterations) for one run. Every stage records
+    max_rss_bytes, the process's peak resident memory up to the end of the stage (a
+    high-water mark: it grows in the stage that sets a new peak). With profile_dir set,
+    each stage is also run under cProfile and its stats dumped to
+    <profile_dir>/<run_id>_<stage>.prof. The stage's own peak traced memory
+    (peak_mem_bytes; tracemalloc slows allocation-heavy stages) is recorded when
+    trace_memory is set, by default only when profiling.
+    """
+
+    def __init__(self, command: str, profile_dir: Optional[Path] = None, trace_memory: Optional[bool] = None) -> None:
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        # Microseconds plus a random suffix: runs started in the same second stay distinct.
+        self.run_id = self.started_at.strftime("%Y%m%dT%H%M%S.%fZ") + "-" + uuid.uuid4().hex[:6]
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
+        self.trace_memory = self.profile_dir is not None if trace_memory is None else bool(trace_memory)
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        rec: Dict[str, Any] = {"stage": name}
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        prof = cProfile.Profile() if self.profile_dir is not None else None
+
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield rec
+        finally:
+            if prof is not None:
+                prof.disable()
+            rec["wall_s"] = time.perf_counter() - wall0
+            rec["cpu_s"] = time.process_time() - cpu0
+            rss = _max_rss_bytes()
+            if rss is not None:
+                rec["max_rss_bytes"] = rss
+            if self.trace_memory:
+                rec["peak_mem_bytes"] = int(tracemalloc.get_traced_memory()[1])
+                if started_tracing:
+                    tracemalloc.stop()
+            if prof is not None and self.profile_dir is not None:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                out = self.profile_dir / f"{self.run_id}_{name}.prof"
+                prof.dump_stats(str(out))
+                rec["profile"] = str(out)
+            self.stages.append(rec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "command": self.command,
+            "started_at": self.started_at.isoformat(),
+            "total_wall_s": float(sum(s.get("wall_s", 0.0) for s in self.stages)),
+            "total_cpu_s": float(sum(s.get("cpu_s", 0.0) for s in self.stages)),
+            "stages": self.stages,
+        }
+
+    def write(self, path: Path, history_path: Optional[Path] = None) -> Dict[str, Any]:
+        obj = self.to_dict()
+        write_json(path, obj)
+        if history_path is not None:
+            history_path.parent.mkdir(parents=True, exist_ok=True)
+            with history_path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(obj, sort_keys=True) + "\n")
+        return obj
+
+
+@contextmanager
+def no_stage(name: str) -> Iterator[Dict[str, Any]]:
+    _ = name
+    yield {}
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Per-source column layout. time: the ISO-8601 timestamp column; required: columns that
+# must be present (readers add the ones their stage needs); one_of: groups of which at
+# least one must be present; labels: string columns held as categoricals; numbers: float
+# columns; flags: boolean columns; prefixes: families of float columns (proxy_*). Any
+# other column is not read.
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "ga": {
+        "time": "time",
+        "required": ["time"],
+        "one_of": [["campaign", "source_medium"]],
+        "labels": ["default_channel_group", "campaign", "source_medium"],
+        "numbers": ["revenue", "purchases"],
+        "flags": [],
+        "prefixes": [],
+    },
+    "ad_spend": {
+        "time": "time",
+        "required": ["time", "entity_id", "spend"],
+        "one_of": [],
+        "labels": ["entity_id"],
+        "numbers": ["spend"],
+        "flags": [],
+        "prefixes": [],
+    },
+    "ad_proxy": {
+        "time": "time",
+        "required": ["time", "entity_id"],
+        "one_of": [],
+        "labels": ["entity_id"],
+        "numbers": [],
+        "flags": [],
+        "prefixes": ["proxy_"],
+    },
+    "unified": {
+        "time": "time_bucket_start",
+        "required": ["entity_id"],
+        "one_of": [],
+        "labels": ["entity_id", "channel_id", "audience_id", "campaign_id"],
+        "numbers": ["revenue", "purchases", "spend"],
+        "flags": ["is_paid"],
+        "prefixes": ["proxy_"],
+    },
+}
+
+
+def _schema(kind: str) -> Dict[str, Any]:
+    if kind not in SCHEMAS:
+        raise ValueError(f"unknown input schema {kind!r}; expected one of {sorted(SCHEMAS)}")
+    return SCHEMAS[kind]
+
+
+def _wanted(schema: Dict[str, Any], column: str) -> bool:
+    known = {schema["time"], *schema["labels"], *schema["numbers"], *schema["flags"]}
+    return column in known or any(column.startswith(p) for p in schema["prefixes"])
+
+
+def _check_columns(columns: List[str], required: List[str], schema: Dict[str, Any], name: str, kind: str) -> None:
+    missing = [c for c in required if c not in columns]
+    missing += [" or ".join(g) for g in schema["one_of"] if not any(c in columns for c in g)]
+    if missing:
+        raise ValueError(f"{name}: missing {kind} column(s) {missing}; got {list(columns)}")
+
+
+def _bad_numbers(path: Path, columns: List[str]) -> Optional[str]:
+    # Slow path, only to name the first offending cell once the typed read has failed.
+    raw = pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+    for c in columns:
+        s = raw[c].str.strip()
+        bad = s.ne("") & pd.to_numeric(s, errors="coerce").isna() & ~s.str.lower().isin(["nan", "na", "null", "none"])
+        if bad.any():
+            i = int(np.flatnonzero(bad.to_numpy())[0])
+            return f"column {c!r} row {i + 2} has non-numeric value {raw[c].iloc[i]!r}"
+    return None
+
+
+def _parse_time(df: pd.DataFrame, column: str, name: str) -> None:
+    raw = df[column]
+    try:
+        parsed = pd.to_datetime(raw, format="ISO8601", utc=True)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(raw, format="ISO8601", utc=True, errors="coerce")
+        bad = parsed.isna() & raw.notna()
+        i = int(np.flatnonzero(bad.to_numpy())[0]) if bad.any() else 0
+        raise ValueError(f"{name}: column {column!r} row {i + 2} is not an ISO-8601 timestamp: {raw.iloc[i]!r}") from None
+    if parsed.isna().any():
+        i = int(np.flatnonzero(parsed.isna().to_numpy())[0])
+        raise ValueError(f"{name}: column {column!r} row {i + 2} has no timestamp")
+    df[column] = parsed
+
+
+def read_typed(
+    src: Any,
+    kind: str,
+    rename: Optional[Dict[str, str]] = None,
+    required: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Reads one input (CSV path or DataFrame) under SCHEMAS[kind]: only schema columns are
+    read, labels become categoricals, numbers float64, flags bool, and the time column is
+    parsed as ISO-8601 in UTC. Missing columns, non-numeric values and unparseable
+    timestamps raise ValueError naming the file, column and row.
+    DataFrames are checked and their time column parsed if needed; other dtypes are kept.
+    `rename` maps source column names to schema names before the check; `required` adds
+    the columns the calling stage needs to the schema's own.
+    """
+    schema = _schema(kind)
+    rename = dict(rename or {})
+    need = list(dict.fromkeys(list(schema["required"]) + list(required or [])))
+    if isinstance(src, pd.DataFrame):
+        if src.empty and len(src.columns) == 0:
+            return src.copy(deep=False)
+        df = src.copy(deep=False).rename(columns=rename)
+        _check_columns(list(df.columns), need, schema, f"{kind} frame", kind)
+        if schema["time"] in df.columns and not isinstance(df[schema["time"]].dtype, pd.DatetimeTZDtype):
+            _parse_time(df, schema["time"], f"{kind} frame")
+        return df
+
+    path = Path(src)
+    try:
+        header = list(pd.read_csv(path, nrows=0).columns)
+    except pd.errors.EmptyDataError:
+        raise ValueError(f"{path}: empty file, expected a {kind} CSV with a header row") from None
+    names = {c: rename.get(c, c) for c in header}
+    _check_columns(list(names.values()), need, schema, str(path), kind)
+    usecols = [c for c in header if _wanted(schema, names[c])]
+    numbers = [c for c in usecols if names[c] in schema["numbers"] or any(names[c].startswith(p) for p in schema["prefixes"])]
+    dtype: Dict[str, Any] = {c: "category" for c in usecols if names[c] in schema["labels"]}
+    dtype.update({c: "float64" for c in numbers})
+    dtype.update({c: "bool" for c in usecols if names[c] in schema["flags"]})
+    dtype.update({c: str for c in usecols if names[c] == schema["time"]})
+    try:
+        df = pd.read_csv(path, usecols=usecols, dtype=dtype, engine="c")
+    except ValueError as exc:
+        raise ValueError(f"{path}: {(_bad_numbers(path, numbers) if numbers else None) or exc}") from None
+    df = df.rename(columns=names)
+    if schema["time"] in df.columns:
+        _parse_time(df, schema["time"], str(path))
+    return df
+
+
+def frame_memory_bytes(df: pd.DataFrame) -> int:
+    """Memory held by a frame, counting the Python string objects in object columns."""
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+MAD_TO_SD = 1.4826
+ACTIONS = ("flag", "mask")
+OUTCOMES = ("revenue", "purchases")
+
+
+def _default_screening_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "action": "flag",
+        "columns": ["spend", "revenue", "purchases"],
+        "min_buckets": 6,
+        "z_threshold": 8.0,
+        "scale_floor": 1.0,
+        "outage_ratio": 0.2,
+        "duplicate_tol": 0.25,
+        "min_entities": 3,
+        "max_report_rows": 200,
+    }
+
+
+def screening_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_screening_cfg()
+    out.update(cfg_run.get("screening", {}) or {})
+    if out["action"] not in ACTIONS:
+        raise ValueError(f"screening.action must be one of {ACTIONS}, got {out['action']!r}")
+    cols = out.get("columns") or []
+    out["columns"] = [cols] if isinstance(cols, str) else list(cols)
+    return out
+
+
+def _nanmedian_last(a: np.ndarray) -> np.ndarray:
+    """Median over the last axis ignoring NaN, by one sort (NaN sorts last); NaN if all missing."""
+    s = np.sort(a, axis=-1)
+    n = np.sum(~np.isnan(a), axis=-1)
+    lo = np.maximum(0, (n - 1) // 2)[..., None]
+    hi = np.maximum(0, n // 2)[..., None]
+    med = 0.5 * (np.take_along_axis(s, lo, -1) + np.take_along_axis(s, hi, -1))[..., 0]
+    return np.where(n > 0, med, np.nan)
+
+
+def robust_stats(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Median, MAD and count of observed values along the last axis of x (missing = NaN)."""
+    med = _nanmedian_last(x)
+    mad = _nanmedian_last(np.abs(x - med[..., None]))
+    return med, mad, np.sum(~np.isnan(x), axis=-1)
+
+
+def _panel(unified: pd.DataFrame, columns: List[str]) -> Tuple[np.ndarray, np.ndarray, pd.Index, pd.Index, np.ndarray]:
+    """Entities x buckets matrix per column (NaN where an entity has no row) and the row positions."""
+    e_codes, ents = pd.factorize(unified["entity_id"], sort=False)
+    t_codes, times = pd.factorize(unified["time_bucket_start"], sort=True)
+    n_e, n_t = len(ents), len(times)
+    flat = e_codes.astype(np.int64) * n_t + t_codes
+    panel = np.full((len(columns), n_e, n_t), np.nan)
+    for k, c in enumerate(columns):
+        v = unified[c].to_numpy(dtype=float)
+        cell = panel[k].reshape(-1)
+        cell[flat] = np.bincount(flat, weights=np.nan_to_num(v), minlength=n_e * n_t)[flat]
+    rows_per_cell = np.bincount(flat, minlength=n_e * n_t).reshape(n_e, n_t)
+    return panel, rows_per_cell, pd.Index(ents), pd.Index(times), flat
+
+
+def _iso(times: pd.Index, pos: np.ndarray) -> List[str]:
+    return [pd.Timestamp(t).isoformat() for t in times[pos]]
+
+
+def screen_unified(unified: pd.DataFrame, cfg_run: Dict[str, Any]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Screens the unified view for anomalous (entity, bucket) cells before the model sees it.
+    Each screened column is laid out as an entities x buckets panel and every cell is
+    compared with its entity's median / MAD over the panel (the fit window, which rolls
+    forward run to run), all entities in one vectorized pass. A cell is flagged when:
+      - spike: robust z = (x - median) / max(1.4826 * MAD, scale_floor * median) exceeds
+        z_threshold, with a positive median over at least min_buckets observed buckets;
+      - outage: total revenue/purchases across entities in the bucket falls below
+        outage_ratio x its median over the panel (every entity's row in that bucket);
+      - duplicate: a one-off doubling (an export summed twice; every entity's cell in that
+        column): the column's bucket total and its typical entity level (median over
+        entities of value / entity median) are both within a relative duplicate_tol of 2x
+        the previous and 2x the next bucket, or the view holds more than one row for the
+        same (entity, bucket).
+    action "flag" leaves the data as is; "mask" drops the flagged rows so those buckets are
+    excluded from the fit. Returns (screened view, report).
+    """
+    s_cfg = screening_cfg(cfg_run)
+    columns = [c for c in s_cfg["columns"] if c in unified.columns]
+    report: Dict[str, Any] = {
+        "action": s_cfg["action"],
+        "columns": columns,
+        "rows_in": int(len(unified)),
+        "rows_flagged": 0,
+        "rows_masked": 0,
+        "counts": {"spike": {}, "outage": {}, "duplicate": {}, "duplicate_rows": 0},
+        "outage_buckets": {},
+        "duplicate_buckets": {},
+        "flags": [],
+    }
+    if unified.empty or not columns or "time_bucket_start" not in unified.columns:
+        report.update({"entities": int(unified["entity_id"].nunique()) if "entity_id" in unified.columns else 0, "buckets": 0})
+        return unified, report
+
+    panel, rows_per_cell, ents, times, flat = _panel(unified, columns)
+    n_c, n_e, n_t = panel.shape
+    report.update({"entities": int(n_e), "buckets": int(n_t)})
+    min_buckets = int(s_cfg["min_buckets"])
+    z_thr = float(s_cfg["z_threshold"])
+    floor = float(s_cfg["scale_floor"])
+    tol = float(s_cfg["duplicate_tol"])
+    min_ents = int(s_cfg["min_entities"])
+
+    # Reason bits per cell: 1 << k spike in column k, 1 << (n_c + k) duplicate, then outage
+    # and duplicate_rows.
+    med, mad, n = robust_stats(panel)
+    med, mad, n = med[..., None], mad[..., None], n[..., None]
+    ok = (n >= min_buckets) & (med > 0) & ~np.isnan(panel)
+    scale = np.maximum(MAD_TO_SD * np.nan_to_num(mad), floor * np.nan_to_num(med))
+    z = np.where(ok, (np.nan_to_num(panel) - np.nan_to_num(med)) / np.where(ok, scale, 1.0), 0.0)
+    spike = ok & (z > z_thr)
+    bits = np.zeros((n_e, n_t), dtype=np.int64)
+    for k in range(n_c):
+        bits |= spike[k].astype(np.int64) << k
+    z_max = np.where(spike, z, 0.0).max(axis=0)
+
+    # Bucket totals across entities: a collapse in outcomes is a tracking outage. An export
+    # counted twice is a one-off 2x above both neighbouring buckets, in the total and in the
+    # typical entity's level (median over entities of value / the entity's own median);
+    # a real step or a ramp is not also 2x above the bucket after it.
+    observed = ~np.isnan(panel)
+    total = np.where(observed.any(axis=1), np.nansum(panel, axis=1), np.nan)
+    t_med, _, t_n = robust_stats(total)
+    t_ratio = np.nan_to_num(total) / np.where(t_med > 0, t_med, 1.0)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        level = np.where(observed & (med > 0), panel / med, np.nan)
+    typical = _nanmedian_last(np.moveaxis(level, 1, -1))
+    dup_all = np.zeros((n_c, n_t), dtype=bool)
+    if n_t >= 3:
+        near = (t_n >= min_buckets)[:, None] & (np.sum(~np.isnan(level), axis=1)[:, 1:-1] >= min_ents)
+        for x in (total, typical):
+            prev, nxt = x[:, :-2], x[:, 2:]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                for r in (x[:, 1:-1] / prev, x[:, 1:-1] / nxt):
+                    near &= (prev > 0) & (nxt > 0) & (np.abs(r - 2.0) <= 2.0 * tol)
+                # Tighter on the neighbours' mean, which averages out bucket-to-bucket noise.
+                near &= np.abs(2.0 * x[:, 1:-1] / (prev + nxt) - 2.0) <= tol
+        dup_all[:, 1:-1] = near
+    outage_bit = 1 << (2 * n_c)
+    for k, c in enumerate(columns):
+        dup = dup_all[k]
+        if dup.any():
+            bits[:, dup] |= observed[k][:, dup].astype(np.int64) << (n_c + k)
+            report["duplicate_buckets"][c] = _iso(times, np.flatnonzero(dup))
+        if c not in OUTCOMES:
+            continue
+        out = (t_n[k] >= min_buckets) & (t_med[k] > 0) & (t_ratio[k] < float(s_cfg["outage_ratio"]))
+        if out.any():
+            bits[:, out] |= np.where(observed[:, :, out].any(axis=0), outage_bit, 0)
+            report["outage_buckets"][c] = _iso(times, np.flatnonzero(out))
+        report["counts"]["outage"][c] = int(out.sum())
+
+    dup_rows_bit = 1 << (2 * n_c + 1)
+    bits[rows_per_cell > 1] |= dup_rows_bit
+    report["counts"]["duplicate_rows"] = int((rows_per_cell > 1).sum())
+    for k, c in enumerate(columns):
+        report["counts"]["spike"][c] = int(((bits >> k) & 1).sum())
+        report["counts"]["duplicate"][c] = int(((bits >> (n_c + k)) & 1).sum())
+
+    row_bits = bits.reshape(-1)[flat]
+    flagged = row_bits != 0
+    report["rows_flagged"] = int(flagged.sum())
+
+    names = [f"spike_{c}" for c in columns] + [f"duplicate_{c}" for c in columns] + ["outage", "duplicate_rows"]
+    cells = np.flatnonzero(bits.reshape(-1))
+    order = np.argsort(-z_max.reshape(-1)[cells], kind="stable")[: int(s_cfg["max_report_rows"])]
+    for cell in cells[order]:
+        e, t = divmod(int(cell), n_t)
+        b = int(bits[e, t])
+        report["flags"].append(
+            {
+                "entity_id": str(ents[e]),
+                "time_bucket_start": pd.Timestamp(times[t]).isoformat(),
+                "reasons": [nm for j, nm in enumerate(names) if (b >> j) & 1],
+                "z": round(float(z_max[e, t]), 3),
+                **{c: float(panel[k, e, t]) for k, c in enumerate(columns) if not np.isnan(panel[k, e, t])},
+            }
+        )
+
+    if s_cfg["action"] == "mask" and flagged.any():
+        report["rows_masked"] = int(flagged.sum())
+        screened = unified.loc[~flagged].reset_index(drop=True)
+        screened.attrs = dict(unified.attrs)
+        return screened, report
+    return unified, report
+
+
+def screening_summary(report: Optional[Dict[str, Any]]) -> Optional[str]:
+    """One-line summary of a screening report, or None when nothing was flagged."""
+    if not report or not report.get("rows_flagged"):
+        return None
+    counts = report.get("counts", {})
+    parts = [f"{k} spikes in {c}" for c, k in counts.get("spike", {}).items() if k]
+    parts += [f"{c} outage in {len(b)} bucket(s)" for c, b in report.get("outage_buckets", {}).items()]
+    parts += [f"duplicated {c} in {len(b)} bucket(s)" for c, b in report.get("duplicate_buckets", {}).items()]
+    if counts.get("duplicate_rows"):
+        parts.append(f"{counts['duplicate_rows']} duplicated rows")
+    action = "masked" if report.get("rows_masked") else "flagged"
+    return f"{report['rows_flagged']} rows {action}: " + ", ".join(parts)
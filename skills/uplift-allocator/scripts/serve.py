@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from skill_io import read_yaml, read_json, read_frame
+from allocate import explain_plan, solve_allocation
+from planner import plan_trajectory, planner_cfg
+from optimize_budget import optimize_budget_for_target
+from suggest_ga_only_plan import suggest_ga_only_plan
+from channel_policy import filter_model_state_paid
+from plan_output import read_plan
+
+
+_WATCHED_ARTIFACTS = ("model_state.json", "allocation_plan.json", "allocation_plan.ndjson", "unified_view.csv", "screened_view.csv")
+_WATCHED_CONFIGS = ("run.yaml", "constraints.yaml", "value.yaml", "entities.yaml")
+
+
+class _LRUCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max(0, int(max_size))
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_size == 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WhatIfService:
+    """
+    Keeps config, the paid model state and the previous plan in memory and answers
+    what-if allocation/optimization queries without re-reading artifacts per request.
+    Artifacts and configs are reloaded only when their mtimes change.
+    The lock guards reloads and the cache only; each request solves against a snapshot of
+    the loaded inputs, so concurrent requests compute in parallel.
+    """
+
+    def __init__(self, cfg_dir: Path, art_dir: Path, cache_size: int = 128) -> None:
+        self.cfg_dir = Path(cfg_dir)
+        self.art_dir = Path(art_dir)
+        self.cache = _LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[Any, ...]] = None
+        self.reloads = 0
+
+        self.cfg_run: Dict[str, Any] = {}
+        self.cfg_constraints: Dict[str, Any] = {}
+        self.cfg_value: Dict[str, Any] = {}
+        self.cfg_entities: Dict[str, Any] = {}
+        self.model_state: Dict[str, Any] = {}
+        self.prev_allocation: Dict[str, Any] = {}
+        self.unified: pd.DataFrame = pd.DataFrame()
+
+    def _watched_paths(self) -> list[Path]:
+        return [self.cfg_dir / n for n in _WATCHED_CONFIGS] + [self.art_dir / n for n in _WATCHED_ARTIFACTS]
+
+    def _current_version(self) -> Tuple[Any, ...]:
+        out = []
+        for p in self._watched_paths():
+            try:
+                st = os.stat(p)
+                out.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                out.append(None)
+        return tuple(out)
+
+    def _maybe_reload(self) -> None:
+        version = self._current_version()
+        if version == self._version:
+            return
+        self.cfg_run = read_yaml(self.cfg_dir / "run.yaml")
+        self.cfg_constraints = read_yaml(self.cfg_dir / "constraints.yaml")
+        self.cfg_value = read_yaml(self.cfg_dir / "value.yaml")
+        self.cfg_entities = read_yaml(self.cfg_dir / "entities.yaml")
+        state_raw = read_json(self.art_dir / "model_state.json", default={})
+        self.model_state = filter_model_state_paid(state_raw, self.cfg_run)
+        self.prev_allocation = read_plan(self.art_dir / "allocation_plan.json", self.art_dir / "allocation_plan.ndjson")
+        # The view the pipeline's later stages read: screened when screening wrote one.
+        unified_path = self.art_dir / "screened_view.csv"
+        if not unified_path.exists():
+            unified_path = self.art_dir / "unified_view.csv"
+        self.unified = read_frame(unified_path, "unified") if unified_path.exists() else pd.DataFrame()
+        self.cache.clear()
+        self._version = version
+        self.reloads += 1
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # Reloads replace these attributes instead of mutating them, so a snapshot stays valid.
+        return {
+            "version": self._version,
+            "cfg_run": self.cfg_run,
+            "cfg_constraints": self.cfg_constraints,
+            "cfg_value": self.cfg_value,
+            "cfg_entities": self.cfg_entities,
+            "model_state": self.model_state,
+            "prev_allocation": self.prev_allocation,
+            "unified": self.unified,
+        }
+
+    @staticmethod
+    def _constraints_for(snap: Dict[str, Any], query: Dict[str, Any]) -> Dict[str, Any]:
+        c_cfg = dict(snap["cfg_constraints"])
+        if query.get("budget_total") is not None:
+            c_cfg["budget_total"] = float(query["budget_total"])
+        for key in ("channel_caps", "campaign_bounds"):
+            override = query.get(key)
+            if isinstance(override, dict):
+                merged = dict(c_cfg.get(key) or {})
+                merged.update(override)
+                c_cfg[key] = merged
+        if isinstance(query.get("bounds_default"), dict):
+            c_cfg["bounds_default"] = {**(c_cfg.get("bounds_default") or {}), **query["bounds_default"]}
+        return c_cfg
+
+    def _cached(self, kind: str, query: Dict[str, Any], compute: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        key = kind + ":" + json.dumps(query, sort_keys=True, default=str)
+        with self._lock:
+            self._maybe_reload()
+            hit = self.cache.get(key)
+            snap = self._snapshot()
+        cached = hit is not None
+        if not cached:
+            hit = compute(snap)
+            with self._lock:
+                # A result computed against inputs that were reloaded meanwhile is not cached.
+                if self._version == snap["version"]:
+                    self.cache.put(key, hit)
+        out = dict(hit)
+        out["cached"] = cached
+        out["elapsed_ms"] = (time.perf_counter() - t0) * 1000.0
+        return out
+
+    def allocate(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        def compute(snap: Dict[str, Any]) -> Dict[str, Any]:
+            c_cfg = self._constraints_for(snap, query)
+            horizon = str(query.get("horizon", "12h"))
+            if not snap["cfg_entities"].get("entities"):
+                plan, explain = suggest_ga_only_plan(
+                    unified_path=snap["unified"],
+                    total_budget=float(c_cfg["budget_total"]),
+                    cfg_run=snap["cfg_run"],
+                    constraints_cfg=c_cfg,
+                    prev_allocation=snap["prev_allocation"],
+                )
+            else:
+                plan, explain = solve_allocation(
+                    model_state=snap["model_state"],
+                    prev_allocation=snap["prev_allocation"],
+                    constraints_cfg=c_cfg,
+                    cfg_value=snap["cfg_value"],
+                    cfg_run=snap["cfg_run"],
+                    horizon=horizon,
+                )
+                if bool(planner_cfg(snap["cfg_run"])["enabled"]):
+                    plan["trajectory"] = plan_trajectory(snap["model_state"], plan, c_cfg, snap["cfg_value"], snap["cfg_run"])
+                    explain = explain_plan(plan)
+            return {"plan": plan, "explanation": explain}
+
+        return self._cached("allocate", query, compute)
+
+    def optimize(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        if query.get("target_incremental_revenue") is None:
+            raise ValueError("target_incremental_revenue is required.")
+
+        def compute(snap: Dict[str, Any]) -> Dict[str, Any]:
+            result, explain = optimize_budget_for_target(
+                model_state=snap["model_state"],
+                prev_allocation=snap["prev_allocation"],
+                constraints_cfg=self._constraints_for(snap, query),
+                cfg_value=snap["cfg_value"],
+                cfg_run=snap["cfg_run"],
+                target_incremental_revenue=float(query["target_incremental_revenue"]),
+                horizon=str(query.get("horizon", "12h")),
+            )
+            return {"result": result, "explanation": explain}
+
+        return self._cached("optimize_budget", query, compute)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_reload()
+            return {
+                "ok": True,
+                "n_entities": len(self.model_state.get("entities", {})),
+                "cache_entries": len(self.cache),
+                "reloads": self.reloads,
+            }
+
+
+def _make_handler(service: WhatIfService):
+    routes = {"/allocate": service.allocate, "/optimize_budget": service.optimize}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code: int, obj: Any) -> None:
+            body = json.dumps(obj, default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._send(200, service.health())
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            fn = routes.get(self.path)
+            if fn is None:
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                n = int(self.headers.get("Content-Length", 0))
+                query = json.loads(self.rfile.read(n) or b"{}")
+                if not isinstance(query, dict):
+                    raise ValueError("Query body must be a JSON object.")
+                self._send(200, fn(query))
+            except (ValueError, KeyError) as exc:
+                self._send(400, {"error": str(exc)})
+            except Exception as exc:  # keep the connection answered; the server keeps running
+                self._send(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+        def address_string(self) -> str:
+            return str(self.client_address[0]) if self.client_address else "unix"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return Handler
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(
+    service: WhatIfService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Optional[str] = None,
+) -> socketserver.BaseServer:
+    handler = _make_handler(service)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return _ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, int(port)), handler)
+
+
+def serve_forever(
+    cfg_dir: Path,
+    art_dir: Path,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Optional[str] = None,
+    cache_size: int = 128,
+) -> None:
+    service = WhatIfService(cfg_dir, art_dir, cache_size=cache_size)
+    service.health()
+    server = make_server(service, host=host, port=port, socket_path=socket_path)
+    where = socket_path if socket_path else f"http://{host}:{port}"
+    print(f"uplift-allocator what-if service listening on {where}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
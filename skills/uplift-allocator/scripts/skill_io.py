@@ -2,10 +2,16 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
 
+import pandas as pd
 import yaml
 
+from schemas import read_typed
+
+
+FrameSource = Union[str, Path, pd.DataFrame]
+
 
 def read_yaml(path: Path) -> Dict[str, Any]:
     return yaml.safe_load(path.read_text(encoding="utf-8"))
@@ -25,3 +31,17 @@ def write_json(path: Path, obj: Any) -> None:
 def write_text(path: Path, text: str) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(text, encoding="utf-8")
+
+
+def read_frame(src: FrameSource, schema: Optional[str] = None, required: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Accepts either a CSV path or an in-memory DataFrame.
+    DataFrames are shallow-copied so stage-local column assignments never leak to the caller.
+    With `schema` (a schemas.SCHEMAS key) the input is read and validated under it,
+    including the stage's `required` columns.
+    """
+    if schema is not None:
+        return read_typed(src, schema, required=required)
+    if isinstance(src, pd.DataFrame):
+        return src.copy(deep=False)
+    return pd.read_csv(src)
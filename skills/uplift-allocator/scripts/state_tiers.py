@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import pandas as pd
+
+from hierarchy import POOLED_CAMPAIGN
+
+
+def _default_state_tiers_cfg() -> Dict[str, Any]:
+    return {
+        "enabled": False,
+        "path": "cold_state.sqlite",
+        "active_days": 7.0,
+        "ttl_days": 180.0,
+        "reload_sd_scale": 1.5,
+        "busy_timeout_ms": 5000,
+    }
+
+
+def state_tiers_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_state_tiers_cfg()
+    out.update(cfg_run.get("state_tiers", {}) or {})
+    if float(out["ttl_days"]) < float(out["active_days"]):
+        raise ValueError(f"state_tiers.ttl_days ({out['ttl_days']}) must be at least active_days ({out['active_days']})")
+    return out
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cold_entities (
+    entity_id TEXT PRIMARY KEY,
+    u_mean REAL,
+    u_sd REAL,
+    info_score_I REAL,
+    outcome_col TEXT,
+    curve_a REAL,
+    curve_theta REAL,
+    curve_a_raw REAL,
+    curve_theta_raw REAL,
+    last_active TEXT NOT NULL,
+    dormant_at TEXT
+);
+CREATE INDEX IF NOT EXISTS cold_entities_last_active ON cold_entities (last_active);
+"""
+
+_COLUMNS = (
+    "entity_id", "u_mean", "u_sd", "info_score_I", "outcome_col",
+    "curve_a", "curve_theta", "curve_a_raw", "curve_theta_raw", "last_active", "dormant_at",
+)
+
+# SQLite's default limit on host parameters per statement is 999.
+_IN_CHUNK = 500
+
+
+def _ts(x: Any) -> str:
+    # Same text form as model_state last_bucket / updated_at, so timestamps compare as strings.
+    t = pd.Timestamp(x)
+    return str(t.tz_convert("UTC") if t.tzinfo else t.tz_localize("UTC"))
+
+
+def cold_record(entity: Dict[str, Any], dormant_at: str) -> Dict[str, Any]:
+    """The part of a model_state entity kept while it is dormant."""
+    curve = entity.get("curve") or {}
+    return {
+        "u_mean": float(entity["u_mean"]),
+        "u_sd": float(entity["u_sd"]),
+        "info_score_I": float(entity.get("info_score_I", 0.0)),
+        "outcome_col": entity.get("outcome_col"),
+        "curve": {k: float(curve[k]) for k in ("a", "theta", "a_raw", "theta_raw") if curve.get(k) is not None},
+        "last_active": str(entity.get("last_active") or entity.get("last_bucket")),
+        "dormant_at": dormant_at,
+    }
+
+
+def split_dormant(state: Dict[str, Any], prev_state: Dict[str, Any], cfg_run: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Splits a fresh model state into the hot state (entities with spend or outcome in the
+    last active_days before updated_at, or with no last_active recorded) and cold records
+    for the rest: dormant entities still in the fit window, and entities of prev_state that
+    left it. Records whose last activity is more than ttl_days old are not kept. Dormant
+    pooled parents are dropped (parents are re-formed every run).
+    Returns (hot state, {entity_id: cold record}).
+    """
+    t_cfg = state_tiers_cfg(cfg_run)
+    entities = state.get("entities", {})
+    if state.get("updated_at") is None:
+        return state, {}
+    now = pd.Timestamp(state["updated_at"])
+    active_from = _ts(now - pd.Timedelta(days=float(t_cfg["active_days"])))
+    keep_from = _ts(now - pd.Timedelta(days=float(t_cfg["ttl_days"])))
+    dormant_at = str(state["updated_at"])
+
+    hot: Dict[str, Any] = {}
+    dormant: Dict[str, Dict[str, Any]] = {}
+    for ent_id, s in entities.items():
+        last = s.get("last_active")
+        if last is None or str(last) >= active_from:
+            hot[ent_id] = s
+        elif POOLED_CAMPAIGN not in ent_id:
+            dormant[ent_id] = cold_record(s, dormant_at)
+    for ent_id, s in (prev_state.get("entities") or {}).items():
+        if ent_id not in entities and POOLED_CAMPAIGN not in ent_id and not s.get("members"):
+            dormant[ent_id] = cold_record(s, dormant_at)
+    dormant = {e: r for e, r in dormant.items() if r["last_active"] >= keep_from}
+
+    out = dict(state)
+    out["entities"] = hot
+    return out, dormant
+
+
+def active_entities(unified: pd.DataFrame, cfg_run: Dict[str, Any]) -> Set[str]:
+    """
+    Entities of the view with spend or outcome in its last active_days: the ones
+    split_dormant will keep hot, so the only cold entities worth reviving.
+    """
+    if unified.empty:
+        return set()
+    t = unified["time_bucket_start"]
+    active_from = t.max() - pd.Timedelta(days=float(state_tiers_cfg(cfg_run)["active_days"]))
+    moved = unified["spend"] > 0
+    for c in ("revenue", "purchases"):
+        if c in unified.columns:
+            moved |= unified[c] > 0
+    return set(map(str, unified.loc[moved & (t >= active_from), "entity_id"].unique()))
+
+
+def revive_priors(records: Dict[str, Dict[str, Any]], cfg_run: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Cold records of entities active again as model_state entities for use as priors: the
+    stored posterior with its sd widened by reload_sd_scale (the campaign may have changed
+    while paused) and the stored curve as the fit's warm start. Widening happens once, on
+    the run that brings an entity back; ones still dormant are not revived.
+    """
+    scale = max(1.0, float(state_tiers_cfg(cfg_run)["reload_sd_scale"]))
+    return {
+        e: {
+            "u_mean": float(r["u_mean"]),
+            "u_sd": float(r["u_sd"]) * scale,
+            "info_score_I": float(r["info_score_I"]),
+            "curve": dict(r.get("curve") or {}),
+            "last_active": r["last_active"],
+        }
+        for e, r in records.items()
+    }
+
+
+def expire(records: Dict[str, Dict[str, Any]], now: Any, cfg_run: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Drops records whose last activity is more than ttl_days before now."""
+    keep_from = _ts(pd.Timestamp(now) - pd.Timedelta(days=float(state_tiers_cfg(cfg_run)["ttl_days"])))
+    return {e: r for e, r in records.items() if r["last_active"] >= keep_from}
+
+
+class ColdStateStore:
+    """
+    Dormant-entity store in one SQLite file: one compact row per entity (posterior,
+    information score, curve, last activity), looked up by id only for the entities a run
+    actually sees again, and evicted once the last activity is older than the TTL.
+    """
+
+    def __init__(self, path: Path, busy_timeout_ms: int = 5000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=busy_timeout_ms / 1000.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_cfg(cls, art_dir: Path, cfg_run: Dict[str, Any]) -> "ColdStateStore":
+        t = state_tiers_cfg(cfg_run)
+        return cls(Path(art_dir) / str(t["path"]), busy_timeout_ms=int(t["busy_timeout_ms"]))
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "ColdStateStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def put(self, records: Dict[str, Dict[str, Any]], replace: bool = True) -> int:
+        """Stores records; with replace=False an entity already in the store keeps its row."""
+        rows = [
+            (
+                e,
+                r["u_mean"],
+                r["u_sd"],
+                r["info_score_I"],
+                r.get("outcome_col"),
+                r["curve"].get("a"),
+                r["curve"].get("theta"),
+                r["curve"].get("a_raw"),
+                r["curve"].get("theta_raw"),
+                r["last_active"],
+                r.get("dormant_at"),
+            )
+            for e, r in records.items()
+        ]
+        with self.conn:
+            verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+            self.conn.executemany(f"{verb} INTO cold_entities VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+        return len(rows)
+
+    def get(self, entity_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ids: List[str] = list(dict.fromkeys(entity_ids))
+        out: Dict[str, Dict[str, Any]] = {}
+        for lo in range(0, len(ids), _IN_CHUNK):
+            part = ids[lo:lo + _IN_CHUNK]
+            q = f"SELECT {', '.join(_COLUMNS)} FROM cold_entities WHERE entity_id IN ({', '.join('?' * len(part))})"
+            for row in self.conn.execute(q, part):
+                r = dict(zip(_COLUMNS, row))
+                curve = {k: r.pop(f"curve_{k}") for k in ("a", "theta", "a_raw", "theta_raw")}
+                r["curve"] = {k: v for k, v in curve.items() if v is not None}
+                out[r.pop("entity_id")] = r
+        return out
+
+    def remove(self, entity_ids: Iterable[str]) -> int:
+        ids = list(entity_ids)
+        n = 0
+        with self.conn:
+            for lo in range(0, len(ids), _IN_CHUNK):
+                part = ids[lo:lo + _IN_CHUNK]
+                n += self.conn.execute(f"DELETE FROM cold_entities WHERE entity_id IN ({', '.join('?' * len(part))})", part).rowcount
+        return n
+
+    def evict(self, now: Any, cfg_run: Dict[str, Any]) -> int:
+        """Deletes entries whose last activity is more than ttl_days before now."""
+        keep_from = _ts(pd.Timestamp(now) - pd.Timedelta(days=float(state_tiers_cfg(cfg_run)["ttl_days"])))
+        with self.conn:
+            return int(self.conn.execute("DELETE FROM cold_entities WHERE last_active < ?", (keep_from,)).rowcount)
+
+    def count(self) -> int:
+        return int(self.conn.execute("SELECT COUNT(*) FROM cold_entities").fetchone()[0])
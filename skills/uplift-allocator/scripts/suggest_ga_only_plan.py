@@ -1,21 +1,66 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 
-from channel_policy import is_paid_entity
+from allocate import to_float
+from channel_policy import paid_flags
+from projection import project_with_group_caps
+from skill_io import read_frame
+
+
+def _entity_bounds(ids: pd.Index, constraints_cfg: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """bounds_default with campaign_bounds overrides (same rules as allocate.bounds_for_entity)."""
+    default_bounds = constraints_cfg.get("bounds_default", {}) or {}
+    min_b = to_float(default_bounds.get("min", 0.0), 0.0)
+    max_b = to_float(default_bounds.get("max", None), float("inf"))
+    lo = np.full(len(ids), min_b)
+    hi = np.full(len(ids), max_b)
+    campaign_bounds = constraints_cfg.get("campaign_bounds", {})
+    if isinstance(campaign_bounds, dict) and campaign_bounds:
+        pos = ids.get_indexer(list(campaign_bounds.keys()))
+        for i, c in zip(pos, campaign_bounds.values()):
+            if i < 0 or not c:
+                continue
+            lo[i] = max(lo[i], to_float(c.get("min"), lo[i]))
+            hi[i] = min(hi[i], to_float(c.get("max"), hi[i]))
+    return lo, np.maximum(hi, lo)
+
+
+def _channels(ids: pd.Index) -> np.ndarray:
+    """Vectorized channel_policy.parse_channel_from_entity."""
+    parts = ids.to_series().astype(str).str.split("|", n=2, expand=True)
+    if parts.shape[1] < 3:
+        return parts[0].to_numpy(dtype=object)
+    ga = parts[2].notna() & (parts[0].str.lower() == "ga")
+    return np.where(ga, parts[1], parts[0]).astype(object)
+
+
+def _churn(x: np.ndarray, prev: np.ndarray) -> float:
+    return float(np.abs(x - prev).sum() / max(1e-9, np.maximum(1e-9, prev).sum()))
 
 
 def suggest_ga_only_plan(
     unified_path,
     total_budget: float,
     cfg_run: Dict[str, Any],
+    constraints_cfg: Optional[Dict[str, Any]] = None,
+    prev_allocation: Optional[Dict[str, Any]] = None,
 ) -> Tuple[Dict[str, Any], str]:
     """
     If no ad accounts: allocate total budget across GA entities (campaign/source-medium/channel group)
     using smoothed revenue/purchase shares with caps and strong inertia assumptions.
+
+    The share target is projected onto the feasible set: bounds_default / campaign_bounds,
+    channel_caps and, given a previous plan, each campaign's step window. Between the
+    smallest feasible move from the previous plan and the projected target, the plan goes
+    as far as daily_churn_limit allows. Without a previous plan the projected target is
+    the first plan and every row holds.
     """
-    df = pd.read_csv(unified_path)
+    constraints_cfg = constraints_cfg or {}
+    df = read_frame(unified_path, "unified", ["revenue", "purchases"])
     if df.empty:
         plan = {
             "run": {"horizon": f"{cfg_run['cadence_hours']}h"},
@@ -33,33 +78,99 @@ def suggest_ga_only_plan(
     use_rev = df["revenue"].sum() > 0
     ycol = "revenue" if use_rev else "purchases"
 
-    agg = df.groupby("entity_id", as_index=False).agg({ycol: "sum"})
-    agg = agg[agg["entity_id"].map(lambda x: is_paid_entity(str(x), cfg_run))]
-    if agg.empty:
+    y = df.groupby("entity_id", sort=True, observed=True)[ycol].sum()
+    y = y[paid_flags(y.index.to_series(), cfg_run).to_numpy()]
+    if y.empty:
         raise ValueError("No paid GA entities found. Allocation only supports paid channels.")
-    agg["w"] = agg[ycol] + 1.0
-    agg["share"] = agg["w"] / agg["w"].sum()
-
-    campaigns = []
-    for _, r in agg.iterrows():
-        b = float(total_budget * r["share"])
-        campaigns.append({
-            "entity_id": r["entity_id"],
-            "recommended_budget": b,
-            "previous_budget": b,
-            "delta_abs": 0.0,
-            "delta_pct": 0.0,
-            "gate_status": "hold",
-            "binding_constraints": ["ga_only_no_ad_accounts"],
-            "posterior": {"u_mean": 0.0, "u_sd": 0.0, "p_u_gt_u_min": 0.0},
-        })
-
-    plan = {"run": {"horizon": f"{cfg_run['cadence_hours']}h"}, "totals": {"budget_total": total_budget, "churn": 0.0}, "campaigns": campaigns}
+    ids = y.index
+    B = float(total_budget)
+    w = y.to_numpy(dtype=float) + 1.0
+    target = B * w / w.sum()
+
+    lo, hi = _entity_bounds(ids, constraints_cfg)
+    channel = _channels(ids)
+    channel_caps = constraints_cfg.get("channel_caps", {})
+    caps = {str(k): to_float(v, float("inf")) for k, v in channel_caps.items()} if isinstance(channel_caps, dict) else {}
+
+    prev_map = {c["entity_id"]: float(c.get("recommended_budget", 0.0)) for c in (prev_allocation or {}).get("campaigns", [])}
+    prev = pd.Series(prev_map, dtype=float).reindex(ids).fillna(0.0).to_numpy()
+    warm = float(prev.sum()) > 1e-9
+    step_lo, step_hi = lo, hi
+    churn_bound = False
+    if warm:
+        step = float(cfg_run["step_pct_limit"]) * np.maximum(1.0, prev)
+        step_lo = np.maximum(lo, np.maximum(0.0, prev - step))
+        step_hi = np.maximum(step_lo, np.minimum(hi, prev + step))
+        # Smallest feasible move (projection of the previous plan) and the projected target
+        # are both feasible, so is every point between them; churn is convex along the segment.
+        x_min = project_with_group_caps(prev, step_lo, step_hi, B, channel, caps)
+        x_tgt = project_with_group_caps(target, step_lo, step_hi, B, channel, caps)
+        churn_limit = to_float(cfg_run.get("daily_churn_limit"), float("inf"))
+        x = x_tgt
+        if _churn(x_tgt, prev) > churn_limit * (1.0 - 1e-6):
+            churn_bound = True
+            t_lo, t_hi = 0.0, 1.0
+            for _ in range(60):
+                t = 0.5 * (t_lo + t_hi)
+                if _churn(x_min + t * (x_tgt - x_min), prev) <= churn_limit * (1.0 - 1e-6):
+                    t_lo = t
+                else:
+                    t_hi = t
+            x = x_min + t_lo * (x_tgt - x_min)
+        previous = prev
+    else:
+        x = project_with_group_caps(target, lo, hi, B, channel, caps)
+        previous = x
+
+    tol = 1e-6 * max(1.0, B)
+    delta = x - previous
+    status = np.where(np.abs(delta) < 1e-9, "hold", np.where(delta > 0, "increase", "decrease"))
+    off_target = np.abs(x - target) > tol
+    at_step = warm & off_target & ((np.abs(x - step_lo) <= tol) & (step_lo > lo) | (np.abs(x - step_hi) <= tol) & (step_hi < hi))
+    at_bound = off_target & ((np.abs(x - lo) <= tol) | (np.abs(x - hi) <= tol))
+    ch_sum = pd.Series(x).groupby(channel).sum()
+    capped = {g for g, cap in caps.items() if g in ch_sum.index and ch_sum[g] >= cap - tol}
+    at_cap = off_target & np.isin(channel, list(capped))
+
+    out = pd.DataFrame(
+        {
+            "entity_id": ids.to_numpy(dtype=object),
+            "recommended_budget": x,
+            "previous_budget": previous,
+            "delta_abs": delta,
+            "delta_pct": delta / np.maximum(1e-9, previous),
+            "gate_status": status,
+        }
+    )
+    campaigns = out.to_dict("records")
+    flags = np.column_stack([at_step, at_bound, at_cap, off_target & churn_bound])
+    names = np.array(["step_limit", "campaign_bounds", "channel_cap", "churn_limit"], dtype=object)
+    posterior = {"u_mean": 0.0, "u_sd": 0.0, "p_u_gt_u_min": 0.0}
+    for c, f in zip(campaigns, flags):
+        c["binding_constraints"] = ["ga_only_no_ad_accounts"] + names[f].tolist()
+        c["posterior"] = dict(posterior)
+
+    total_alloc = float(x.sum())
+    churn = _churn(x, previous) if warm else 0.0
+    plan = {
+        "run": {"horizon": f"{cfg_run['cadence_hours']}h"},
+        "totals": {
+            "budget_total": total_budget,
+            "budget_allocated": total_alloc,
+            "budget_gap": B - total_alloc,
+            "churn": churn,
+        },
+        "campaigns": campaigns,
+    }
     explain = "\n".join([
         "# GA-only allocation (no ad accounts available)",
         f"- Total budget: {total_budget:.2f}",
+        f"- Allocated: {total_alloc:.2f}",
         f"- Outcome basis: {ycol}",
-        "- Method: smoothed GA outcome shares (conservative default).",
+        "- Method: smoothed GA outcome shares (conservative default), projected onto bounds and channel caps.",
+        (f"- Moved from the previous plan within step limits; churn {churn:.4f}" + (" (churn limit binding)" if churn_bound else ""))
+        if warm
+        else "- No previous plan: first plan holds as the baseline.",
         "- Recommendation: connect ad accounts for spend-level diminishing returns and incrementality modeling.",
     ])
     return plan, explain
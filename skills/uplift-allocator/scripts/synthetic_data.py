@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+PAID_CHANNELS = ["Paid Search", "Paid Social", "Display", "Affiliate"]
+UNPAID_CHANNELS = ["Organic Search", "Direct", "Referral"]
+
+
+def generate_synthetic_exports(
+    n_entities: int,
+    n_days: int = 28,
+    cadence_hours: int = 12,
+    paid_share: float = 0.7,
+    seed: int = 0,
+    end_iso: str = "2026-02-16T00:00:00Z",
+) -> Dict[str, pd.DataFrame]:
+    """
+    Generates GA/spend/proxy exports in the same shape as data/ga and data/ad, with a
+    known per-entity ground truth:
+      purchases_t ~ Poisson(baseline + u_true * g(spend_t; a_true, theta_true))
+      revenue_t   = purchases_t * aov
+    Unpaid entities have zero spend and therefore no incremental component.
+    Returns {"ga", "spend", "proxy", "truth"} DataFrames.
+    """
+    if n_entities < 1:
+        raise ValueError("n_entities must be >= 1")
+    rng = np.random.default_rng(seed)
+
+    n_paid = int(round(n_entities * float(np.clip(paid_share, 0.0, 1.0))))
+    is_paid = np.zeros(n_entities, dtype=bool)
+    is_paid[:n_paid] = True
+    ent_idx = np.arange(n_entities)
+    channel = np.where(
+        is_paid,
+        np.asarray(PAID_CHANNELS, dtype=object)[ent_idx % len(PAID_CHANNELS)],
+        np.asarray(UNPAID_CHANNELS, dtype=object)[ent_idx % len(UNPAID_CHANNELS)],
+    )
+    campaign = np.char.add("c", ent_idx.astype(str)).astype(object)
+    source_medium = np.where(is_paid, "google / cpc", "google / organic").astype(object)
+    entity_id = "ga|" + channel + "|" + campaign
+
+    # Heavy-tailed spend levels so most campaigns are long-tail and a few dominate.
+    spend_level = np.where(is_paid, rng.lognormal(mean=3.5, sigma=1.2, size=n_entities), 0.0)
+    a_true = rng.uniform(0.5, 1.5, size=n_entities)
+    theta_true = np.maximum(5.0, spend_level * rng.uniform(0.5, 2.0, size=n_entities))
+    u_true = np.where(is_paid, rng.gamma(shape=2.0, scale=1.0, size=n_entities), 0.0)
+    baseline = rng.gamma(shape=1.5, scale=0.4, size=n_entities)
+    aov = rng.uniform(40.0, 120.0, size=n_entities)
+
+    n_buckets = max(1, int(n_days * 24 // cadence_hours))
+    end_t = pd.Timestamp(end_iso)
+    times = end_t - pd.to_timedelta(np.arange(n_buckets, 0, -1) * cadence_hours, unit="h")
+
+    # (buckets x entities) panels
+    shape = (n_buckets, n_entities)
+    spend = spend_level[None, :] * rng.lognormal(mean=0.0, sigma=0.35, size=shape)
+    sb = np.power(np.maximum(spend, 0.0), a_true[None, :])
+    g = sb / (sb + np.power(theta_true, a_true)[None, :] + 1e-12)
+    lam = baseline[None, :] + u_true[None, :] * g
+    purchases = rng.poisson(lam).astype(float)
+    revenue = np.round(purchases * aov[None, :], 2)
+    clicks = np.where(is_paid[None, :], rng.poisson(1.0 + spend * 0.5), np.nan)
+    sessions = np.where(is_paid[None, :], rng.poisson(5.0 + spend * 2.0 + lam * 10.0), np.nan)
+
+    t_col = np.repeat(times.strftime("%Y-%m-%dT%H:%M:%SZ").to_numpy(dtype=object), n_entities)
+    e_rep = np.tile(np.arange(n_entities), n_buckets)
+
+    ga = pd.DataFrame(
+        {
+            "time": t_col,
+            "default_channel_group": channel[e_rep],
+            "campaign": campaign[e_rep],
+            "source_medium": source_medium[e_rep],
+            "revenue": revenue.ravel(),
+            "purchases": purchases.ravel(),
+        }
+    )
+
+    paid_mask = np.tile(is_paid, n_buckets)
+    spend_df = pd.DataFrame(
+        {"time": t_col[paid_mask], "entity_id": entity_id[e_rep][paid_mask], "spend": np.round(spend.ravel()[paid_mask], 2)}
+    )
+    proxy_df = pd.DataFrame(
+        {
+            "time": t_col[paid_mask],
+            "entity_id": entity_id[e_rep][paid_mask],
+            "proxy_clicks": clicks.ravel()[paid_mask],
+            "proxy_sessions": sessions.ravel()[paid_mask],
+        }
+    )
+    truth = pd.DataFrame(
+        {
+            "entity_id": entity_id,
+            "channel_id": channel,
+            "is_paid": is_paid,
+            "u_true": u_true,
+            "a_true": a_true,
+            "theta_true": theta_true,
+            "baseline_purchases": baseline,
+            "aov": aov,
+            "spend_level": spend_level,
+        }
+    )
+    return {"ga": ga, "spend": spend_df, "proxy": proxy_df, "truth": truth}
+
+
+def write_synthetic_exports(
+    out_dir: Path,
+    n_entities: int,
+    n_days: int = 28,
+    cadence_hours: int = 12,
+    paid_share: float = 0.7,
+    seed: int = 0,
+    end_iso: Optional[str] = None,
+) -> Dict[str, Path]:
+    """Writes the synthetic exports using the data/ directory layout plus truth.csv."""
+    kwargs = {} if end_iso is None else {"end_iso": end_iso}
+    frames = generate_synthetic_exports(
+        n_entities, n_days=n_days, cadence_hours=cadence_hours, paid_share=paid_share, seed=seed, **kwargs
+    )
+    out_dir = Path(out_dir)
+    paths = {
+        "ga": out_dir / "ga" / "ga_export.csv",
+        "spend": out_dir / "ad" / "spend.csv",
+        "proxy": out_dir / "ad" / "proxy.csv",
+        "truth": out_dir / "truth.csv",
+    }
+    for key, path in paths.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        frames[key].to_csv(path, index=False)
+    return paths
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import copy
+import itertools
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from backtest import run_backtest
+from skill_io import FrameSource, read_frame, write_json, write_text
+
+
+def _default_tune_cfg() -> Dict[str, Any]:
+    return {
+        "samples": 16,
+        "eta": 2,
+        "min_steps": 4,
+        "workers": 0,
+        "seed": 0,
+        "churn_penalty": 0.0,
+        "space": {
+            "gamma_risk": [0.5, 1.0, 2.0],
+            "lambda_inertia": [0.0005, 0.002, 0.01],
+            "step_pct_limit": [0.03, 0.05, 0.1],
+            "alpha_gate": [0.05, 0.1, 0.2],
+            "stability.smoothing_buckets": [2, 4, 8],
+            "stability.min_update_weight": [0.1, 0.2, 0.4],
+        },
+    }
+
+
+def tune_cfg(cfg_run: Dict[str, Any]) -> Dict[str, Any]:
+    out = _default_tune_cfg()
+    out.update(cfg_run.get("tune", {}) or {})
+    return out
+
+
+def apply_overrides(cfg_run: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a copy of cfg_run with dotted keys ("stability.smoothing_buckets") overridden."""
+    out = copy.deepcopy(cfg_run)
+    for key, value in overrides.items():
+        node = out
+        parts = key.split(".")
+        for p in parts[:-1]:
+            node = node.setdefault(p, {})
+        node[parts[-1]] = value
+    return out
+
+
+def sample_configs(space: Dict[str, List[Any]], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Full grid when it has at most n points, else n distinct grid points drawn at random."""
+    keys = sorted(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if n <= 0 or len(grid) <= n:
+        return grid
+    return random.Random(seed).sample(grid, n)
+
+
+def _rung_steps(n_configs: int, total_steps: int, eta: int, min_steps: int) -> List[int]:
+    """Replay lengths per rung: total_steps at the last rung, divided by eta per earlier rung."""
+    eta = max(2, int(eta))
+    n_rungs = 1 + max(0, math.ceil(math.log(max(1, n_configs), eta)))
+    steps = [max(1, total_steps // eta ** (n_rungs - 1 - r)) for r in range(n_rungs)]
+    steps = [s for s in steps if s >= min(min_steps, total_steps)]
+    return sorted(set(steps)) or [total_steps]
+
+
+_WORKER_DATA: Dict[str, Any] = {}
+
+
+def _init_worker(data: Dict[str, Any]) -> None:
+    # Loaded once per worker process; tasks then only carry their overrides.
+    _WORKER_DATA.clear()
+    _WORKER_DATA.update({k: (read_frame(v) if v is not None else None) for k, v in data.items() if k in ("ga", "spend", "proxy", "truth")})
+    _WORKER_DATA.update({k: v for k, v in data.items() if k not in ("ga", "spend", "proxy", "truth")})
+
+
+def _evaluate(task: Tuple[int, Dict[str, Any], str]) -> Dict[str, Any]:
+    idx, overrides, end_iso = task
+    d = _WORKER_DATA
+    report = run_backtest(
+        d["ga"],
+        d["spend"],
+        d["proxy"],
+        d["start_iso"],
+        end_iso,
+        apply_overrides(d["cfg_run"], overrides),
+        d["cfg_constraints"],
+        d["cfg_value"],
+        cfg_entities=d["cfg_entities"],
+        budget=d["budget"],
+        ad_mode=d["ad_mode"],
+        truth=d["truth"],
+    )
+    s = report["summary"]
+    metric = "true_value" if "true_value" in s else "ex_post_value"
+    n = max(1, int(s["n_steps"]))
+    value = float(s[metric]) / n
+    return {
+        "config_id": idx,
+        "overrides": overrides,
+        "steps": int(s["n_steps"]),
+        "value_metric": metric,
+        "value_per_step": value,
+        "mean_churn": float(s["mean_churn"]),
+        "max_churn": float(s["max_churn"]),
+        "hard_fail_steps": int(s["hard_fail_steps"]),
+        "gated_decisions": int(s["gated_decisions"]),
+        "errors": int(s["n_errors"]),
+        "score": value - float(d["churn_penalty"]) * float(s["mean_churn"]),
+    }
+
+
+def _pareto(rows: List[Dict[str, Any]]) -> None:
+    for r in rows:
+        r["pareto"] = not any(
+            o is not r
+            and o["value_per_step"] >= r["value_per_step"]
+            and o["mean_churn"] <= r["mean_churn"]
+            and (o["value_per_step"] > r["value_per_step"] or o["mean_churn"] < r["mean_churn"])
+            for o in rows
+        )
+
+
+def run_tuning(
+    ga: FrameSource,
+    spend: Optional[FrameSource],
+    proxy: Optional[FrameSource],
+    start_iso: str,
+    end_iso: str,
+    cfg_run: Dict[str, Any],
+    cfg_constraints: Dict[str, Any],
+    cfg_value: Dict[str, Any],
+    cfg_entities: Optional[Dict[str, Any]] = None,
+    budget: Optional[float] = None,
+    ad_mode: bool = False,
+    truth: Optional[FrameSource] = None,
+    samples: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Successive halving over run.yaml settings, scored by historical replay.
+
+    Every sampled configuration is replayed over the first rung's number of buckets; the
+    best 1/eta by score (value per step - churn_penalty * mean churn) advance to a replay
+    eta times longer, until the survivors have replayed the whole window. Replays run in a
+    process pool whose workers load the exports once. Value is ground-truth incremental
+    value when a truth frame is given, else the ex-post plan value from the replay.
+    """
+    t_cfg = tune_cfg(cfg_run)
+    n_samples = int(samples if samples is not None else t_cfg["samples"])
+    n_workers = int(workers if workers is not None else t_cfg["workers"]) or (os.cpu_count() or 1)
+    eta = max(2, int(t_cfg["eta"]))
+    configs = sample_configs(t_cfg["space"], n_samples, int(t_cfg["seed"]))
+
+    cadence = int(cfg_run.get("cadence_hours", 12))
+    start_t = pd.Timestamp(start_iso)
+    start_t = start_t.tz_localize("UTC") if start_t.tzinfo is None else start_t.tz_convert("UTC")
+    end_t = pd.Timestamp(end_iso)
+    end_t = end_t.tz_localize("UTC") if end_t.tzinfo is None else end_t.tz_convert("UTC")
+    total_steps = max(1, int((end_t - start_t) / pd.Timedelta(hours=cadence)))
+    rungs = _rung_steps(len(configs), total_steps, eta, int(t_cfg["min_steps"]))
+
+    data = {
+        "ga": ga,
+        "spend": spend,
+        "proxy": proxy,
+        "truth": truth,
+        "start_iso": start_t.isoformat(),
+        "cfg_run": cfg_run,
+        "cfg_constraints": cfg_constraints,
+        "cfg_value": cfg_value,
+        "cfg_entities": cfg_entities,
+        "budget": budget,
+        "ad_mode": ad_mode,
+        "churn_penalty": float(t_cfg["churn_penalty"]),
+    }
+    alive = list(range(len(configs)))
+    results: Dict[int, Dict[str, Any]] = {}
+    history: List[Dict[str, Any]] = []
+
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(data,)) if n_workers > 1 else None
+    if pool is None:
+        _init_worker(data)
+    try:
+        for r, steps in enumerate(rungs):
+            rung_end = (start_t + pd.Timedelta(hours=cadence * steps)).isoformat()
+            tasks = [(i, configs[i], rung_end) for i in alive]
+            rows = list(pool.map(_evaluate, tasks)) if pool is not None else [_evaluate(t) for t in tasks]
+            for row in rows:
+                row["rung"] = r
+                results[row["config_id"]] = row
+            rows.sort(key=lambda x: x["score"], reverse=True)
+            history.append({"rung": r, "steps": steps, "evaluated": len(rows), "best_score": rows[0]["score"] if rows else None})
+            if r < len(rungs) - 1:
+                alive = [row["config_id"] for row in rows[: max(1, math.ceil(len(rows) / eta))]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    ranked = sorted(results.values(), key=lambda x: (x["rung"], x["score"]), reverse=True)
+    _pareto([r for r in ranked if r["rung"] == len(rungs) - 1])
+    for rank, row in enumerate(ranked, start=1):
+        row["rank"] = rank
+        row.setdefault("pareto", False)
+    return {
+        "configs_sampled": len(configs),
+        "workers": n_workers,
+        "eta": eta,
+        "rungs": history,
+        "ranking": ranked,
+        "best": ranked[0] if ranked else None,
+    }
+
+
+def render_tuning(report: Dict[str, Any]) -> str:
+    lines = [
+        "# Tuning report",
+        f"- Configurations sampled: {report['configs_sampled']} (workers: {report['workers']}, eta: {report['eta']})",
+        "- Rungs: " + ", ".join(f"{h['evaluated']} configs x {h['steps']} steps" for h in report["rungs"]),
+        "",
+        "| rank | rung | value/step | mean churn | hard fails | pareto | overrides |",
+        "|---:|---:|---:|---:|---:|---|---|",
+    ]
+    for r in report["ranking"]:
+        ov = ", ".join(f"{k}={v}" for k, v in sorted(r["overrides"].items()))
+        lines.append(
+            f"| {r['rank']} | {r['rung']} | {r['value_per_step']:.4f} | {r['mean_churn']:.4f} "
+            f"| {r['hard_fail_steps']} | {'yes' if r['pareto'] else ''} | {ov} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_tuning(report: Dict[str, Any], out_dir: Path) -> Dict[str, Path]:
+    paths = {"json": out_dir / "tune_report.json", "md": out_dir / "tune_report.md"}
+    write_json(paths["json"], report)
+    write_text(paths["md"], render_tuning(report))
+    return paths
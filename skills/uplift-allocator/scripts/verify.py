@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
-import pandas as pd
+from typing import Dict, Any, List, Optional
 from channel_policy import is_paid_entity
+from screening import screening_summary
+from skill_io import read_frame
 
 
 def verify_and_challenge(
@@ -12,6 +13,7 @@ def verify_and_challenge(
     allocation_plan: Dict[str, Any],
     cfg_run: Dict[str, Any],
     constraints_cfg: Dict[str, Any],
+    screening: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     _ = model_state
     alerts: List[Dict[str, Any]] = []
@@ -46,10 +48,14 @@ def verify_and_challenge(
         if float(meta.get("sigma", 999.0)) < float(cfg_run["proxy"]["sigma_floor"]):
             alerts.append({"type": "proxy_too_trusted", "severity": "warn", "detail": f"{name} sigma={meta.get('sigma')}"})
 
-    df = pd.read_csv(unified_path)
+    df = read_frame(unified_path, "unified")
     rev_sum = float(df["revenue"].sum()) if "revenue" in df.columns else 0.0
     pur_sum = float(df["purchases"].sum()) if "purchases" in df.columns else 0.0
     if rev_sum <= 0 and pur_sum < 5:
         alerts.append({"type": "very_low_signal", "severity": "warn", "detail": "GA outcomes sparse; allocator will mostly hold due to gating"})
 
+    summary = screening_summary(screening)
+    if summary:
+        alerts.append({"type": "data_screening", "severity": "warn", "detail": summary})
+
     return {"hard_fail": hard_fail, "alerts": alerts}
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
+import copy
 import importlib
 import json
 import shutil
 import subprocess
 import sys
+import threading
 import unittest
+import urllib.request
 from pathlib import Path
 
+import numpy as np
+
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 SKILL_DIR = REPO_ROOT / "skills" / "uplift-allocator"
@@ -187,6 +192,46 @@ class UpliftAllocatorSmokeTests(unittest.TestCase):
         self.assertEqual(campaign["recommended_budget"], 100.0)
         self.assertIn("uncertainty_gate", campaign["binding_constraints"])
 
+    def test_solver_enforces_churn_budget_and_gate_without_budget_gap(self) -> None:
+        allocate = self._import_from_tmp_scripts("allocate")
+
+        def state(u_mean: float, p_ok: float) -> dict:
+            return {
+                "u_mean": u_mean,
+                "u_sd": 0.001,
+                "p_u_gt_u_min": p_ok,
+                "outcome_col": "revenue",
+                "curve": {"a": 0.8, "theta": 50.0},
+            }
+
+        entities = {"ga|A|weak": state(0.01, 1.0), "ga|A|strong": state(0.5, 1.0), "ga|B|gated": state(0.5, 0.0)}
+        prev = {"campaigns": [{"entity_id": e, "recommended_budget": 100.0} for e in entities]}
+        for churn_limit in (0.02, 0.10):
+            cfg_run = {
+                "step_pct_limit": 0.5,
+                "alpha_gate": 0.1,
+                "gamma_risk": 0.0,
+                "lambda_inertia": 0.0,
+                "daily_churn_limit": churn_limit,
+            }
+            plan, _ = allocate.solve_allocation(
+                model_state={"entities": entities},
+                prev_allocation=prev,
+                constraints_cfg={"budget_total": 300.0},
+                cfg_value={"default_value_per_revenue_eur": 1.0, "default_value_per_purchase": 100.0},
+                cfg_run=cfg_run,
+                horizon="12h",
+            )
+            by_id = {c["entity_id"]: c for c in plan["campaigns"]}
+            self.assertAlmostEqual(plan["totals"]["budget_gap"], 0.0, places=6)
+            self.assertLessEqual(plan["totals"]["churn"], churn_limit)
+            self.assertAlmostEqual(plan["totals"]["churn"], churn_limit, places=4)
+            self.assertTrue(plan["solver"]["churn_bound"])
+            self.assertGreater(by_id["ga|A|strong"]["recommended_budget"], 100.0)
+            self.assertLess(by_id["ga|A|weak"]["recommended_budget"], 100.0)
+            self.assertEqual(by_id["ga|B|gated"]["recommended_budget"], 100.0)
+            self.assertIn("uncertainty_gate", by_id["ga|B|gated"]["binding_constraints"])
+
     def test_optimize_budget_outputs_channel_ranges(self) -> None:
         proc = self._run("run")
         self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
@@ -199,6 +244,7 @@ class UpliftAllocatorSmokeTests(unittest.TestCase):
         self.assertGreater(len(out["channel_budget_ranges"]), 0)
         self.assertTrue(all("organic" not in r["channel_id"].lower() for r in out["channel_budget_ranges"]))
         self.assertIn("expected_budget", out["budget_points"])
+        self.assertEqual(len(out["risk"]["curve"]), 41)
 
     def test_optimize_budget_unreachable_target_flags_expected_false(self) -> None:
         proc = self._run("run")
@@ -299,6 +345,1077 @@ class UpliftAllocatorSmokeTests(unittest.TestCase):
         self.assertTrue(channel_policy.is_paid_entity("ga|Paid Social|x", cfg))
         self.assertFalse(channel_policy.is_paid_entity("ga|Paid Social Organic|x", cfg))
 
+    def test_in_process_api_runs_pipeline_without_touching_artifacts(self) -> None:
+        api = self._import_from_tmp_scripts("api")
+        import pandas as pd
+
+        art = self.tmp / "artifacts_api"
+        ua = api.UpliftAllocator(root=self.tmp, art_dir=art)
+        ua.build(
+            ga=pd.read_csv(self.tmp / "data" / "ga" / "ga_export_example.csv"),
+            spend=pd.read_csv(self.tmp / "data" / "ad" / "spend_example.csv"),
+            proxy=pd.read_csv(self.tmp / "data" / "ad" / "proxy_example.csv"),
+        )
+        ua.evaluate_proxies()
+        ua.update_model()
+        plan, _, alerts = ua.allocate(budget=5000.0)
+        self.assertAlmostEqual(sum(c["recommended_budget"] for c in plan["campaigns"]), 5000.0, places=2)
+        self.assertFalse(alerts["hard_fail"])
+        self.assertIs(ua.allocation_plan, plan)
+        self.assertFalse(art.exists())
+
+        ua.allocate(budget=5000.0, write=True)
+        self.assertTrue((art / "allocation_plan.json").exists())
+
+    def test_run_writes_stage_metrics_history_and_profiles(self) -> None:
+        proc = self._run("run")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        proc = self._run("allocate", "--profile")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+
+        art = self.tmp / "artifacts"
+        metrics = json.loads((art / "run_metrics.json").read_text(encoding="utf-8"))
+        self.assertEqual(metrics["command"], "allocate")
+        stages = {s["stage"]: s for s in metrics["stages"]}
+        self.assertEqual(set(stages), {"allocate", "verify"})
+        for key in ("wall_s", "cpu_s", "peak_mem_bytes", "profile"):
+            self.assertIn(key, stages["allocate"])
+        self.assertTrue(Path(stages["allocate"]["profile"]).exists())
+
+        history = (art / "run_metrics_history.jsonl").read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(history), 2)
+        first = json.loads(history[0])
+        self.assertEqual([s["stage"] for s in first["stages"]], ["build", "screen", "proxies", "model", "allocate", "verify"])
+        self.assertNotIn("peak_mem_bytes", first["stages"][0])
+        self.assertTrue(all(s["max_rss_bytes"] > 0 for s in first["stages"]))
+        self.assertNotEqual(first["run_id"], json.loads(history[1])["run_id"])
+
+    def test_synthetic_generator_and_benchmark_regression_report(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        benchmark = self._import_from_tmp_scripts("benchmark")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        frames = synthetic_data.generate_synthetic_exports(20, n_days=2, seed=1)
+        self.assertEqual(len(frames["ga"]), 20 * 4)
+        self.assertEqual(len(frames["truth"]), 20)
+        self.assertTrue((frames["truth"].loc[~frames["truth"]["is_paid"], "u_true"] == 0).all())
+        self.assertEqual(set(frames["spend"]["entity_id"]), set(frames["truth"].loc[frames["truth"]["is_paid"], "entity_id"]))
+
+        cfg = self.tmp / "config"
+        current = benchmark.run_benchmarks(
+            skill_io.read_yaml(cfg / "run.yaml"),
+            skill_io.read_yaml(cfg / "constraints.yaml"),
+            skill_io.read_yaml(cfg / "value.yaml"),
+            sizes=[8],
+            n_days=2,
+        )
+        self.assertEqual([r["stage"] for r in current["results"]], ["build", "read", "screen", "model", "allocate", "optimize_budget"])
+        read = current["results"][1]
+        self.assertLess(read["typed_mb"], read["untyped_mb"])
+
+        faster = {"results": [dict(r, wall_s=r["wall_s"] / 10.0) for r in current["results"]]}
+        report = benchmark.compare_to_baseline(current, faster, threshold=0.25, min_seconds=0.0)
+        self.assertEqual(len(report["regressions"]), 6)
+        report = benchmark.compare_to_baseline(current, current, threshold=0.25, min_seconds=0.0)
+        self.assertEqual(report["regressions"], [])
+
+    def test_low_info_campaigns_pool_to_parent_and_disaggregate(self) -> None:
+        model_update = self._import_from_tmp_scripts("model_update")
+        allocate = self._import_from_tmp_scripts("allocate")
+
+        rows = ["time_bucket_start,entity_id,revenue,purchases,spend"]
+        for day in range(10, 16):
+            for half in ("00", "12"):
+                rows.append(f"2026-02-{day}T{half}:00:00Z,ga|Paid Search|big,100,2,80")
+        for name in ("t1", "t2", "t3"):
+            rows.append(f"2026-02-15T12:00:00Z,ga|Paid Search|{name},0,0,5")
+        unified = self.tmp / "artifacts" / "unified_pool.csv"
+        unified.write_text("\n".join(rows) + "\n", encoding="utf-8")
+
+        cfg_run = {
+            "fit_window_days": 28,
+            "I_min_buckets_with_revenue": 6,
+            "I_min_purchases_sum": 10,
+            "u_min": 0.02,
+            "alpha_gate": 0.5,
+            "step_pct_limit": 0.2,
+            "gamma_risk": 0.0,
+            "lambda_inertia": 0.0,
+            "proxy": {"tau_w": 0.03},
+            "hierarchy": {"enabled": True, "min_info_score": 2, "min_members": 2},
+        }
+        state, diag = model_update.update_model_state(unified, {}, {}, cfg_run)
+        parent = "ga|Paid Search|__pooled__"
+        self.assertEqual(set(state["entities"]), {"ga|Paid Search|big", parent})
+        self.assertEqual(set(state["entities"][parent]["members"]), {"ga|Paid Search|t1", "ga|Paid Search|t2", "ga|Paid Search|t3"})
+        self.assertEqual(diag["n_pooled_members"], 3)
+
+        prev = {"campaigns": [
+            {"entity_id": "ga|Paid Search|big", "recommended_budget": 500.0},
+            {"entity_id": "ga|Paid Search|t1", "recommended_budget": 10.0},
+            {"entity_id": "ga|Paid Search|t2", "recommended_budget": 20.0},
+            {"entity_id": "ga|Paid Search|t3", "recommended_budget": 30.0},
+        ]}
+        plan, _ = allocate.solve_allocation(
+            model_state=state,
+            prev_allocation=prev,
+            constraints_cfg={"budget_total": 560.0},
+            cfg_value={"default_value_per_revenue_eur": 1.0, "default_value_per_purchase": 100.0},
+            cfg_run=cfg_run,
+            horizon="12h",
+        )
+        by_id = {c["entity_id"]: c for c in plan["campaigns"]}
+        self.assertEqual(set(by_id), {"ga|Paid Search|big", "ga|Paid Search|t1", "ga|Paid Search|t2", "ga|Paid Search|t3"})
+        members = [by_id[f"ga|Paid Search|t{i}"] for i in (1, 2, 3)]
+        self.assertTrue(all(c["parent_id"] == parent and "parent_pool" in c["binding_constraints"] for c in members))
+        for c in plan["campaigns"]:
+            self.assertLessEqual(abs(c["recommended_budget"] - c["previous_budget"]), 0.2 * max(1.0, c["previous_budget"]) + 1e-6)
+        ratios = [c["recommended_budget"] / c["previous_budget"] for c in members]
+        self.assertAlmostEqual(min(ratios), max(ratios), places=6)
+
+        hierarchy = self._import_from_tmp_scripts("hierarchy")
+        shares = {"a": 0.5, "b": 0.5}
+        prev_split = {"a": 90.0, "b": 10.0}
+        wide_lo, wide_hi = {"a": 0.0, "b": 0.0}, {"a": 1e6, "b": 1e6}
+        frozen = hierarchy.disaggregate_budget(100.0, shares, prev_split, wide_lo, wide_hi, max_shift=0.0)
+        blended = hierarchy.disaggregate_budget(100.0, shares, prev_split, wide_lo, wide_hi, max_shift=20.0)
+        free = hierarchy.disaggregate_budget(100.0, shares, prev_split, wide_lo, wide_hi)
+        self.assertAlmostEqual(frozen["a"], 90.0, places=6)
+        self.assertAlmostEqual(blended["a"], 80.0, places=6)
+        self.assertAlmostEqual(free["a"], 50.0, places=6)
+
+    def test_per_entity_curve_fit_is_batched_and_warm_started(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        build_unified_view = self._import_from_tmp_scripts("build_unified_view")
+        model_update = self._import_from_tmp_scripts("model_update")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        cfg_run = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        cfg_run["hierarchy"]["enabled"] = False
+        frames = synthetic_data.generate_synthetic_exports(40, n_days=14, seed=2)
+        unified = build_unified_view.build_unified_frame(frames["ga"], frames["spend"], frames["proxy"], None, None, cfg_run)
+
+        state, diag = model_update.update_model_state(unified, {}, {}, cfg_run)
+        fit = diag["curve_fit"]
+        self.assertGreater(fit["n_fitted"], 0)
+        self.assertEqual(fit["n_warm_started"], 0)
+        thetas = {round(e["curve"]["theta"], 6) for e in state["entities"].values() if e["curve"]["source"] == "fit"}
+        self.assertGreater(len(thetas), 1)
+
+        _, diag_warm = model_update.update_model_state(unified, state, {}, cfg_run)
+        self.assertEqual(diag_warm["curve_fit"]["n_warm_started"], fit["n_fitted"])
+        self.assertLess(diag_warm["curve_fit"]["mean_iterations"], fit["mean_iterations"])
+
+    def test_response_curve_tables_match_direct_evaluation(self) -> None:
+        response_curve = self._import_from_tmp_scripts("response_curve")
+        allocate = self._import_from_tmp_scripts("allocate")
+
+        b = np.array([0.0, 10.0, 50.0, 400.0])
+        g = response_curve.saturation(b, 0.8, 50.0)
+        self.assertAlmostEqual(float(g[2]), 0.5, places=9)
+        self.assertAlmostEqual(float(g[1]), response_curve.saturation(10.0, 0.8, 50.0), places=12)
+        h = 1e-4
+        fd = (response_curve.saturation(b[1:] + h, 0.8, 50.0) - response_curve.saturation(b[1:] - h, 0.8, 50.0)) / (2 * h)
+        np.testing.assert_allclose(response_curve.marginal(b[1:], 0.8, 50.0), fd, rtol=1e-5)
+
+        model_state = {
+            "entities": {
+                f"ga|Paid Search|c{i}": {
+                    "u_mean": 0.05 + 0.01 * i,
+                    "u_sd": 0.01,
+                    "p_u_gt_u_min": 1.0,
+                    "outcome_col": "revenue",
+                    "curve": {"a": 0.6 + 0.1 * i, "theta": 20.0 + 15.0 * i},
+                }
+                for i in range(6)
+            }
+        }
+        prev = {"campaigns": [{"entity_id": e, "recommended_budget": 40.0} for e in model_state["entities"]]}
+        cfg_run = {"step_pct_limit": 0.5, "alpha_gate": 0.1, "gamma_risk": 0.5, "lambda_inertia": 0.0001}
+        plans = {}
+        for tables in (True, False):
+            plan, _ = allocate.solve_allocation(
+                model_state=model_state,
+                prev_allocation=prev,
+                constraints_cfg={"budget_total": 260.0},
+                cfg_value={"default_value_per_revenue_eur": 100.0, "default_value_per_purchase": 100.0},
+                cfg_run={**cfg_run, "solver": {"curve_tables": tables}},
+                horizon="12h",
+            )
+            self.assertEqual(plan["solver"]["curve_table"], tables)
+            plans[tables] = [c["recommended_budget"] for c in plan["campaigns"]]
+        self.assertEqual(plans[True], plans[False])
+        self.assertAlmostEqual(sum(plans[True]), 260.0, places=6)
+
+    def test_planner_glide_path_respects_step_and_churn_per_period(self) -> None:
+        allocate = self._import_from_tmp_scripts("allocate")
+        planner = self._import_from_tmp_scripts("planner")
+
+        model_state = {
+            "entities": {
+                "ga|Paid Search|strong": {"u_mean": 0.2, "u_sd": 0.01, "p_u_gt_u_min": 1.0, "outcome_col": "revenue", "curve": {"a": 0.8, "theta": 400.0}},
+                "ga|Paid Search|weak": {"u_mean": 0.02, "u_sd": 0.01, "p_u_gt_u_min": 1.0, "outcome_col": "revenue", "curve": {"a": 0.8, "theta": 400.0}},
+                "ga|Paid Social|mid": {"u_mean": 0.05, "u_sd": 0.01, "p_u_gt_u_min": 1.0, "outcome_col": "revenue", "curve": {"a": 0.8, "theta": 400.0}},
+            }
+        }
+        prev = {"campaigns": [{"entity_id": e, "recommended_budget": 300.0} for e in model_state["entities"]]}
+        cfg_run = {
+            "step_pct_limit": 0.05,
+            "daily_churn_limit": 0.04,
+            "alpha_gate": 0.1,
+            "gamma_risk": 0.0,
+            "lambda_inertia": 0.00001,
+            "cadence_hours": 12,
+            "planner": {"enabled": True, "periods": 5},
+        }
+        cfg_value = {"default_value_per_revenue_eur": 1000.0, "default_value_per_purchase": 100.0}
+        constraints = {"budget_total": 900.0}
+        plan, _ = allocate.solve_allocation(model_state, prev, constraints, cfg_value, cfg_run, horizon="12h")
+        traj = planner.plan_trajectory(model_state, plan, constraints, cfg_value, cfg_run)
+
+        self.assertEqual([r["period"] for r in traj["steps"]], [1, 2, 3, 4, 5])
+        self.assertEqual(traj["steps"][1]["offset_hours"], 12)
+        self.assertEqual({c["entity_id"]: c["recommended_budget"] for c in plan["campaigns"]}, traj["steps"][0]["budgets"])
+        self.assertAlmostEqual(plan["totals"]["churn"], traj["steps"][0]["churn"], places=9)
+        strong = [r["budgets"]["ga|Paid Search|strong"] for r in traj["steps"]]
+        self.assertTrue(all(b2 >= b1 - 1e-9 for b1, b2 in zip(strong, strong[1:])))
+        self.assertGreater(strong[-1], strong[0])
+        period0 = {"budgets": {e: 300.0 for e in model_state["entities"]}}
+        for before, after in zip([period0] + traj["steps"], traj["steps"]):
+            self.assertAlmostEqual(sum(after["budgets"].values()), 900.0, places=6)
+            self.assertLessEqual(after["churn"], 0.04 + 1e-9)
+            for e, b in after["budgets"].items():
+                b_prev = before["budgets"][e]
+                self.assertLessEqual(abs(b - b_prev), 0.05 * max(1.0, b_prev) + 1e-9)
+
+        # Uneven previous budgets and stronger inertia: period 1 moves off the one-period solve,
+        # and the plan's solver metadata follows the committed budgets.
+        uneven = {"campaigns": [{"entity_id": e, "recommended_budget": b} for e, b in zip(model_state["entities"], [200.0, 450.0, 250.0])]}
+        sticky = dict(cfg_run, lambda_inertia=0.01)
+        one, _ = allocate.solve_allocation(model_state, uneven, constraints, cfg_value, sticky, horizon="12h")
+        plan = copy.deepcopy(one)
+        traj = planner.plan_trajectory(model_state, plan, constraints, cfg_value, sticky)
+        self.assertGreater(traj["period1_shift"], 1.0)
+        moved = sum(abs(c["recommended_budget"] - c["previous_budget"]) for c in plan["campaigns"])
+        self.assertAlmostEqual(plan["solver"]["churn_used"], moved, places=6)
+        self.assertNotEqual(plan["shadow_prices"], one["shadow_prices"])
+        self.assertIn(f"- Churn: {plan['totals']['churn']:.4f}", allocate.explain_plan(plan))
+
+        no_churn_cap = {k: v for k, v in cfg_run.items() if k != "daily_churn_limit"}
+        plan, _ = allocate.solve_allocation(model_state, prev, constraints, cfg_value, no_churn_cap, horizon="12h")
+        self.assertEqual(len(planner.plan_trajectory(model_state, plan, constraints, cfg_value, no_churn_cap)["steps"]), 5)
+
+    def test_optimize_budget_monte_carlo_risk_narrows_portfolio_band(self) -> None:
+        optimize_budget = self._import_from_tmp_scripts("optimize_budget")
+
+        model_state = {
+            "entities": {
+                f"ga|Paid Search|c{i}": {"u_mean": 0.1, "u_sd": 0.04, "p_u_gt_u_min": 1.0, "outcome_col": "revenue", "curve": {"a": 0.8, "theta": 50.0}}
+                for i in range(30)
+            }
+        }
+        prev = {"campaigns": [{"entity_id": e, "recommended_budget": 50.0} for e in model_state["entities"]]}
+        base_run = {"step_pct_limit": 0.1, "alpha_gate": 0.1, "gamma_risk": 0.0, "lambda_inertia": 0.0}
+        results = {}
+        for mode in ("bounds", "monte_carlo"):
+            cfg_run = {**base_run, "optimizer": {"risk_mode": mode, "mc_samples": 3000, "mc_chunk": 700}}
+            result, explain = optimize_budget.optimize_budget_for_target(
+                model_state, prev, {"budget_total": 1500.0}, {"default_value_per_revenue_eur": 100.0, "default_value_per_purchase": 100.0},
+                cfg_run, target_incremental_revenue=130.0, horizon="12h",
+            )
+            self.assertEqual(result["risk"]["mode"], mode)
+            results[mode] = result
+        self.assertIn("Risk mode: monte_carlo", explain)
+
+        bounds_mid = results["bounds"]["risk"]["curve"][20]
+        mc_mid = results["monte_carlo"]["risk"]["curve"][20]
+        self.assertEqual(set(mc_mid["quantiles"]), {"q10", "q50", "q90"})
+        self.assertGreater(mc_mid["conservative"], bounds_mid["conservative"])
+        self.assertLess(mc_mid["optimistic"], bounds_mid["optimistic"])
+        self.assertAlmostEqual(mc_mid["expected"], bounds_mid["expected"], delta=0.02 * bounds_mid["expected"])
+        # Common random numbers: the portfolio quantiles rise monotonically with the budget grid.
+        q10 = [row["conservative"] for row in results["monte_carlo"]["risk"]["curve"]]
+        self.assertTrue(all(b >= a - 1e-9 for a, b in zip(q10, q10[1:])))
+        self.assertTrue(results["monte_carlo"]["feasibility"]["conservative"])
+        self.assertFalse(results["bounds"]["feasibility"]["conservative"])
+
+    def test_backtest_replays_buckets_in_memory_and_carries_state(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        backtest = self._import_from_tmp_scripts("backtest")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        cfg = {name: skill_io.read_yaml(self.tmp / "config" / f"{name}.yaml") for name in ("run", "constraints", "value")}
+        frames = synthetic_data.generate_synthetic_exports(30, n_days=10, seed=4)
+        before = sorted(p.name for p in (self.tmp / "artifacts").iterdir())
+
+        report = backtest.run_backtest(
+            frames["ga"], frames["spend"], frames["proxy"],
+            "2026-02-14T00:00:00Z", "2026-02-16T00:00:00Z",
+            cfg["run"], cfg["constraints"], cfg["value"],
+            ad_mode=True, truth=frames["truth"],
+        )
+        steps = report["steps"]
+        self.assertEqual(len(steps), 4)
+        self.assertEqual(report["summary"]["n_errors"], 0)
+        self.assertEqual(sorted(p.name for p in (self.tmp / "artifacts").iterdir()), before)
+        self.assertTrue(all(s["ex_post_value"] is not None for s in steps[:-1]))
+        self.assertIsNone(steps[-1]["ex_post_value"])
+        self.assertTrue(all(s["observed_outcome_next"] is not None for s in steps[:-1]))
+        self.assertGreater(report["summary"]["true_value"], 0.0)
+        self.assertEqual(set(report["summary"]["stage_wall_s"]), {"proxies", "model", "allocate", "verify"})
+        # State is carried forward: later steps move from the previous plan, within the step limit.
+        self.assertTrue(all(s["churn"] <= cfg["run"]["step_pct_limit"] + 1e-9 for s in steps[1:]))
+        self.assertIn("# Backtest report", backtest.render_backtest(report))
+
+    def test_tune_successive_halving_ranks_configs_in_process_pool(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        tune = self._import_from_tmp_scripts("tune")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        cfg = {name: skill_io.read_yaml(self.tmp / "config" / f"{name}.yaml") for name in ("run", "constraints", "value")}
+        cfg["run"]["tune"] = {
+            "eta": 2,
+            "min_steps": 1,
+            "space": {"gamma_risk": [0.5, 2.0], "stability.smoothing_buckets": [2, 8]},
+        }
+        frames = synthetic_data.generate_synthetic_exports(20, n_days=8, seed=5)
+
+        report = tune.run_tuning(
+            frames["ga"], frames["spend"], frames["proxy"],
+            "2026-02-14T00:00:00Z", "2026-02-16T00:00:00Z",
+            cfg["run"], cfg["constraints"], cfg["value"],
+            ad_mode=True, truth=frames["truth"], samples=4, workers=2,
+        )
+        self.assertEqual(report["configs_sampled"], 4)
+        self.assertEqual([(h["evaluated"], h["steps"]) for h in report["rungs"]], [(4, 1), (2, 2), (1, 4)])
+        ranking = report["ranking"]
+        self.assertEqual([r["rank"] for r in ranking], [1, 2, 3, 4])
+        self.assertEqual([r["rung"] for r in ranking], [2, 1, 0, 0])
+        self.assertTrue(ranking[0]["pareto"])
+        self.assertEqual(ranking[0]["value_metric"], "true_value")
+        self.assertEqual(tune.apply_overrides({"stability": {"a": 1}}, {"stability.b": 2})["stability"], {"a": 1, "b": 2})
+        self.assertIn("| rank |", tune.render_tuning(report))
+
+    def test_paid_pushdown_skips_unpaid_entities_with_identical_paid_posteriors(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        build_unified_view = self._import_from_tmp_scripts("build_unified_view")
+        model_update = self._import_from_tmp_scripts("model_update")
+        proxy_eval = self._import_from_tmp_scripts("proxy_eval")
+        channel_policy = self._import_from_tmp_scripts("channel_policy")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        cfg_run = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        frames = synthetic_data.generate_synthetic_exports(60, n_days=14, seed=3, paid_share=0.4)
+        unified = build_unified_view.build_unified_frame(frames["ga"], frames["spend"], frames["proxy"], None, None, cfg_run)
+        expected = unified["entity_id"].map(lambda e: channel_policy.is_paid_entity(e, cfg_run))
+        self.assertTrue((unified["is_paid"] == expected).all())
+        self.assertTrue(unified["is_paid"].any() and not unified["is_paid"].all())
+
+        states = {}
+        for enabled in (False, True):
+            cfg = {**cfg_run, "paid_pushdown": {"enabled": enabled, "model": "skip", "proxy_weight": 0.0}}
+            catalog, _ = proxy_eval.evaluate_proxies(unified, {}, cfg)
+            state, diag = model_update.update_model_state(unified, {}, catalog, cfg)
+            states[enabled] = (channel_policy.filter_model_state_paid(state, cfg)["entities"], state, diag)
+
+        paid_off, _, diag_off = states[False]
+        paid_on, state_on, diag_on = states[True]
+        self.assertEqual(diag_off["n_unpaid_skipped"], 0)
+        self.assertGreater(diag_on["n_unpaid_skipped"], 0)
+        self.assertEqual(set(state_on["entities"]), set(paid_on))
+        self.assertEqual(set(paid_on), set(paid_off))
+        for e in paid_on:
+            self.assertAlmostEqual(paid_on[e]["u_mean"], paid_off[e]["u_mean"], places=9)
+
+        with self.assertRaises(ValueError):
+            model_update.update_model_state(unified, {}, {}, {**cfg_run, "paid_pushdown": {"enabled": True, "model": "drop"}})
+
+    def test_rollup_cube_serves_any_horizon_and_ingests_incrementally(self) -> None:
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        rollup_cube = self._import_from_tmp_scripts("rollup_cube")
+        api = self._import_from_tmp_scripts("api")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+        import pandas as pd
+
+        cfg_run = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        frames = synthetic_data.generate_synthetic_exports(30, n_days=10, seed=4)
+        full = rollup_cube.RollupCube.from_cfg(cfg_run)
+        full.ingest(frames["ga"], frames["spend"], frames["proxy"])
+
+        # Coarser views agree with the 12h view re-aggregated, and proxies stay exact means.
+        v12, v24 = full.view(12, cfg_run=cfg_run), full.view(24, cfg_run=cfg_run)
+        day = v12.assign(time_bucket_start=v12["time_bucket_start"].dt.floor("24h"))
+        sums = day.groupby(["time_bucket_start", "entity_id"])[["revenue", "purchases", "spend"]].sum().reset_index()
+        pd.testing.assert_frame_equal(sums, v24[["time_bucket_start", "entity_id", "revenue", "purchases", "spend"]])
+        proxy = frames["proxy"].assign(time_bucket_start=pd.to_datetime(frames["proxy"]["time"], utc=True).dt.floor("24h"))
+        col = next(c for c in proxy.columns if c.startswith("proxy_"))
+        raw_mean = proxy.groupby(["time_bucket_start", "entity_id"])[col].mean().rename("raw")
+        joined = v24.set_index(["time_bucket_start", "entity_id"]).join(raw_mean, how="inner")
+        np.testing.assert_allclose(joined[col], joined["raw"], rtol=1e-12)
+        self.assertEqual(len(full.view(48)), len(full.view(48).drop_duplicates(["time_bucket_start", "entity_id"])))
+        self.assertEqual(v12["purchases"].dtype, np.int64)
+
+        # Incremental ingest with an overlapping re-export equals ingesting everything once.
+        times = {k: pd.to_datetime(frames[k]["time"], utc=True) for k in ("ga", "spend", "proxy")}
+        cut = times["ga"].min() + pd.Timedelta(days=6)
+        inc = rollup_cube.RollupCube.from_cfg(cfg_run)
+        inc.ingest(*(frames[k][times[k] < cut] for k in ("ga", "spend", "proxy")))
+        touched = inc.ingest(*(frames[k][times[k] >= cut - pd.Timedelta(hours=30)] for k in ("ga", "spend", "proxy")))
+        self.assertGreater(touched["ga"], 0)
+        self.assertEqual(inc.input_rows["ga"], int((times["ga"] < cut).sum() + (times["ga"] >= cut - pd.Timedelta(hours=30)).sum()))
+        for hours in (12, 24, 168):
+            pd.testing.assert_frame_equal(inc.view(hours, cfg_run=cfg_run), full.view(hours, cfg_run=cfg_run))
+
+        ua = api.UpliftAllocator(root=self.tmp)
+        unified = ua.build(frames["ga"], frames["spend"], frames["proxy"], write=True)
+        pd.testing.assert_frame_equal(unified, v12)
+        fresh = api.UpliftAllocator(root=self.tmp)
+        pd.testing.assert_frame_equal(fresh.view("1d"), v24)
+
+    def test_history_store_appends_runs_and_answers_time_travel_queries(self) -> None:
+        import yaml
+
+        history_store = self._import_from_tmp_scripts("history_store")
+
+        path = self.tmp / "artifacts" / "history.sqlite"
+        state = {
+            "updated_at": "2026-02-15T12:00:00+00:00",
+            "entities": {
+                "ga|Paid Search|c1": {"u_mean": 0.05, "u_sd": 0.01, "p_u_gt_u_min": 0.99, "curve": {"a": 0.8, "theta": 50.0}},
+                "ga|Paid Social|__pooled__": {
+                    "u_mean": 0.03,
+                    "u_sd": 0.02,
+                    "p_u_gt_u_min": 0.7,
+                    "curve": {"a": 0.8, "theta": 50.0},
+                    "members": {"ga|Paid Social|m1": 0.5, "ga|Paid Social|m2": 0.5},
+                },
+            },
+        }
+
+        def plan(b: float) -> dict:
+            return {
+                "run": {"horizon": "12h"},
+                "totals": {"budget_total": 3 * b, "churn": 0.01},
+                "campaigns": [
+                    {"entity_id": "ga|Paid Search|c1", "recommended_budget": b, "previous_budget": 100.0, "gate_status": "increase", "binding_constraints": []},
+                    {"entity_id": "ga|Paid Social|m1", "parent_id": "ga|Paid Social|__pooled__", "recommended_budget": b, "previous_budget": b, "gate_status": "hold", "binding_constraints": ["parent_pool"]},
+                    {"entity_id": "ga|Paid Social|m2", "parent_id": "ga|Paid Social|__pooled__", "recommended_budget": b, "previous_budget": b, "gate_status": "hold", "binding_constraints": ["parent_pool"]},
+                ],
+            }
+
+        with history_store.HistoryStore(path) as store:
+            store.record_run(state, plan(100.0), {"hard_fail": False, "alerts": []}, run_ts="2026-02-15T12:05:00+00:00")
+            store.record_run(state, plan(105.0), {"hard_fail": True, "alerts": [{"type": "churn_limit_violation", "severity": "hard", "detail": "x"}]}, run_ts="2026-02-16T00:05:00+00:00")
+
+            # A reader sees committed runs while a writer holds an open transaction (WAL).
+            store.conn.execute("BEGIN IMMEDIATE")
+            store.conn.execute("INSERT INTO runs (run_ts) VALUES ('2026-02-16T12:05:00+00:00')")
+            with history_store.HistoryStore(path, readonly=True, busy_timeout_ms=100) as reader:
+                self.assertEqual(len(reader.runs()), 2)
+                hist = reader.entity_history("ga|Paid Search|c1")
+                self.assertEqual(hist["recommended_budget"].tolist(), [100.0, 105.0])
+                self.assertEqual(hist["u_mean"].tolist(), [0.05, 0.05])
+                pooled = reader.entity_history("ga|Paid Social|__pooled__")
+                self.assertEqual(sorted(set(pooled["plan_entity_id"])), ["ga|Paid Social|m1", "ga|Paid Social|m2"])
+                self.assertTrue((pooled["u_mean"] == 0.03).all())
+
+                snap = reader.as_of("2026-02-15T23:59:59+00:00")
+                self.assertEqual(snap["allocation_plan"]["campaigns"][0]["recommended_budget"], 100.0)
+                self.assertFalse(snap["alerts"]["hard_fail"])
+                self.assertEqual(snap["model_state"]["entities"]["ga|Paid Social|__pooled__"]["members"]["ga|Paid Social|m1"], 0.5)
+                later = reader.as_of("2026-03-01T00:00:00+00:00")
+                self.assertEqual(later["alerts"]["alerts"][0]["type"], "churn_limit_violation")
+                self.assertIsNone(reader.as_of("2026-01-01T00:00:00+00:00"))
+            store.conn.rollback()
+
+        # keep_days prunes runs older than that before the one being recorded.
+        with history_store.HistoryStore(path, keep_days=1) as store:
+            store.record_run(state, plan(110.0), {"hard_fail": False, "alerts": []}, run_ts="2026-02-17T00:05:00+00:00")
+            self.assertEqual(store.runs()["run_ts"].tolist(), ["2026-02-16T00:05:00+00:00", "2026-02-17T00:05:00+00:00"])
+            self.assertEqual(store.entity_history("ga|Paid Search|c1")["recommended_budget"].tolist(), [105.0, 110.0])
+            self.assertEqual(store.conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0], 1)
+
+        run_yaml = self.tmp / "config" / "run.yaml"
+        cfg_run = yaml.safe_load(run_yaml.read_text(encoding="utf-8"))
+        self.assertFalse(cfg_run["history"]["enabled"])
+        cfg_run["history"] = {"enabled": True, "path": "history.sqlite"}
+        run_yaml.write_text(yaml.safe_dump(cfg_run), encoding="utf-8")
+        proc = self._run("run", "--budget", "20000")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        proc = self._run("history")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        self.assertIn("run", proc.stdout.splitlines()[-1])
+        self.assertEqual(len(proc.stdout.strip().splitlines()), 4)
+
+    def test_quantile_sketches_merge_and_match_windowed_medians(self) -> None:
+        import pandas as pd
+
+        qs = self._import_from_tmp_scripts("quantile_sketch")
+        cfg = {"sketches": {"enabled": True, "k": 64, "entity_k": 16, "pane_hours": 24}}
+        rng = np.random.default_rng(7)
+        times = pd.date_range("2026-02-01", periods=20, freq="12h", tz="UTC")
+        df = pd.DataFrame(
+            [(t, f"ga|Paid Search|c{i}", float(rng.gamma(2.0, 50.0)), float(rng.gamma(1.5, 20.0))) for t in times for i in range(6)],
+            columns=["time_bucket_start", "entity_id", "spend", "revenue"],
+        )
+        start = times[4]
+        window = df[df["time_bucket_start"] >= start]
+
+        # Incremental ingestion (the partial last day pane is rebuilt) equals one pass over the window.
+        first = qs.update_sketch_state(None, df[df["time_bucket_start"] <= times[12]], "revenue", start, cfg)
+        self.assertEqual(first["ingested_buckets"], 9)
+        inc = qs.update_sketch_state(first, df, "revenue", start, cfg)
+        self.assertEqual(inc["ingested_buckets"], 8)
+        spend_med, ent_med = qs.windowed_medians(inc)
+
+        # A restated old bucket and a window start moving into a pane rebuild just that pane.
+        restated = df.assign(revenue=np.where(df["time_bucket_start"] == times[5], 3.0 * df["revenue"], df["revenue"]))
+        again = qs.update_sketch_state(inc, restated, "revenue", start, cfg)
+        self.assertEqual(again["ingested_buckets"], 2)
+        fresh = qs.update_sketch_state(None, restated, "revenue", start, cfg)
+        pd.testing.assert_series_equal(qs.windowed_medians(again)[1], qs.windowed_medians(fresh)[1])
+        moved = qs.update_sketch_state(inc, df, "revenue", times[5], cfg)
+        self.assertEqual(moved["ingested_buckets"], 1)
+        later = df[df["time_bucket_start"] >= times[5]].groupby("entity_id")["revenue"].median()
+        self.assertTrue(np.allclose(qs.windowed_medians(moved)[1].reindex(later.index).to_numpy(), later.to_numpy()))
+
+        # Per-entity sketches stay fixed-size: wide panes compact each entity to entity_k items.
+        wide = qs.update_sketch_state(None, window, "revenue", start, {"sketches": {"enabled": True, "entity_k": 8, "pane_hours": 720}})
+        sizes = [sum(len(lvl) for lvl in levels) for pane in wide["entity_outcome"].values() for levels in pane.values()]
+        self.assertLessEqual(max(sizes), 8)
+        self.assertLess(sum(sizes), len(window))
+        # 96 spend values exceed k=64, so the global median is approximate (rank error ~1/k).
+        self.assertLess(abs((window["spend"] < spend_med).mean() - 0.5), 0.05)
+        expected = window.groupby("entity_id")["revenue"].median()
+        self.assertTrue(np.allclose(ent_med.reindex(expected.index).to_numpy(), expected.to_numpy()))
+
+        # Sketches built on entity shards merge to the same medians.
+        shard = window["entity_id"].isin(["ga|Paid Search|c0", "ga|Paid Search|c1"])
+        a = qs.update_sketch_state(None, window[shard], "revenue", start, cfg)
+        b = qs.update_sketch_state(None, window[~shard], "revenue", start, cfg)
+        merged_spend, merged_ent = qs.windowed_medians(qs.merge_sketch_states(a, b))
+        self.assertTrue(np.allclose(merged_ent.reindex(expected.index).to_numpy(), expected.to_numpy()))
+        self.assertLess(abs((window["spend"] < merged_spend).mean() - 0.5), 0.05)
+
+        # A large stream stays within a small rank error while holding O(k log n) items.
+        stream = rng.lognormal(3.0, 1.0, 200_000)
+        sk = qs.QuantileSketch(200)
+        for part in np.array_split(stream, 50):
+            sk.merge(qs.QuantileSketch(200).update(part))
+        self.assertLess(len(sk.items()[0]), 5000)
+        self.assertLess(abs((stream < sk.median()).mean() - 0.5), 0.01)
+
+        # Shipped config: off; switched on, 12h buckets in 168h panes keep baselines exact.
+        skill_io = self._import_from_tmp_scripts("skill_io")
+        shipped = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        self.assertFalse(qs.sketch_cfg(shipped)["enabled"])
+        shipped["sketches"] = dict(shipped["sketches"], enabled=True)
+        days = pd.date_range("2026-02-01", periods=56, freq="12h", tz="UTC")
+        month = pd.DataFrame(
+            [(t, f"ga|Paid Search|c{i}", float(rng.gamma(2.0, 50.0)), float(rng.gamma(1.5, 20.0))) for t in days for i in range(4)],
+            columns=["time_bucket_start", "entity_id", "spend", "revenue"],
+        )
+        _, shipped_med = qs.windowed_medians(qs.update_sketch_state(None, month, "revenue", days[0], shipped))
+        exact = month.groupby("entity_id")["revenue"].median()
+        self.assertTrue(np.allclose(shipped_med.reindex(exact.index).to_numpy(), exact.to_numpy()))
+
+    def test_ga_fetch_pages_concurrently_with_retries_and_matches_csv_build(self) -> None:
+        import pandas as pd
+
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        fake_ga_server = self._import_from_tmp_scripts("fake_ga_server")
+        ga_fetch = self._import_from_tmp_scripts("ga_fetch")
+        api = self._import_from_tmp_scripts("api")
+
+        exports = synthetic_data.generate_synthetic_exports(60, n_days=14, seed=3)
+        cfg_run = api.UpliftAllocator(root=self.tmp).cfg_run
+        cfg_run["ga_fetch"] = {"page_size": 200, "concurrency": 6, "rate_limit_per_s": 0, "backoff_s": 0.01, "max_retries": 6}
+        start, end = "2026-02-02T00:00:00Z", "2026-02-16T00:00:00Z"
+
+        with fake_ga_server.FakeGAServer(exports["ga"], latency_s=0.01, fail_every=4, max_concurrent=5) as srv:
+            ga, stats = ga_fetch.fetch_ga_frame(cfg_run, start, end, base_url=srv.base_url)
+            served = dict(srv.stats)
+        self.assertEqual(stats["rows"], 60 * 14 * 2)
+        self.assertEqual(stats["pages"], 9)
+        self.assertGreater(stats["retries"], 0)
+        self.assertEqual(stats["retries"], served["failed"] + served["throttled"])
+        self.assertGreater(stats["max_in_flight"], 1)
+        self.assertLessEqual(stats["max_in_flight"], 6)
+
+        # Pages folded into the build aggregation give the same unified view as the CSV export.
+        from_fetch = api.UpliftAllocator(root=self.tmp, cfg_run=cfg_run).build(ga=ga, spend=exports["spend"], proxy=exports["proxy"])
+        from_csv = api.UpliftAllocator(root=self.tmp, cfg_run=cfg_run).build(ga=exports["ga"], spend=exports["spend"], proxy=exports["proxy"])
+        pd.testing.assert_frame_equal(from_fetch, from_csv)
+
+        # dateHour in the property's time zone maps back to the same UTC hours.
+        tz_run = {**cfg_run, "ga_fetch": {**cfg_run["ga_fetch"], "timezone": "America/New_York"}}
+        with fake_ga_server.FakeGAServer(exports["ga"], timezone="America/New_York") as srv:
+            ga_local, _ = ga_fetch.fetch_ga_frame(tz_run, start, end, base_url=srv.base_url)
+        pd.testing.assert_frame_equal(ga_local, ga)
+
+        # Non-retryable errors surface immediately; retryable ones give up after max_retries.
+        cfg_run["ga_fetch"]["max_retries"] = 1
+        with fake_ga_server.FakeGAServer(exports["ga"], fail_every=1) as srv:
+            with self.assertRaises(RuntimeError):
+                ga_fetch.fetch_ga_frame(cfg_run, start, end, base_url=srv.base_url)
+            self.assertEqual(srv.stats["requests"], 2)
+
+        with fake_ga_server.FakeGAServer(self.tmp / "data" / "ga" / "ga_export_example.csv") as srv:
+            proc = self._run("build", "--ga-url", srv.base_url, "--start", "2026-02-15T00:00:00Z", "--end", "2026-02-17T00:00:00Z")
+            self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+            self.assertGreater(srv.stats["served"], 0)
+        metrics = json.loads((self.tmp / "artifacts" / "run_metrics.json").read_text(encoding="utf-8"))
+        self.assertEqual([s["stage"] for s in metrics["stages"]], ["fetch", "build"])
+        self.assertEqual(len(pd.read_csv(self.tmp / "artifacts" / "unified_view.csv")), 3)
+
+    def test_ad_sources_merge_join_matches_single_export_and_applies_conflict_rules(self) -> None:
+        import pandas as pd
+        import yaml
+
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        build_unified_view = self._import_from_tmp_scripts("build_unified_view")
+        ad_sources = self._import_from_tmp_scripts("ad_sources")
+
+        ex = synthetic_data.generate_synthetic_exports(40, n_days=7, seed=5)
+        cfg = {"cadence_hours": 12}
+        spend, proxy = ex["spend"], ex["proxy"]
+        ids = spend["entity_id"].unique()
+        google = spend["entity_id"].isin(ids[::2])
+        sources = [
+            {"name": "google", "spend": spend[google].rename(columns={"spend": "cost"}), "columns": {"cost": "spend"}, "proxy": proxy[proxy["entity_id"].isin(ids[::2])]},
+            {"name": "meta", "spend": spend[~google], "proxy": proxy[~proxy["entity_id"].isin(ids[::2])]},
+        ]
+
+        # Disjoint platforms joined per source equal the single combined export.
+        single = build_unified_view.build_unified_frame(ex["ga"], spend, proxy, None, None, cfg)
+        cube = build_unified_view.build_rollup_cube(ex["ga"], None, None, cfg, sources=sources)
+        pd.testing.assert_frame_equal(cube.view(12, None, None, cfg), single)
+        self.assertEqual(cube.source_stats["spend_conflicts"], {"google": 0, "meta": 0})
+
+        # Overlapping keys follow the conflict rule; prefixes keep platform proxies apart.
+        a = pd.DataFrame({"time": ["2026-02-10T01:00:00Z", "2026-02-10T02:00:00Z"], "entity_id": ["e1", "e1"], "spend": [10.0, 5.0], "proxy_clicks": [4.0, 2.0]})
+        b = pd.DataFrame({"time": ["2026-02-10T01:00:00Z", "2026-02-10T05:00:00Z"], "entity_id": ["e1", "e2"], "spend": [30.0, 7.0], "proxy_clicks": [8.0, 1.0]})
+        two = [{"name": "a", "spend": a, "proxy": a.drop(columns="spend")}, {"name": "b", "spend": b, "proxy": b.drop(columns="spend")}]
+        expected = {"sum": [40.0, 5.0, 7.0], "max": [30.0, 5.0, 7.0], "priority": [10.0, 5.0, 7.0]}
+        for rule, values in expected.items():
+            s, p, stats = ad_sources.merge_ad_sources(two, 1, spend_conflict=rule)
+            self.assertEqual(s["spend"].tolist(), values, msg=rule)
+            self.assertEqual(stats["spend_conflicts"], {"a": 0, "b": 1})
+        self.assertEqual((p["proxy_clicks__sum"] / p["proxy_clicks__n"]).tolist(), [6.0, 2.0, 1.0])
+        _, p, _ = ad_sources.merge_ad_sources([{**two[0], "prefix": "g_"}, {**two[1], "prefix": "m_"}], 1)
+        self.assertEqual(sorted(c for c in p.columns if c.endswith("__sum")), ["proxy_g_clicks__sum", "proxy_m_clicks__sum"])
+        with self.assertRaises(ValueError):
+            ad_sources.merge_ad_sources(two, 1, spend_conflict="error")
+        # Priority overrides list order.
+        s, _, _ = ad_sources.merge_ad_sources([{**two[0], "priority": 2}, {**two[1], "priority": 1}], 1, spend_conflict="priority")
+        self.assertEqual(s["spend"].tolist(), [30.0, 5.0, 7.0])
+
+        # CLI: configured sources replace the single example exports.
+        ad_dir = self.tmp / "data" / "ad"
+        pd.read_csv(ad_dir / "spend_example.csv").rename(columns={"spend": "amount_spent"}).to_csv(ad_dir / "meta_spend.csv", index=False)
+        run_yaml = self.tmp / "config" / "run.yaml"
+        cfg_run = yaml.safe_load(run_yaml.read_text(encoding="utf-8"))
+        cfg_run["ad_sources"]["sources"] = [
+            {"name": "meta", "spend": "data/ad/meta_spend.csv", "columns": {"amount_spent": "spend"}},
+            {"name": "google", "proxy": "data/ad/proxy_example.csv", "prefix": "gads_"},
+        ]
+        run_yaml.write_text(yaml.safe_dump(cfg_run), encoding="utf-8")
+        proc = self._run("build")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        unified = pd.read_csv(self.tmp / "artifacts" / "unified_view.csv")
+        self.assertEqual(float(unified["spend"].sum()), 125.0)
+        self.assertIn("proxy_gads_clicks", unified.columns)
+
+    def test_plan_outputs_stream_ndjson_and_delta_without_hold_rows(self) -> None:
+        plan_output = self._import_from_tmp_scripts("plan_output")
+        api = self._import_from_tmp_scripts("api")
+
+        def row(i: int, status: str) -> dict:
+            return {"entity_id": f"ga|Paid Search|c{i}", "recommended_budget": 100.0 + i, "previous_budget": 100.0, "gate_status": status, "binding_constraints": []}
+
+        prev = {"campaigns": [row(i, "hold") for i in range(6)]}
+        plan = {
+            "run": {"horizon": "12h"},
+            "totals": {"budget_total": 1000.0, "churn": 0.01},
+            "solver": {"iterations": 3},
+            "campaigns": [row(0, "increase")] + [row(i, "hold") for i in range(1, 4)] + [row(4, "decrease")],
+        }
+        ua = api.UpliftAllocator(root=self.tmp, cfg_run={"plan_output": {"full_json": False, "delta": True}})
+        plan_output.write_plan_outputs(ua.paths, plan, ua.cfg_run, prev_plan=prev)
+
+        self.assertFalse(ua.paths["allocation"].exists())
+        lines = ua.paths["allocation_ndjson"].read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1 + 5)
+        self.assertEqual(json.loads(lines[0])["n_campaigns"], 5)
+        self.assertEqual([c["entity_id"] for c in plan_output.iter_plan_ndjson(ua.paths["allocation_ndjson"])], [c["entity_id"] for c in plan["campaigns"]])
+
+        delta = json.loads(ua.paths["allocation_delta"].read_text(encoding="utf-8"))
+        self.assertEqual([c["gate_status"] for c in delta["campaigns"]], ["increase", "decrease"])
+        self.assertEqual((delta["n_campaigns"], delta["n_changed"]), (5, 2))
+        self.assertEqual(delta["removed"], ["ga|Paid Search|c5"])
+        self.assertEqual(delta["totals"], plan["totals"])
+        self.assertNotIn("\n", ua.paths["allocation_delta"].read_text(encoding="utf-8"))
+
+        # Without the full JSON the NDJSON is the previous plan for the next run.
+        self.assertEqual(ua.load_artifacts().allocation_plan, plan)
+
+        proc = self._run("run", "--budget", "20000")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        full = json.loads((self.tmp / "artifacts" / "allocation_plan.json").read_text(encoding="utf-8"))
+        streamed = plan_output.read_plan_ndjson(self.tmp / "artifacts" / "allocation_plan.ndjson")
+        self.assertEqual(streamed, full)
+        delta = json.loads((self.tmp / "artifacts" / "allocation_delta.json").read_text(encoding="utf-8"))
+        self.assertEqual(delta["n_changed"], sum(c["gate_status"] != "hold" for c in full["campaigns"]))
+
+    def test_ga_only_plan_projects_onto_bounds_caps_and_step_limits(self) -> None:
+        import pandas as pd
+
+        ga_only = self._import_from_tmp_scripts("suggest_ga_only_plan")
+        verify = self._import_from_tmp_scripts("verify")
+        cfg_run = {"cadence_hours": 12, "step_pct_limit": 0.05, "daily_churn_limit": 0.02, "proxy": {"sigma_floor": 1.0}}
+        ids = [f"ga|Paid Search|s{i}" for i in range(6)] + [f"ga|Display|d{i}" for i in range(4)] + ["ga|Organic Search|brand"]
+        unified = pd.DataFrame({"entity_id": ids, "revenue": [500.0, 100, 50, 20, 10, 0, 900, 300, 10, 0, 5000], "purchases": 1.0, "spend": 0.0})
+        constraints = {
+            "budget_total": 10000.0,
+            "bounds_default": {"min": 100.0, "max": None},
+            "channel_caps": {"Display": 3000.0},
+            "campaign_bounds": {"ga|Paid Search|s0": {"max": 2500.0}},
+        }
+
+        cold, _ = ga_only.suggest_ga_only_plan(unified, 10000.0, cfg_run, constraints, None)
+        b = {c["entity_id"]: c["recommended_budget"] for c in cold["campaigns"]}
+        self.assertNotIn("ga|Organic Search|brand", b)
+        self.assertAlmostEqual(sum(b.values()), 10000.0, places=6)
+        self.assertLessEqual(sum(v for k, v in b.items() if "|Display|" in k), 3000.0 + 1e-6)
+        self.assertAlmostEqual(b["ga|Paid Search|s0"], 2500.0, places=6)
+        self.assertGreaterEqual(min(b.values()), 100.0 - 1e-9)
+        rows = {c["entity_id"]: c for c in cold["campaigns"]}
+        self.assertIn("campaign_bounds", rows["ga|Paid Search|s0"]["binding_constraints"])
+        self.assertIn("channel_cap", rows["ga|Display|d0"]["binding_constraints"])
+        self.assertTrue(all(c["gate_status"] == "hold" for c in cold["campaigns"]))
+        self.assertFalse(verify.verify_and_challenge(unified, {}, {}, cold, cfg_run, constraints)["hard_fail"])
+
+        # Outcomes flip: the plan moves toward the new shares only within step and churn limits.
+        unified["revenue"] = unified["revenue"].to_numpy()[::-1]
+        warm, explain = ga_only.suggest_ga_only_plan(unified, 10000.0, cfg_run, constraints, cold)
+        for c in warm["campaigns"]:
+            self.assertLessEqual(abs(c["recommended_budget"] - b[c["entity_id"]]), 0.05 * b[c["entity_id"]] + 1e-6)
+        self.assertAlmostEqual(warm["totals"]["budget_allocated"], 10000.0, places=6)
+        self.assertLessEqual(warm["totals"]["churn"], 0.02)
+        self.assertIn("churn limit binding", explain)
+        self.assertTrue(any(c["gate_status"] != "hold" for c in warm["campaigns"]))
+        self.assertFalse(verify.verify_and_challenge(unified, {}, {}, warm, cfg_run, constraints)["hard_fail"])
+
+    def test_hyperpriors_pool_channel_posteriors_and_seed_new_entities(self) -> None:
+        import pandas as pd
+
+        hyperprior = self._import_from_tmp_scripts("hyperprior")
+        model_update = self._import_from_tmp_scripts("model_update")
+        api = self._import_from_tmp_scripts("api")
+        cfg_run = api.UpliftAllocator(root=self.tmp).cfg_run
+        cfg_run["hyperpriors"] = {"enabled": True, "levels": ["channel"], "min_entities": 3, "shrinkage_entities": 2}
+        cfg_run["hierarchy"] = {"enabled": False}
+
+        rng = np.random.default_rng(11)
+        ids = [f"ga|Paid Search|s{i}" for i in range(12)] + [f"ga|Display|d{i}" for i in range(12)] + ["ga|Video|v0", "ga|Video|v1"]
+        mu = np.r_[rng.normal(0.08, 0.01, 12), rng.normal(0.005, 0.002, 12), [0.05, 0.05]]
+        sd = np.full(len(ids), 0.01)
+        hp = hyperprior.estimate_hyperpriors(ids, mu, sd, cfg_run)
+        self.assertAlmostEqual(hp["channel"]["Paid Search"]["u_mean"], 0.08, delta=0.01)
+        self.assertAlmostEqual(hp["channel"]["Display"]["u_mean"], 0.005, delta=0.01)
+        self.assertNotIn("Video", hp["channel"])  # below min_entities
+        p_mu, p_sd = hyperprior.hyperprior_arrays(["ga|Paid Search|new", "ga|Video|new", "ga|Social|new"], hp)
+        self.assertAlmostEqual(p_mu[0], hp["channel"]["Paid Search"]["u_mean"])
+        self.assertAlmostEqual(p_mu[1], hp["global"]["u_mean"])
+        self.assertTrue(np.all(p_sd >= 0.005))
+        self.assertEqual(hyperprior.hyperprior_arrays(["ga|Paid Search|new"], None)[0][0], 0.02)
+
+        # A campaign first seen this run starts from its channel's prior instead of 0.02.
+        times = pd.date_range("2026-02-01", periods=8, freq="12h", tz="UTC")
+        unified = pd.DataFrame(
+            [(t, e, 100.0, 0.0, 0.0) for t in times for e in ["ga|Paid Search|s0", "ga|Paid Search|fresh"]],
+            columns=["time_bucket_start", "entity_id", "spend", "revenue", "purchases"],
+        )
+        prev = {"entities": {e: {"u_mean": float(m), "u_sd": 0.01, "info_score_I": 20.0} for e, m in zip(ids, mu)}, "hyperpriors": hp}
+        state, diag = model_update.update_model_state(unified, prev, {}, cfg_run)
+        self.assertEqual(diag["n_hyperprior_priors"], 1)
+        fresh = state["entities"]["ga|Paid Search|fresh"]["u_mean"]
+        self.assertGreater(fresh, 0.05)
+        cfg_run["hyperpriors"]["enabled"] = False
+        cold, _ = model_update.update_model_state(unified, prev, {}, cfg_run)
+        self.assertLess(cold["entities"]["ga|Paid Search|fresh"]["u_mean"], 0.03)
+        self.assertNotIn("hyperpriors", cold)
+
+    def test_typed_reads_use_categoricals_and_reject_malformed_files(self) -> None:
+        import pandas as pd
+
+        schemas = self._import_from_tmp_scripts("schemas")
+        d = self.tmp / "schema_inputs"
+        d.mkdir(exist_ok=True)
+
+        ga = d / "ga.csv"
+        ga.write_text(
+            "time,default_channel_group,campaign,revenue,purchases,notes\n"
+            "2026-02-15T00:00:00Z,Paid Search,brand,120.5,1,x\n"
+            "2026-02-15T12:00:00+01:00,Paid Search,brand,,0,y\n",
+            encoding="utf-8",
+        )
+        df = schemas.read_typed(ga, "ga")
+        self.assertNotIn("notes", df.columns)
+        self.assertIsInstance(df["campaign"].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(df["time"].dtype), "datetime64[ns, UTC]")
+        self.assertEqual(df["time"].iloc[1], pd.Timestamp("2026-02-15T11:00:00Z"))
+        self.assertEqual(df["revenue"].dtype, np.float64)
+
+        spend = d / "spend.csv"
+        spend.write_text("time,entity_id,amount\n2026-02-15T00:00:00Z,ga|Paid Search|brand,5\n", encoding="utf-8")
+        self.assertEqual(float(schemas.read_typed(spend, "ad_spend", rename={"amount": "spend"})["spend"].iloc[0]), 5.0)
+
+        bad = {
+            "missing": ("time,entity_id\n2026-02-15T00:00:00Z,a|b|c\n", "ad_spend", "spend"),
+            "number": ("time,entity_id,spend\n2026-02-15T00:00:00Z,a|b|c,1\n2026-02-15T12:00:00Z,a|b|c,1x\n", "ad_spend", "row 3"),
+            "time": ("time,entity_id,spend\n2026-02-15T00:00:00Z,a|b|c,1\n15/02/2026,a|b|c,2\n", "ad_spend", "row 3"),
+            "empty": ("", "ga", "empty file"),
+        }
+        for name, (text, kind, expect) in bad.items():
+            path = d / f"{name}.csv"
+            path.write_text(text, encoding="utf-8")
+            with self.assertRaises(ValueError) as ctx:
+                schemas.read_typed(path, kind)
+            self.assertIn(str(path), str(ctx.exception))
+            self.assertIn(expect, str(ctx.exception))
+
+    def test_shadow_prices_match_perturbed_solves_and_prune_budget_search(self) -> None:
+        allocate = self._import_from_tmp_scripts("allocate")
+        optimize_budget = self._import_from_tmp_scripts("optimize_budget")
+
+        ents = {
+            f"ga|{'Paid Search' if i < 3 else 'Paid Social'}|c{i}": {
+                "u_mean": 0.05 + 0.02 * i, "u_sd": 0.01, "p_u_gt_u_min": 1.0, "outcome_col": "revenue",
+                "curve": {"a": 0.8, "theta": 200.0 + 50.0 * i},
+            }
+            for i in range(6)
+        }
+        state = {"entities": ents}
+        prev = {"campaigns": [{"entity_id": e, "recommended_budget": 300.0} for e in ents]}
+        cfg_run = {"step_pct_limit": 0.5, "alpha_gate": 0.1, "gamma_risk": 0.5, "lambda_inertia": 0.0}
+        value = {"default_value_per_revenue_eur": 1000.0, "default_value_per_purchase": 1.0}
+        cons = {"budget_total": 1800.0, "channel_caps": {"Paid Social": 950.0}, "campaign_bounds": {"ga|Paid Search|c2": {"max": 320}}}
+
+        def score(plan):
+            w = {e: 1000.0 * (s["u_mean"] - 0.5 * s["u_sd"]) for e, s in ents.items()}
+            return sum(w[c["entity_id"]] * (c["recommended_budget"] ** 0.8 / (c["recommended_budget"] ** 0.8 + ents[c["entity_id"]]["curve"]["theta"] ** 0.8)) for c in plan["campaigns"])
+
+        plan, explain = allocate.solve_allocation(state, prev, cons, value, cfg_run, horizon="12h")
+        sp = plan["shadow_prices"]
+        self.assertIn("Next unit of budget", explain)
+        self.assertTrue(all("marginal_roi" in c for c in plan["campaigns"]))
+        self.assertEqual(set(sp["channel_caps"]), {"Paid Social"})
+        self.assertEqual([(r["entity_id"], r["constraint"]) for r in sp["campaign_limits"]], [("ga|Paid Search|c2", "campaign_bounds")])
+
+        # Each shadow price predicts the gain of a small relaxation (within curvature).
+        relaxed = {
+            "budget": ({**cons, "budget_total": 1810.0}, sp["budget"]["next_unit"]),
+            "cap": ({**cons, "channel_caps": {"Paid Social": 960.0}}, sp["channel_caps"]["Paid Social"]),
+            "bound": ({**cons, "campaign_bounds": {"ga|Paid Search|c2": {"max": 330}}}, sp["campaign_limits"][0]["shadow_price"]),
+        }
+        for name, (c_cfg, price) in relaxed.items():
+            gain = (score(allocate.solve_allocation(state, prev, c_cfg, value, cfg_run, horizon="12h")[0]) - score(plan)) / 10.0
+            self.assertAlmostEqual(gain, price, delta=0.2 * price, msg=name)
+
+        # Pruned search finds the same budget points with far fewer solves.
+        out = {}
+        for search in ("grid", "pruned"):
+            run = {**cfg_run, "step_pct_limit": 0.1, "optimizer": {"risk_mode": "bounds", "search": search}}
+            out[search], _ = optimize_budget.optimize_budget_for_target(state, prev, {"budget_total": 1800.0}, value, run, 283.0, horizon="12h")
+        self.assertEqual(out["pruned"]["budget_points"], out["grid"]["budget_points"])
+        self.assertEqual(out["pruned"]["feasibility"], out["grid"]["feasibility"])
+        self.assertEqual(out["grid"]["search"]["candidates_evaluated"], 41)
+        self.assertIsNotNone(out["grid"]["budget_points"]["expected_budget"])
+        self.assertLess(out["pruned"]["search"]["candidates_evaluated"], 15)
+
+    def test_screening_flags_spikes_outages_and_duplicates_and_masks_them(self) -> None:
+        import pandas as pd
+
+        synthetic_data = self._import_from_tmp_scripts("synthetic_data")
+        build_unified_view = self._import_from_tmp_scripts("build_unified_view")
+        screening = self._import_from_tmp_scripts("screening")
+        api = self._import_from_tmp_scripts("api")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+
+        cfg_run = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        frames = synthetic_data.generate_synthetic_exports(40, n_days=14, seed=3)
+        unified = build_unified_view.build_unified_frame(frames["ga"], frames["spend"], frames["proxy"], None, None, cfg_run)
+        _, clean = screening.screen_unified(unified, cfg_run)
+        self.assertEqual(clean["rows_flagged"], 0)
+
+        times = sorted(unified["time_bucket_start"].unique())
+        step = unified.copy()
+        step.loc[step["time_bucket_start"] >= times[20], ["spend", "revenue", "purchases"]] *= 2
+        _, stepped = screening.screen_unified(step, cfg_run)
+        self.assertEqual(stepped["duplicate_buckets"], {})
+
+        ent = sorted(unified.loc[unified["spend"] > 0, "entity_id"].unique())[0]
+        bad = unified.copy()
+        bad.loc[(bad["entity_id"] == ent) & (bad["time_bucket_start"] == times[5]), "spend"] *= 25
+        bad.loc[bad["time_bucket_start"] == times[12], ["revenue", "purchases"]] = 0.0
+        bad.loc[bad["time_bucket_start"] == times[20], ["revenue", "purchases"]] *= 2
+        bad = pd.concat([bad, bad.iloc[[0]]], ignore_index=True)
+
+        flagged, report = screening.screen_unified(bad, cfg_run)
+        self.assertIs(flagged, bad)
+        self.assertEqual(report["counts"]["spike"]["spend"], 1)
+        self.assertEqual(report["flags"][0]["entity_id"], ent)
+        self.assertEqual(report["flags"][0]["reasons"], ["spike_spend"])
+        self.assertEqual(report["outage_buckets"]["revenue"], [pd.Timestamp(times[12]).isoformat()])
+        self.assertEqual(report["duplicate_buckets"]["purchases"], [pd.Timestamp(times[20]).isoformat()])
+        self.assertEqual(report["counts"]["duplicate_rows"], 1)
+        n_bucket = int((bad["time_bucket_start"] == times[12]).sum()) + int((bad["time_bucket_start"] == times[20]).sum())
+        self.assertEqual(report["rows_flagged"], n_bucket + 1 + 2)
+
+        cfg_mask = dict(cfg_run, screening=dict(cfg_run["screening"], action="mask"))
+        masked, report = screening.screen_unified(bad, cfg_mask)
+        self.assertEqual(report["rows_masked"], report["rows_flagged"])
+        self.assertEqual(len(masked), len(bad) - report["rows_flagged"])
+        self.assertFalse(masked["time_bucket_start"].isin([times[12], times[20]]).any())
+
+        art = self.tmp / "artifacts_screen"
+        ua = api.UpliftAllocator(root=self.tmp, art_dir=art, cfg_run=cfg_mask, cfg_entities={})
+        art.mkdir()
+        bad.to_csv(art / "unified_view.csv", index=False)
+        ua.unified = bad
+        ua.screen(write=True)
+        self.assertIs(ua.unified, bad)
+        self.assertEqual(len(ua.screened), len(masked))
+        self.assertEqual(len(pd.read_csv(art / "unified_view.csv")), len(bad))
+        self.assertEqual(len(pd.read_csv(art / "screened_view.csv")), len(masked))
+        self.assertEqual(json.loads((art / "screening_report.json").read_text(encoding="utf-8"))["rows_masked"], len(bad) - len(masked))
+        reloaded = api.UpliftAllocator(root=self.tmp, art_dir=art, cfg_run=cfg_mask, cfg_entities={}).load_artifacts()
+        self.assertEqual(len(reloaded._view_input()), len(masked))
+        ua.update_model()
+        _, _, alerts = ua.allocate(budget=1000.0)
+        self.assertIn("data_screening", [a["type"] for a in alerts["alerts"]])
+
+    def test_state_tiers_move_dormant_entities_to_cold_store_and_revive_them(self) -> None:
+        import pandas as pd
+
+        api = self._import_from_tmp_scripts("api")
+        skill_io = self._import_from_tmp_scripts("skill_io")
+        state_tiers = self._import_from_tmp_scripts("state_tiers")
+        plan_output = self._import_from_tmp_scripts("plan_output")
+
+        cfg_run = skill_io.read_yaml(self.tmp / "config" / "run.yaml")
+        self.assertFalse(cfg_run["state_tiers"]["enabled"])
+        cfg_run["state_tiers"] = dict(cfg_run["state_tiers"], enabled=True)
+        cfg_run["hierarchy"] = {"enabled": False}
+        times = pd.date_range("2026-01-20", periods=56, freq="12h", tz="UTC")
+
+        def frame(paused_from: int, resumed_at: int) -> pd.DataFrame:
+            rows = []
+            for k, t in enumerate(times):
+                for name in ("a", "b", "c"):
+                    on = name != "b" or k < paused_from or k >= resumed_at
+                    spend = 100.0 + 10 * (k % 3) if on else 0.0
+                    rows.append({"time_bucket_start": t, "entity_id": f"ga|Paid Search|{name}", "spend": spend, "revenue": 1.5 * spend, "purchases": spend / 50})
+            return pd.DataFrame(rows)
+
+        art = self.tmp / "artifacts_tiers"
+        ua = api.UpliftAllocator(root=self.tmp, art_dir=art, cfg_run=cfg_run, cfg_entities={})
+        ua.unified = frame(paused_from=20, resumed_at=len(times))
+        state, diag = ua.update_model(write=True)
+        self.assertEqual(sorted(state["entities"]), ["ga|Paid Search|a", "ga|Paid Search|c"])
+        self.assertEqual(diag["state_tiers"]["n_dormant"], 1)
+        self.assertEqual(diag["state_tiers"]["n_cold"], 1)
+        self.assertNotIn("ga|Paid Search|b", json.loads((art / "model_state.json").read_text(encoding="utf-8"))["entities"])
+        with state_tiers.ColdStateStore.from_cfg(art, cfg_run) as store:
+            cold = store.get(["ga|Paid Search|b", "ga|Paid Search|a"])
+        self.assertEqual(list(cold), ["ga|Paid Search|b"])
+        self.assertEqual(cold["ga|Paid Search|b"]["last_active"], str(times[19]))
+
+        # Still dormant on the next runs: not revived, and the cold record is not widened again.
+        for _ in range(2):
+            ua = api.UpliftAllocator(root=self.tmp, art_dir=art, cfg_run=cfg_run, cfg_entities={}).load_artifacts()
+            ua.unified = frame(paused_from=20, resumed_at=len(times))
+            _, diag = ua.update_model(write=True)
+            self.assertEqual(diag["state_tiers"]["n_revived"], 0)
+            with state_tiers.ColdStateStore.from_cfg(art, cfg_run) as store:
+                self.assertAlmostEqual(store.get(["ga|Paid Search|b"])["ga|Paid Search|b"]["u_sd"], cold["ga|Paid Search|b"]["u_sd"])
+
+        # Dormant entities are not "removed" from the plan delta; no last_active stays hot.
+        prev_plan = {"campaigns": [{"entity_id": "ga|Paid Search|a"}, {"entity_id": "ga|Paid Search|b"}, {"entity_id": "ga|Paid Search|x"}]}
+        delta = plan_output.plan_delta({"campaigns": [{"entity_id": "ga|Paid Search|a", "gate_status": "hold"}]}, prev_plan, dormant=["ga|Paid Search|b"])
+        self.assertEqual(delta["removed"], ["ga|Paid Search|x"])
+        self.assertEqual(delta["dormant"], ["ga|Paid Search|b"])
+        unknown = dict(state, entities={"ga|Paid Search|u": {"u_mean": 0.02, "u_sd": 0.03, "last_active": None}})
+        hot, gone = state_tiers.split_dormant(unknown, {}, cfg_run)
+        self.assertEqual((list(hot["entities"]), gone), (["ga|Paid Search|u"], {}))
+
+        # A fresh process resumes from artifacts; b comes back as a prior from cold storage.
+        ua = api.UpliftAllocator(root=self.tmp, art_dir=art, cfg_run=cfg_run, cfg_entities={}).load_artifacts()
+        ua.unified = frame(paused_from=20, resumed_at=50)
+        state, diag = ua.update_model(write=True)
+        self.assertEqual(diag["state_tiers"]["n_revived"], 1)
+        self.assertIn("ga|Paid Search|b", state["entities"])
+        self.assertEqual(diag["state_tiers"]["n_cold"], 0)
+
+        fresh = api.UpliftAllocator(root=self.tmp, art_dir=self.tmp / "artifacts_tiers_fresh", cfg_run=cfg_run, cfg_entities={})
+        fresh.unified = ua.unified
+        fresh.model_state = {k: v for k, v in json.loads((art / "model_state.json").read_text(encoding="utf-8")).items() if k != "entities"}
+        other, _ = fresh.update_model()
+        self.assertNotAlmostEqual(state["entities"]["ga|Paid Search|b"]["u_sd"], other["entities"]["ga|Paid Search|b"]["u_sd"])
+
+        # TTL: entries idle longer than ttl_days are evicted.
+        cfg_ttl = dict(cfg_run, state_tiers=dict(cfg_run["state_tiers"], ttl_days=10))
+        record = state_tiers.cold_record(state["entities"]["ga|Paid Search|b"], str(times[-1]))
+        with state_tiers.ColdStateStore(art / "ttl.sqlite") as store:
+            store.put({"old": dict(record, last_active=str(times[0])), "new": dict(record, last_active=str(times[-1]))})
+            self.assertEqual(store.evict(times[-1], cfg_ttl), 1)
+            self.assertEqual(list(store.get(["old", "new"])), ["new"])
+
+    def test_serve_what_if_caches_and_reloads_on_artifact_change(self) -> None:
+        proc = self._run("run")
+        self.assertEqual(proc.returncode, 0, msg=proc.stderr + proc.stdout)
+        serve = self._import_from_tmp_scripts("serve")
+
+        service = serve.WhatIfService(self.tmp / "config", self.tmp / "artifacts", cache_size=4)
+        first = service.allocate({"budget_total": 15000.0})
+        second = service.allocate({"budget_total": 15000.0})
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertAlmostEqual(first["plan"]["totals"]["budget_total"], 15000.0)
+
+        state_path = self.tmp / "artifacts" / "model_state.json"
+        state_path.write_text(state_path.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+        third = service.allocate({"budget_total": 15000.0})
+        self.assertFalse(third["cached"])
+        self.assertEqual(service.reloads, 2)
+
+        server = serve.make_server(service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            port = server.server_address[1]
+            req = urllib.request.Request(
+                f"http://127.0.0.1:{port}/allocate",
+                data=json.dumps({"budget_total": 9000.0}).encode("utf-8"),
+                method="POST",
+            )
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                body = json.loads(resp.read().decode("utf-8"))
+            self.assertAlmostEqual(body["plan"]["totals"]["budget_total"], 9000.0)
+            bad = urllib.request.Request(
+                f"http://127.0.0.1:{port}/allocate",
+                data=json.dumps({"budget_total": [1]}).encode("utf-8"),
+                method="POST",
+            )
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                urllib.request.urlopen(bad, timeout=10)
+            self.assertEqual(ctx.exception.code, 500)
+            self.assertIn("TypeError", json.loads(ctx.exception.read().decode("utf-8"))["error"])
+        finally:
+            server.shutdown()
+            server.server_close()
+
 
 if __name__ == "__main__":
     unittest.main()